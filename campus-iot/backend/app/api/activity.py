@@ -2,17 +2,18 @@
 Activity Log API - Connected to Supabase
 Tracks all user actions in the system
 """
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 
 from db.database import get_db
 from models.user import ActivityLog, User
 from api.auth import get_current_user
+from api.pagination import keyset_paginate, set_next_cursor
 from services.websocket_manager import ws_manager
+from services.user_cache import user_name_cache
 
 router = APIRouter(prefix="/activity", tags=["Activity"])
 
@@ -60,8 +61,8 @@ class ActivityLogResponse(BaseModel):
         from_attributes = True
 
 
-def log_to_response(log: ActivityLog, db: Session) -> ActivityLogResponse:
-    """Convert ActivityLog model to response"""
+def log_to_response(log: ActivityLog, user_names: Dict[int, str]) -> ActivityLogResponse:
+    """Convert ActivityLog model to response (user names resolved by logs_to_response)"""
     action_info = ACTION_TYPES.get(log.action, {
         "label": log.action,
         "icon": "mdi-information",
@@ -71,9 +72,7 @@ def log_to_response(log: ActivityLog, db: Session) -> ActivityLogResponse:
     # Get user name
     user_name = "Système"
     if log.user_id:
-        user = db.query(User).filter(User.id == log.user_id).first()
-        if user:
-            user_name = f"{user.first_name} {user.last_name}"
+        user_name = user_names.get(log.user_id, user_name)
     elif log.user_email:
         user_name = log.user_email.split('@')[0]
     
@@ -92,6 +91,12 @@ def log_to_response(log: ActivityLog, db: Session) -> ActivityLogResponse:
     )
 
 
+def logs_to_response(logs: List[ActivityLog], db: Session) -> List[ActivityLogResponse]:
+    """Convert a page of logs, resolving all user names with a single query"""
+    user_names = user_name_cache.get_names(db, (log.user_id for log in logs))
+    return [log_to_response(log, user_names) for log in logs]
+
+
 async def add_activity_log(
     db: Session,
     action: str,
@@ -148,18 +153,20 @@ async def create_log(
         user_email=current_user.email,
         details=log_data.details
     )
-    return log_to_response(log_entry, db)
+    return logs_to_response([log_entry], db)[0]
 
 
 @router.get("/logs", response_model=List[ActivityLogResponse])
 async def get_logs(
+    response: Response,
     limit: int = Query(default=100, le=500),
+    cursor: Optional[str] = None,
     action: Optional[str] = None,
     user_id: Optional[int] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get activity logs from database"""
+    """Get activity logs from database (next page via X-Next-Cursor)"""
     query = db.query(ActivityLog)
     
     # Filter by action if specified
@@ -170,25 +177,28 @@ async def get_logs(
     if user_id:
         query = query.filter(ActivityLog.user_id == user_id)
     
-    # Order by most recent first
-    logs = query.order_by(desc(ActivityLog.created_at)).limit(limit).all()
+    # Most recent first, keyset pagination on (created_at, id)
+    logs = keyset_paginate(query, ActivityLog.created_at, ActivityLog.id, cursor, limit)
+    set_next_cursor(response, logs, limit)
     
-    return [log_to_response(log, db) for log in logs]
+    return logs_to_response(logs, db)
 
 
 @router.get("/logs/user/{user_id}", response_model=List[ActivityLogResponse])
 async def get_user_logs(
     user_id: int,
+    response: Response,
     limit: int = Query(default=50, le=200),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get activity logs for a specific user"""
-    logs = db.query(ActivityLog).filter(
-        ActivityLog.user_id == user_id
-    ).order_by(desc(ActivityLog.created_at)).limit(limit).all()
+    query = db.query(ActivityLog).filter(ActivityLog.user_id == user_id)
+    logs = keyset_paginate(query, ActivityLog.created_at, ActivityLog.id, cursor, limit)
+    set_next_cursor(response, logs, limit)
     
-    return [log_to_response(log, db) for log in logs]
+    return logs_to_response(logs, db)
 
 
 @router.get("/types")
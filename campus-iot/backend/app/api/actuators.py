@@ -19,13 +19,6 @@ from api.auth import require_permission
 
 router = APIRouter(prefix="/actuators", tags=["actuators"])
 
-# In-memory storage for backward compatibility
-heating_state = {
-    "mode": "manual",
-    "setpoint": 21.0,
-    "room": None
-}
-
 
 @router.get("/", response_model=List[ActuatorResponse])
 def get_actuators(
@@ -111,7 +104,7 @@ def get_actuator_commands(
 @router.get("/heating/state")
 def get_heating_state():
     """Get current heating state (mode, setpoint, room) - Public endpoint"""
-    return heating_state
+    return energy_manager.get_heating_state()
 
 
 @router.post("/heating/mode", response_model=HeatingMode)
@@ -134,12 +127,13 @@ def set_heating_mode(
     
     room = mode.room or "default"
     
-    # Update in-memory state
-    heating_state["mode"] = mode.mode
+    # Update shared (DB-backed) state
+    changes = {"mode": mode.mode}
     if mode.setpoint is not None:
-        heating_state["setpoint"] = mode.setpoint
+        changes["setpoint"] = mode.setpoint
     if mode.room is not None:
-        heating_state["room"] = mode.room
+        changes["room"] = mode.room
+    heating_state = energy_manager.update_heating_state(**changes)
     
     # Update energy manager for room-based management
     energy_manager.set_room_mode(
@@ -161,7 +155,7 @@ def set_heating_mode(
 @router.get("/heating/setpoint")
 def get_heating_setpoint():
     """Get heating temperature setpoint"""
-    return {"setpoint": heating_state["setpoint"]}
+    return {"setpoint": energy_manager.get_heating_state()["setpoint"]}
 
 
 @router.post("/heating/setpoint")
@@ -177,7 +171,7 @@ def set_heating_setpoint(
             detail="Setpoint must be between 10 and 30°C"
         )
     
-    heating_state["setpoint"] = setpoint
+    energy_manager.update_heating_state(setpoint=setpoint)
     
     # Update energy manager
     energy_manager.set_room_mode(room, "manual", setpoint)
@@ -1,10 +1,10 @@
 """
 Alerts API endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 import json
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, select, update
 from typing import List, Optional
 from datetime import datetime
 
@@ -15,8 +15,11 @@ from schemas import (
     AlertRuleCreate, AlertRuleUpdate, AlertRuleResponse
 )
 from api.auth import require_permission, require_any_permission
-from services.audit_service import log_audit
+from services.audit_service import log_audit, log_audit_bulk
 from services.websocket_manager import ws_manager
+from services.escalation_service import alert_escalator
+from services.active_alerts import active_alerts
+from api.pagination import keyset_paginate, set_next_cursor
 from api.activity import add_activity_log
 
 router = APIRouter(prefix="/alerts", tags=["alerts"])
@@ -55,6 +58,7 @@ def alert_snapshot(alert: Alert) -> dict:
         "rule_id": alert.rule_id,
         "escalation_level": alert.escalation_level,
         "escalated_from_alert_id": alert.escalated_from_alert_id,
+        "occurrences": alert.occurrences,
         "created_at": alert.created_at.isoformat() if alert.created_at else None,
         "acknowledged_at": alert.acknowledged_at.isoformat() if alert.acknowledged_at else None
     }
@@ -170,13 +174,21 @@ def get_alerts(
 
 @router.get("/active", response_model=List[AlertResponse])
 def get_active_alerts(
+    response: Response,
+    limit: int = Query(default=100, ge=1, le=500),
+    cursor: Optional[str] = None,
     current_user=Depends(require_any_permission(["alerts", "dashboard"])),
     db: Session = Depends(get_db)
 ):
-    """Get all unacknowledged alerts"""
-    alerts = db.query(Alert).filter(
-        Alert.is_acknowledged == False
-    ).order_by(desc(Alert.created_at)).all()
+    """Get unacknowledged alerts, newest first
+
+    Pages are chained with `cursor` (returned in the X-Next-Cursor header);
+    X-Total-Count holds the number of active alerts.
+    """
+    query = db.query(Alert).filter(Alert.is_acknowledged == False)
+    alerts = keyset_paginate(query, Alert.created_at, Alert.id, cursor, limit)
+    set_next_cursor(response, alerts, limit)
+    response.headers["X-Total-Count"] = str(active_alerts.count(db))
     return alerts
 
 
@@ -197,6 +209,8 @@ async def acknowledge_alert(
     alert.acknowledged_at = datetime.utcnow()
     db.commit()
     db.refresh(alert)
+    alert_escalator.cancel(alert.id)
+    active_alerts.discard([alert.id])
 
     log_audit(
         db=db,
@@ -226,49 +240,88 @@ async def acknowledge_alert(
 
 @router.post("/ack-all")
 async def acknowledge_all_alerts(
+    room_id: Optional[str] = None,
+    severity: Optional[str] = None,
+    sensor_id: Optional[int] = None,
+    rule_id: Optional[int] = None,
     current_user=Depends(require_permission("alerts")),
     db: Session = Depends(get_db),
     request: Request = None
 ):
-    """Acknowledge all active alerts"""
+    """Acknowledge all active alerts, optionally filtered by room, severity, sensor or rule
+
+    One UPDATE ... RETURNING, one bulk audit insert and a single
+    `alerts_acknowledged` broadcast, whatever the number of alerts.
+    """
     now = datetime.utcnow()
-    alerts = db.query(Alert).filter(
-        Alert.is_acknowledged == False
+    stmt = update(Alert).where(Alert.is_acknowledged == False)
+    if room_id:
+        stmt = stmt.where(Alert.sensor_id.in_(select(Sensor.id).where(Sensor.location == room_id)))
+    if severity:
+        stmt = stmt.where(Alert.severity == severity)
+    if sensor_id:
+        stmt = stmt.where(Alert.sensor_id == sensor_id)
+    if rule_id:
+        stmt = stmt.where(Alert.rule_id == rule_id)
+
+    acknowledged = db.execute(
+        stmt.values(is_acknowledged=True, acknowledged_at=now).returning(
+            Alert.id, Alert.sensor_id, Alert.type, Alert.message, Alert.severity, Alert.rule_id,
+            Alert.escalation_level, Alert.escalated_from_alert_id, Alert.created_at
+        ).execution_options(synchronize_session=False)
     ).all()
-
-    result = db.query(Alert).filter(
-        Alert.is_acknowledged == False
-    ).update({
-        "is_acknowledged": True,
-        "acknowledged_at": now
-    })
     db.commit()
 
-    for alert in alerts:
-        log_audit(
-            db=db,
-            user_id=current_user.id,
-            user_email=current_user.email,
-            action="acknowledge",
-            entity_type="alert",
-            entity_id=alert.id,
-            before=alert_snapshot(alert),
-            after={"is_acknowledged": True, "acknowledged_at": now.isoformat()},
-            ip_address=request.client.host if request and request.client else None
-        )
-        await add_activity_log(
-            db=db,
-            action="alert_resolved",
-            user_id=current_user.id,
-            user_email=current_user.email,
-            details=json.dumps({
-                "alert_id": alert.id,
-                "sensor_id": alert.sensor_id,
-                "message": alert.message
-            }),
-            ip_address=request.client.host if request and request.client else None
-        )
-    return {"acknowledged": result}
+    ids = [row.id for row in acknowledged]
+    for alert_id in ids:
+        alert_escalator.cancel(alert_id)
+    active_alerts.discard(ids)
+    if not ids:
+        return {"acknowledged": 0, "ids": []}
+
+    ip_address = request.client.host if request and request.client else None
+    after = {"is_acknowledged": True, "acknowledged_at": now.isoformat()}
+    log_audit_bulk(
+        db=db,
+        user_id=current_user.id,
+        user_email=current_user.email,
+        action="acknowledge",
+        entity_type="alert",
+        entries=[
+            (row.id, {
+                "id": row.id,
+                "sensor_id": row.sensor_id,
+                "type": row.type,
+                "message": row.message,
+                "severity": row.severity,
+                "is_acknowledged": False,
+                "rule_id": row.rule_id,
+                "escalation_level": row.escalation_level,
+                "escalated_from_alert_id": row.escalated_from_alert_id,
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+                "acknowledged_at": None
+            }, after)
+            for row in acknowledged
+        ],
+        ip_address=ip_address
+    )
+    await add_activity_log(
+        db=db,
+        action="alert_resolved",
+        user_id=current_user.id,
+        user_email=current_user.email,
+        details=json.dumps({
+            "count": len(ids),
+            "alert_ids": ids,
+            "filters": {"room_id": room_id, "severity": severity, "sensor_id": sensor_id, "rule_id": rule_id}
+        }),
+        ip_address=ip_address
+    )
+    await ws_manager.broadcast({
+        "type": "alerts_acknowledged",
+        "data": {"ids": ids, "acknowledged_at": now.isoformat()}
+    })
+    return {"acknowledged": len(ids), "ids": ids}
 
 
 # Alert Rules
@@ -362,6 +415,10 @@ async def update_alert_rule(
     db.commit()
     db.refresh(db_rule)
 
+    # Re-arm open alerts with the new escalation delay
+    if {"escalation_minutes", "escalation_severity", "is_active"} & update_data.keys():
+        alert_escalator.load_open_alerts(rule_id=db_rule.id)
+
     # Broadcast to all clients
     await ws_manager.broadcast({
         "type": "alert_rules_changed",
@@ -1,7 +1,7 @@
 """
 Audit Log API - Tracks who changed what and when
 """
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 from pydantic import BaseModel
@@ -12,6 +12,7 @@ from db.database import get_db
 from models.audit import AuditLog
 from models.user import User
 from api.auth import require_permission
+from api.pagination import keyset_paginate, set_next_cursor
 
 router = APIRouter(prefix="/audit", tags=["Audit"])
 
@@ -49,8 +50,10 @@ def audit_to_response(log: AuditLog) -> AuditLogResponse:
 
 @router.get("/logs", response_model=List[AuditLogResponse])
 async def get_audit_logs(
+    response: Response,
     limit: int = Query(default=100, le=500),
     offset: int = Query(default=0, ge=0),
+    cursor: Optional[str] = None,
     action: Optional[str] = None,
     entity_type: Optional[str] = None,
     entity_id: Optional[str] = None,
@@ -58,7 +61,11 @@ async def get_audit_logs(
     current_user: User = Depends(require_permission("audit")),
     db: Session = Depends(get_db)
 ):
-    """Get audit logs with filters (admin/audit permission)"""
+    """Get audit logs with filters (admin/audit permission)
+
+    Pages are chained with `cursor` (returned in the X-Next-Cursor header);
+    `offset` is kept for older clients only.
+    """
     query = db.query(AuditLog)
 
     if action:
@@ -70,5 +77,9 @@ async def get_audit_logs(
     if user_id:
         query = query.filter(AuditLog.user_id == user_id)
 
-    logs = query.order_by(desc(AuditLog.created_at)).offset(offset).limit(limit).all()
+    if offset and not cursor:
+        logs = query.order_by(desc(AuditLog.created_at), desc(AuditLog.id)).offset(offset).limit(limit).all()
+    else:
+        logs = keyset_paginate(query, AuditLog.created_at, AuditLog.id, cursor, limit)
+    set_next_cursor(response, logs, limit)
     return [audit_to_response(l) for l in logs]
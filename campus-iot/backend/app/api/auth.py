@@ -15,6 +15,7 @@ import random
 from db.database import get_db
 from models.user import User, ActivityLog
 from services.audit_service import log_audit
+from services.user_cache import user_name_cache
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
@@ -206,6 +207,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     user = db.query(User).filter(User.email == email).first()
     if user is None:
         raise credentials_exception
+    user_name_cache.remember(user)
     return user
 
 
@@ -366,6 +368,7 @@ async def update_profile(
     
     db.commit()
     db.refresh(current_user)
+    user_name_cache.remember(current_user)
     
     log_activity(db, current_user.id, current_user.email, "profile_update", "Profile updated")
     log_audit(
@@ -444,6 +447,7 @@ async def update_user(
     
     db.commit()
     db.refresh(target_user)
+    user_name_cache.remember(target_user)
     
     log_activity(db, current_user.id, current_user.email, "user_updated", f"Updated user {target_user.email}")
     log_audit(
@@ -528,6 +532,7 @@ async def delete_user(
     db.query(AuditLog).filter(AuditLog.user_id == target_user.id).delete()
     db.delete(target_user)
     db.commit()
+    user_name_cache.invalidate(user_id)
     log_activity(db, current_user.id, current_user.email, "user_deleted", f"Deleted user {email}")
     log_audit(
         db=db,
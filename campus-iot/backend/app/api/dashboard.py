@@ -8,9 +8,10 @@ from typing import List, Optional
 from datetime import datetime, timedelta
 
 from db import get_db
-from models import Sensor, SensorData, Alert, Actuator
+from models import Sensor, SensorData, Actuator
 from schemas import DashboardSummary, SensorSummary, StatsResponse, PresenceStats
 from api.auth import require_permission
+from services.active_alerts import active_alerts
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
@@ -53,10 +54,8 @@ def get_dashboard_summary(
             status=status
         ))
     
-    # Get active alerts count
-    active_alerts = db.query(Alert).filter(
-        Alert.is_acknowledged == False
-    ).count()
+    # Get active alerts count (in-memory index, resynced periodically)
+    active_alert_count = active_alerts.count(db)
     
     # Get heating status
     heating = db.query(Actuator).filter(Actuator.type == "servo").first()
@@ -68,7 +67,7 @@ def get_dashboard_summary(
     
     return DashboardSummary(
         sensors=sensor_summaries,
-        active_alerts=active_alerts,
+        active_alerts=active_alert_count,
         total_sensors=len(sensors),
         online_sensors=online_count,
         heating_status=heating_status
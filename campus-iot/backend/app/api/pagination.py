@@ -0,0 +1,51 @@
+"""
+Keyset (cursor) pagination helpers
+
+Les listes triées par date (audit, activité, ...) sont paginées sur le couple
+(created_at, id) : la page suivante reprend strictement après la dernière
+ligne renvoyée, ce qui permet à PostgreSQL de parcourir directement l'index
+au lieu de lire puis ignorer toutes les lignes d'un OFFSET.
+"""
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import desc, tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Encode the sort key of the last row of a page as an opaque cursor"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_paginate(query, created_col, id_col, cursor: Optional[str], limit: int):
+    """Order a query newest-first and return the page following `cursor`"""
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(created_col, id_col) < tuple_(created_at, row_id))
+    return query.order_by(desc(created_col), desc(id_col)).limit(limit).all()
+
+
+def set_next_cursor(response: Response, rows: list, limit: int):
+    """Expose the cursor of the next page, if any, in the response headers"""
+    if len(rows) < limit or not rows:
+        return
+    last = rows[-1]
+    if last.created_at is None:
+        return
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.created_at, last.id)
@@ -2,15 +2,19 @@
 Report Issue API - Allows users to report problems in rooms via QR code scanning
 """
 from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.orm import Session
+from sqlalchemy import desc, func
+from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
 import uuid
 
-router = APIRouter(prefix="/reports", tags=["Reports"])
+from db import get_db
+from models import IssueReport
+from services.websocket_manager import ws_manager
 
-# In-memory storage (replace with database in production)
-reports_db = []
+router = APIRouter(prefix="/reports", tags=["Reports"])
 
 class ReportCreate(BaseModel):
     room_id: str
@@ -37,105 +41,140 @@ class ReportUpdate(BaseModel):
     status: Optional[str] = None
     assigned_to: Optional[str] = None
 
-@router.post("", response_model=Report)
-async def create_report(report: ReportCreate):
-    """
-    Create a new issue report for a room.
-    Called when users scan QR code and submit a problem.
-    """
-    # Generate ticket ID
-    now = datetime.now()
-    prefix = report.room_id[:2] if report.room_id else "XX"
-    ticket_id = f"{prefix}-{now.strftime('%Y%m%d')}-{uuid.uuid4().hex[:4].upper()}"
-    
-    new_report = Report(
-        ticket_id=ticket_id,
+def report_to_response(report: IssueReport) -> Report:
+    return Report(
+        ticket_id=report.ticket_id,
         room_id=report.room_id,
         room_name=report.room_name,
         issue_type=report.issue_type,
-        urgency=report.urgency,
+        urgency=report.urgency or "medium",
         description=report.description,
-        has_photo=report.has_photo,
-        status="open",
-        created_at=now.isoformat()
+        has_photo=bool(report.has_photo),
+        status=report.status or "open",
+        created_at=report.created_at.isoformat() if report.created_at else datetime.utcnow().isoformat(),
+        updated_at=report.updated_at.isoformat() if report.updated_at else None,
+        assigned_to=report.assigned_to
     )
+
+
+def _generate_ticket_id(room_id: str) -> str:
+    prefix = room_id[:2] if room_id else "XX"
+    return f"{prefix}-{datetime.utcnow().strftime('%Y%m%d')}-{uuid.uuid4().hex[:4].upper()}"
+
+
+@router.post("", response_model=Report)
+async def create_report(report: ReportCreate, db: Session = Depends(get_db)):
+    """
+    Create a new issue report for a room.
+    Called when users scan QR code and submit a problem.
+    """
+    # The ticket suffix is short: retry on the (rare) unique collision
+    for attempt in range(3):
+        new_report = IssueReport(
+            ticket_id=_generate_ticket_id(report.room_id),
+            room_id=report.room_id,
+            room_name=report.room_name,
+            issue_type=report.issue_type,
+            urgency=report.urgency,
+            description=report.description,
+            has_photo=report.has_photo,
+            status="open"
+        )
+        db.add(new_report)
+        try:
+            db.commit()
+            break
+        except IntegrityError:
+            db.rollback()
+            if attempt == 2:
+                raise HTTPException(status_code=500, detail="Could not allocate a ticket id")
+    db.refresh(new_report)
+    response = report_to_response(new_report)
     
-    reports_db.append(new_report.dict())
-    
-    # TODO: Send WebSocket notification to admins
+    # Notify connected admins
+    await ws_manager.broadcast({
+        "type": "report_created",
+        "report": response.model_dump()
+    })
     # TODO: Send email notification if urgent
     
-    return new_report
+    return response
 
 @router.get("", response_model=List[Report])
 async def get_reports(
     status: Optional[str] = None,
     room_id: Optional[str] = None,
     urgency: Optional[str] = None,
-    limit: int = 50
+    limit: int = 50,
+    db: Session = Depends(get_db)
 ):
     """
     Get all reports with optional filtering.
     """
-    filtered = reports_db.copy()
+    query = db.query(IssueReport)
     
     if status:
-        filtered = [r for r in filtered if r.get("status") == status]
+        query = query.filter(IssueReport.status == status)
     if room_id:
-        filtered = [r for r in filtered if r.get("room_id") == room_id]
+        query = query.filter(IssueReport.room_id == room_id)
     if urgency:
-        filtered = [r for r in filtered if r.get("urgency") == urgency]
+        query = query.filter(IssueReport.urgency == urgency)
     
     # Sort by creation date descending
-    filtered.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-    
-    return filtered[:limit]
+    reports = query.order_by(desc(IssueReport.created_at)).limit(limit).all()
+    return [report_to_response(r) for r in reports]
 
 @router.get("/{ticket_id}", response_model=Report)
-async def get_report(ticket_id: str):
+async def get_report(ticket_id: str, db: Session = Depends(get_db)):
     """
     Get a specific report by ticket ID.
     """
-    for report in reports_db:
-        if report.get("ticket_id") == ticket_id:
-            return report
-    raise HTTPException(status_code=404, detail="Report not found")
+    report = db.query(IssueReport).filter(IssueReport.ticket_id == ticket_id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return report_to_response(report)
 
 @router.patch("/{ticket_id}", response_model=Report)
-async def update_report(ticket_id: str, update: ReportUpdate):
+async def update_report(ticket_id: str, update: ReportUpdate, db: Session = Depends(get_db)):
     """
     Update a report status or assignment.
     """
-    for i, report in enumerate(reports_db):
-        if report.get("ticket_id") == ticket_id:
-            if update.status:
-                reports_db[i]["status"] = update.status
-            if update.assigned_to:
-                reports_db[i]["assigned_to"] = update.assigned_to
-            reports_db[i]["updated_at"] = datetime.now().isoformat()
-            return reports_db[i]
-    raise HTTPException(status_code=404, detail="Report not found")
+    report = db.query(IssueReport).filter(IssueReport.ticket_id == ticket_id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    if update.status:
+        report.status = update.status
+    if update.assigned_to:
+        report.assigned_to = update.assigned_to
+    report.updated_at = datetime.utcnow()
+    db.commit()
+    db.refresh(report)
+    return report_to_response(report)
 
 @router.get("/stats/summary")
-async def get_reports_summary():
+async def get_reports_summary(db: Session = Depends(get_db)):
     """
-    Get summary statistics of reports.
+    Get summary statistics of reports (single grouped query).
     """
-    total = len(reports_db)
-    by_status = {
-        "open": len([r for r in reports_db if r.get("status") == "open"]),
-        "in_progress": len([r for r in reports_db if r.get("status") == "in_progress"]),
-        "resolved": len([r for r in reports_db if r.get("status") == "resolved"])
-    }
-    by_urgency = {
-        "high": len([r for r in reports_db if r.get("urgency") == "high"]),
-        "medium": len([r for r in reports_db if r.get("urgency") == "medium"]),
-        "low": len([r for r in reports_db if r.get("urgency") == "low"])
-    }
+    rows = db.query(
+        IssueReport.status,
+        IssueReport.urgency,
+        IssueReport.issue_type,
+        func.count(IssueReport.id).label("count")
+    ).group_by(IssueReport.status, IssueReport.urgency, IssueReport.issue_type).all()
+
+    total = 0
+    by_status = {"open": 0, "in_progress": 0, "resolved": 0}
+    by_urgency = {"high": 0, "medium": 0, "low": 0}
     by_type = {}
-    for report in reports_db:
-        issue_type = report.get("issue_type", "other")
-        by_type[issue_type] = by_type.get(issue_type, 0) + 1
+    for row in rows:
+        total += row.count
+        if row.status in by_status:
+            by_status[row.status] += row.count
+        if row.urgency in by_urgency:
+            by_urgency[row.urgency] += row.count
+        issue_type = row.issue_type or "other"
+        by_type[issue_type] = by_type.get(issue_type, 0) + row.count
     
     return {
         "total": total,
@@ -3,21 +3,29 @@ Security API - Blockchain & HMAC endpoints
 Provides endpoints for viewing blockchain, security alerts, and testing signatures
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, func, select, true
 from typing import List, Optional
 from datetime import datetime
 import hashlib
 import json
 
+from api.auth import get_current_admin
+from config import settings
 from db.database import get_db
 from models.blockchain import Block, SecurityAlert
+from services.merkle_service import get_reading_proof
 from services.security_service import (
     hmac_verifier, 
     SimpleBlockchain, 
     verify_sensor_data,
     sign_data,
+    verify_chain_incremental,
+    chain_auditor,
+    ingest_verifier,
+    security_alerts,
+    ensure_genesis_block,
     HMAC_SECRET_KEY
 )
 
@@ -54,27 +62,36 @@ async def get_blockchain(
 @router.get("/blockchain/verify")
 async def verify_blockchain(db: Session = Depends(get_db)):
     """
-    Verify the integrity of the entire blockchain
+    Verify the blocks appended since the last checkpoint
     """
-    blocks = db.query(Block).order_by(Block.index).all()
-    
-    if not blocks:
-        return {
-            "valid": True,
-            "message": "Blockchain is empty",
-            "blocks_verified": 0
-        }
-    
-    chain = [b.to_dict() for b in blocks]
-    blockchain = SimpleBlockchain(db)
-    is_valid, message = blockchain.verify_chain(chain)
-    
-    return {
-        "valid": is_valid,
-        "message": message,
-        "blocks_verified": len(chain),
-        "last_block_index": chain[-1]["index"] if chain else None
-    }
+    return verify_chain_incremental(db)
+
+
+@router.post("/blockchain/audit")
+async def start_blockchain_audit(
+    chunk_size: int = Query(None, ge=100, le=100000),
+    workers: int = Query(None, ge=1, le=64),
+    current_user=Depends(get_current_admin)
+):
+    """
+    Start a full audit of the blockchain from genesis (background, parallel;
+    admin only, one audit at a time across workers, at most one process per core)
+    """
+    started = chain_auditor.start(
+        chunk_size=chunk_size or settings.blockchain_audit_chunk_size,
+        workers=workers or settings.blockchain_audit_workers
+    )
+    if not started:
+        raise HTTPException(status_code=409, detail="An audit is already running")
+    return chain_auditor.status()
+
+
+@router.get("/blockchain/audit")
+async def get_blockchain_audit():
+    """
+    Progress / result of the last full audit
+    """
+    return chain_auditor.status()
 
 
 @router.get("/blockchain/block/{index}")
@@ -89,6 +106,21 @@ async def get_block(index: int, db: Session = Depends(get_db)):
     return block.to_dict()
 
 
+@router.get("/blockchain/proof")
+async def get_inclusion_proof(
+    sensor_id: int,
+    time: datetime,
+    db: Session = Depends(get_db)
+):
+    """
+    Merkle inclusion proof of a sensor reading in its anchoring block
+    """
+    proof = get_reading_proof(db, sensor_id, time)
+    if not proof:
+        raise HTTPException(status_code=404, detail="Reading not anchored yet")
+    return proof
+
+
 @router.post("/blockchain/add")
 async def add_block(
     sensor_type: str,
@@ -106,7 +138,7 @@ async def add_block(
         new_index = last_block.index + 1
     else:
         # Create genesis block first
-        genesis = _create_genesis_block(db)
+        genesis = ensure_genesis_block(db)
         previous_hash = genesis.hash
         new_index = 1
     
@@ -125,6 +157,7 @@ async def add_block(
         previous_hash=block_data["previous_hash"],
         hash=block_data["hash"],
         nonce=block_data["nonce"],
+        hash_version=block_data["hash_version"],
         signature_valid=True
     )
     db.add(new_block)
@@ -137,53 +170,28 @@ async def add_block(
     }
 
 
-def _create_genesis_block(db: Session) -> Block:
-    """Create genesis block if not exists"""
-    genesis = db.query(Block).filter(Block.index == 0).first()
-    if genesis:
-        return genesis
-    
-    blockchain = SimpleBlockchain(db)
-    genesis_data = blockchain.create_genesis_block()
-    
-    genesis = Block(
-        index=0,
-        timestamp=datetime.fromisoformat(genesis_data["timestamp"]),
-        sensor_type="genesis",
-        sensor_value="0",
-        data_hash=genesis_data["data_hash"],
-        previous_hash=genesis_data["previous_hash"],
-        hash=genesis_data["hash"],
-        nonce=0,
-        signature_valid=True
-    )
-    db.add(genesis)
-    db.commit()
-    db.refresh(genesis)
-    return genesis
-
-
 # =============================================================================
 # HMAC VERIFICATION ENDPOINTS
 # =============================================================================
 
 @router.post("/verify")
-async def verify_data(raw_data: str, db: Session = Depends(get_db)):
+async def verify_data(raw_data: str, request: Request):
     """
     Verify HMAC signature on sensor data
     """
     parsed, is_valid, message = verify_sensor_data(raw_data)
     
-    # Log security alert if invalid
+    # Log security alert if invalid (aggregated per client, written periodically)
     if not is_valid and message != "unsigned":
-        alert = SecurityAlert(
-            alert_type="invalid_signature",
-            severity="warning",
-            description=message,
-            raw_data=raw_data[:500]
+        client_ip = request.client.host if request.client else None
+        security_alerts.record(
+            client_ip or "unknown",
+            "invalid_signature",
+            "warning",
+            message,
+            raw_data,
+            source_ip=client_ip
         )
-        db.add(alert)
-        db.commit()
     
     return {
         "valid": is_valid,
@@ -253,7 +261,7 @@ async def get_security_alerts(
         query = query.filter(SecurityAlert.resolved == False)
     
     total = query.count()
-    alerts = query.order_by(desc(SecurityAlert.timestamp)).limit(limit).all()
+    alerts = query.order_by(desc(func.coalesce(SecurityAlert.last_seen, SecurityAlert.timestamp))).limit(limit).all()
     
     return {
         "total": total,
@@ -291,19 +299,24 @@ async def get_security_stats(db: Session = Depends(get_db)):
     """
     Get security statistics
     """
-    total_blocks = db.query(Block).count()
-    valid_signatures = db.query(Block).filter(Block.signature_valid == True).count()
-    invalid_signatures = db.query(Block).filter(Block.signature_valid == False).count()
+    block_counts = select(
+        func.count().label("total_blocks"),
+        func.count().filter(Block.signature_valid == True).label("valid_signatures"),
+        func.count().filter(Block.signature_valid == False).label("invalid_signatures")
+    ).select_from(Block).subquery()
+    alert_counts = select(
+        func.count().label("total_alerts"),
+        func.count().filter(SecurityAlert.resolved == False).label("unresolved_alerts"),
+        func.count().filter(SecurityAlert.severity == "critical").label("critical_alerts")
+    ).select_from(SecurityAlert).subquery()
     
-    total_alerts = db.query(SecurityAlert).count()
-    unresolved_alerts = db.query(SecurityAlert).filter(SecurityAlert.resolved == False).count()
-    critical_alerts = db.query(SecurityAlert).filter(SecurityAlert.severity == "critical").count()
+    (total_blocks, valid_signatures, invalid_signatures,
+     total_alerts, unresolved_alerts, critical_alerts) = db.execute(
+        select(block_counts, alert_counts).select_from(block_counts.join(alert_counts, true()))
+    ).one()
     
-    # Verify chain integrity
-    blocks = db.query(Block).order_by(Block.index).all()
-    chain = [b.to_dict() for b in blocks]
-    blockchain = SimpleBlockchain(db)
-    chain_valid, _ = blockchain.verify_chain(chain)
+    # Verify chain integrity (new blocks only)
+    chain_valid = verify_chain_incremental(db)["valid"]
     
     return {
         "blockchain": {
@@ -317,6 +330,7 @@ async def get_security_stats(db: Session = Depends(get_db)):
             "unresolved": unresolved_alerts,
             "critical": critical_alerts
         },
+        "ingest": ingest_verifier.stats(),
         "security_score": _calculate_security_score(
             total_blocks, valid_signatures, unresolved_alerts, chain_valid
         )
@@ -3,6 +3,7 @@ Application configuration
 """
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Dict, List
 
 
 class Settings(BaseSettings):
@@ -19,6 +20,77 @@ class Settings(BaseSettings):
     mqtt_username: str = "groupe3"
     mqtt_password: str = "campus-iot"
     mqtt_topic_prefix: str = "campus/orion"  
+    # Horizontal ingest: replicas sharing MQTT_SHARED_GROUP split the sensor
+    # messages between them (MQTT v5 $share/<group>/...); empty = each instance
+    # receives everything. Client id: empty = campus-backend-<host>-<pid>
+    mqtt_shared_group: str = ""
+    mqtt_client_id: str = ""
+    # Extra sensor topic layouts, e.g. ["{prefix}/{building}/{room}/sensors/{type}"]
+    mqtt_topic_layouts: List[str] = []
+
+    # Shared state caches (energy management), refreshed from DB after this delay
+    # even if a cross-worker invalidation message was missed
+    state_cache_ttl_seconds: int = 30
+
+    # Ultrasonic readings closer than this count as presence (same as firmware)
+    presence_distance_threshold_cm: float = 100
+    
+    # Sensor readings anchored as one Merkle-root block per window
+    blockchain_anchoring_enabled: bool = True
+    blockchain_batch_seconds: int = 60
+    blockchain_batch_max_readings: int = 5000
+    
+    # Full blockchain audit: blocks per range and pool size (0 = one per CPU)
+    blockchain_audit_chunk_size: int = 5000
+    blockchain_audit_workers: int = 0
+    
+    # Signed MQTT payloads: per-device HMAC keys (JSON, shared key otherwise)
+    # and whether unsigned payloads are rejected
+    hmac_device_keys: Dict[str, str] = {}
+    hmac_required: bool = False
+    
+    # Security alerts: occurrences are aggregated per (source, type) and written
+    # every flush interval; a new row per source at most `rate` per minute
+    security_alert_flush_seconds: int = 30
+    security_alert_window_seconds: int = 3600
+    security_alert_rate_per_minute: float = 2
+    security_alert_burst: int = 5
+    
+    # Ingest tracing: share of MQTT messages traced, and latency above which
+    # the span tree of a traced message is logged
+    tracing_enabled: bool = True
+    tracing_sample_rate: float = 0.1
+    tracing_slow_ms: float = 500
+    
+    # SQL instrumentation (opt-in): query count/time per request and MQTT
+    # message, slow statement log, warning above a per-operation query count
+    db_query_stats_enabled: bool = False
+    db_slow_query_ms: float = 200
+    db_query_warn_count: int = 25
+    
+    # Alert storms: rule alerts of the same rule/room/type are grouped within
+    # the window; new alerts are rate limited globally
+    alert_group_window_seconds: int = 300
+    alert_storm_rate_per_minute: float = 30
+    alert_storm_burst: int = 20
+    
+    # Ingest dedup: retained replays are skipped when already stored (same
+    # device timestamp, or same value as the sensor's latest reading);
+    # optional per-type deadband (e.g. {"temperature": 0.1}) with a heartbeat
+    # write to keep sensors online
+    ingest_skip_retained: bool = True
+    ingest_deadband: Dict[str, float] = {}
+    ingest_deadband_heartbeat_seconds: int = 240
+    # Device timestamps (epoch ms) are used as reading time; ahead of server
+    # time by more than this, the server time is used instead
+    ingest_max_clock_skew_seconds: int = 300
+    # Multiprocess ingest: sensor messages are handled by this many worker
+    # processes, sharded by (room, sensor type); 0 = in the MQTT thread
+    ingest_workers: int = 0
+    ingest_worker_queue_size: int = 10000
+    # A full worker queue blocks the MQTT thread at most this long, then the
+    # readings are dropped (campus_mqtt_messages_total{status="dropped"})
+    ingest_worker_put_timeout_seconds: float = 5
     
     # Auth
     secret_key: str = "super_secret_key_change_me"
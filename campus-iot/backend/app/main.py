@@ -4,23 +4,38 @@ Campus IoT API - Main Application
 import asyncio
 import logging
 import json
+import time
 from contextlib import asynccontextmanager
-from datetime import datetime, timedelta
-from sqlalchemy import or_, desc
+from datetime import datetime, timezone
+from typing import Any, List, Optional, Tuple
+from sqlalchemy import or_, desc, func
+from sqlalchemy.dialects.postgresql import insert
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import Depends, FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from config import settings
-from db import get_db, SessionLocal
+from db import get_db, SessionLocal, engine
 from models import Sensor, SensorData, Alert, AlertRule
 from models.settings import PlacedSensor, SystemSetting
 from models.anomaly import Anomaly
-from services import mqtt_service, ws_manager
+from services import mqtt_service, ws_manager, energy_manager
+from services.merkle_service import reading_anchor
+from services.escalation_service import alert_escalator
+from services.active_alerts import active_alerts
+from services.alert_grouping import alert_grouper
+from services.latest_readings import latest_readings
+from services.ingest_workers import ingest_workers
+from services.security_service import security_alerts
+from services.metrics import registry, ingest_stage, timed_job, HTTP_REQUEST_SECONDS, INGEST_LATE_READINGS, MQTT_MESSAGES
+from services.tracing import instrument_engine, slow_traces
+from services.query_stats import instrument_queries, query_scope
 from services.backup_service import run_backup, cleanup_old_backups
 from services.export_service import run_due_exports
 from services.webhook_service import dispatch_webhooks
 from api.activity import add_activity_log
+from api.auth import get_current_admin
 from api import (
     sensors_router,
     alerts_router,
@@ -37,6 +52,19 @@ from api.security import router as security_router
 from api.placed_sensors import router as placed_sensors_router
 from api.settings import router as settings_router
 
+# SQL statements show up as spans in sampled ingest traces
+instrument_engine(engine)
+if settings.db_query_stats_enabled:
+    instrument_queries(engine)
+
+# Scrape-time gauges
+registry.gauge("campus_db_pool_size", "SQLAlchemy pool size", callback=lambda: engine.pool.size())
+registry.gauge("campus_db_pool_checked_out", "Connections currently checked out", callback=lambda: engine.pool.checkedout())
+registry.gauge("campus_db_pool_overflow", "Connections opened beyond the pool size", callback=lambda: max(engine.pool.overflow(), 0))
+registry.gauge("campus_websocket_connections", "Open WebSocket connections", callback=lambda: len(ws_manager.active_connections))
+registry.gauge("campus_mqtt_connected", "1 if connected to the MQTT broker", callback=lambda: int(mqtt_service.connected))
+registry.gauge("campus_ingest_workers_alive", "Ingest worker processes running (INGEST_WORKERS)", callback=ingest_workers.alive)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -90,16 +118,29 @@ def _get_setting(db, key: str, default):
         return default
 
 
-def _detect_anomalies(db, sensor: Sensor, value: float, room_id: str):
-    """Detect anomalies on latest sensor value"""
+def _anomaly_settings(db) -> dict:
+    return {
+        "min_samples": int(_get_setting(db, "anomaly_min_samples", 8)),
+        "spike_z": float(_get_setting(db, "anomaly_spike_z", 3.0)),
+        "stuck_window": int(_get_setting(db, "anomaly_stuck_window", 10)),
+        "stuck_epsilon": float(_get_setting(db, "anomaly_stuck_epsilon", 0.001)),
+        "drift_window": int(_get_setting(db, "anomaly_drift_window", 10)),
+        "drift_slope": float(_get_setting(db, "anomaly_drift_slope", 0.05)),
+        "cooldown_minutes": int(_get_setting(db, "anomaly_cooldown_minutes", 30)),
+    }
+
+
+def _detect_anomalies(db, sensor: Sensor, value: float, room_id: str, params: Optional[dict] = None):
+    """Detect anomalies on latest sensor value (params: _anomaly_settings, loaded once per message)"""
     # Settings
-    min_samples = int(_get_setting(db, "anomaly_min_samples", 8))
-    spike_z = float(_get_setting(db, "anomaly_spike_z", 3.0))
-    stuck_window = int(_get_setting(db, "anomaly_stuck_window", 10))
-    stuck_epsilon = float(_get_setting(db, "anomaly_stuck_epsilon", 0.001))
-    drift_window = int(_get_setting(db, "anomaly_drift_window", 10))
-    drift_slope = float(_get_setting(db, "anomaly_drift_slope", 0.05))
-    cooldown_minutes = int(_get_setting(db, "anomaly_cooldown_minutes", 30))
+    params = params or _anomaly_settings(db)
+    min_samples = params["min_samples"]
+    spike_z = params["spike_z"]
+    stuck_window = params["stuck_window"]
+    stuck_epsilon = params["stuck_epsilon"]
+    drift_window = params["drift_window"]
+    drift_slope = params["drift_slope"]
+    cooldown_minutes = params["cooldown_minutes"]
 
     recent = db.query(SensorData).filter(
         SensorData.sensor_id == sensor.id
@@ -154,6 +195,7 @@ def _detect_anomalies(db, sensor: Sensor, value: float, room_id: str):
             )
             db.add(alert)
             db.commit()
+            active_alerts.add(alert.id)
             logger.info(f"Anomaly detected (spike): {message}")
 
     # Stuck detection
@@ -188,6 +230,7 @@ def _detect_anomalies(db, sensor: Sensor, value: float, room_id: str):
             )
             db.add(alert)
             db.commit()
+            active_alerts.add(alert.id)
             logger.info(f"Anomaly detected (stuck): {message}")
 
     # Drift detection (linear trend over window)
@@ -229,286 +272,360 @@ def _detect_anomalies(db, sensor: Sensor, value: float, room_id: str):
             )
             db.add(alert)
             db.commit()
+            active_alerts.add(alert.id)
             logger.info(f"Anomaly detected (drift): {message}")
 
 
-def handle_mqtt_message(sensor_type: str, value, topic: str, room_id: str = "unknown"):
-    """Handle incoming MQTT messages and store in database
-    
-    The room_id comes directly from the MQTT payload {"room": "X101", "value": 23.5}
-    This auto-assigns the sensor to the room specified by the Arduino/transmitter.
-    """
-    try:
-        db = SessionLocal()
-        
-        logger.info(f"[HANDLER] Processing: room={room_id}, type={sensor_type}, value={value}")
-        
-        # Find sensor by type and room (exact match)
-        sensor = db.query(Sensor).filter(
-            Sensor.type == sensor_type,
-            Sensor.location == room_id
-        ).first()
-        
-        # If room is provided but no sensor exists for this room, create one
-        # If room is "unknown", try to find any sensor of this type
-        if not sensor and room_id == "unknown":
-            sensor = db.query(Sensor).filter(Sensor.type == sensor_type).first()
-        
-        if not sensor:
-            # Auto-create sensor with the room from payload
-            logger.info(f"Creating new sensor: {sensor_type} in {room_id}")
-            sensor = Sensor(
-                name=f"{sensor_type.capitalize()} {room_id}" if room_id != "unknown" else f"{sensor_type.capitalize()} Auto",
-                type=sensor_type,
-                location=room_id if room_id != "unknown" else None,
-                is_active=True
-            )
-            db.add(sensor)
-            db.commit()
-            db.refresh(sensor)
-            
-            # Also create a PlacedSensor for 3D visualization if room is known
-            if room_id != "unknown":
-                existing_placed = db.query(PlacedSensor).filter(
-                    PlacedSensor.room_id == room_id,
-                    PlacedSensor.sensor_type == sensor_type
-                ).first()
-                
-                if not existing_placed:
-                    placed_sensor = PlacedSensor(
-                        room_id=room_id,
-                        sensor_type=sensor_type,
-                        position_x=0.5,  # Center of room
-                        position_y=0.5,
-                        name=f"{sensor_type.capitalize()} {room_id}",
-                        current_value=float(value) if isinstance(value, (int, float, str)) else None,
-                        status="ok"
-                    )
-                    db.add(placed_sensor)
-                    db.commit()
-                    logger.info(f"Created PlacedSensor for 3D: {sensor_type} in {room_id}")
-        else:
-            # Update sensor - ALWAYS update location if room is provided in payload
-            sensor.is_active = True
-            if room_id != "unknown":
-                sensor.location = room_id
-                sensor.name = f"{sensor_type.capitalize()} {room_id}"
-                
-                # Also update or create PlacedSensor
-                placed_sensor = db.query(PlacedSensor).filter(
-                    PlacedSensor.room_id == room_id,
-                    PlacedSensor.sensor_type == sensor_type
-                ).first()
-                
-                if placed_sensor:
-                    placed_sensor.current_value = float(value) if isinstance(value, (int, float, str)) else None
-                    placed_sensor.status = "ok"
-                    placed_sensor.last_update = datetime.utcnow()
-                else:
-                    placed_sensor = PlacedSensor(
-                        room_id=room_id,
-                        sensor_type=sensor_type,
-                        position_x=0.5,
-                        position_y=0.5,
-                        name=f"{sensor_type.capitalize()} {room_id}",
-                        current_value=float(value) if isinstance(value, (int, float, str)) else None,
-                        status="ok"
-                    )
-                    db.add(placed_sensor)
-                    logger.info(f"Created PlacedSensor for 3D: {sensor_type} in {room_id}")
-            db.commit()
-        
-        # Store data point
-        data_point = SensorData(
-            sensor_id=sensor.id,
-            value=float(value) if isinstance(value, (int, float, str)) else 0
+def _resolve_sensor(db, sensor_type: str, room_id: str, value, reading_time: Optional[datetime]) -> Sensor:
+    """Find (or auto-create) the sensor of a reading and update its 3D placement"""
+    # Find sensor by type and room (exact match)
+    sensor = db.query(Sensor).filter(
+        Sensor.type == sensor_type,
+        Sensor.location == room_id
+    ).first()
+
+    # If room is provided but no sensor exists for this room, create one
+    # If room is "unknown", try to find any sensor of this type
+    if not sensor and room_id == "unknown":
+        sensor = db.query(Sensor).filter(Sensor.type == sensor_type).first()
+
+    if not sensor:
+        # Auto-create sensor with the room from payload
+        logger.info(f"Creating new sensor: {sensor_type} in {room_id}")
+        sensor = Sensor(
+            name=f"{sensor_type.capitalize()} {room_id}" if room_id != "unknown" else f"{sensor_type.capitalize()} Auto",
+            type=sensor_type,
+            location=room_id if room_id != "unknown" else None,
+            is_active=True
         )
-        db.add(data_point)
-        db.commit()
-        
-        # Check alert rules (sensor_id or sensor_type/room_id)
-        rules = db.query(AlertRule).filter(
-            AlertRule.is_active == True
-        ).filter(
-            or_(AlertRule.sensor_id == sensor.id, AlertRule.sensor_id.is_(None))
-        ).all()
-
-        now = datetime.utcnow()
-
-        for rule in rules:
-            if rule.sensor_id and rule.sensor_id != sensor.id:
-                continue
-            if rule.sensor_type and rule.sensor_type != sensor.type:
-                continue
-            if rule.room_id and rule.room_id != room_id:
-                continue
-            if not _is_rule_active(rule, now):
+        db.add(sensor)
+        db.flush()
+
+        # Also create a PlacedSensor for 3D visualization if room is known
+        if room_id != "unknown":
+            existing_placed = db.query(PlacedSensor).filter(
+                PlacedSensor.room_id == room_id,
+                PlacedSensor.sensor_type == sensor_type
+            ).first()
+
+            if not existing_placed:
+                placed_sensor = PlacedSensor(
+                    room_id=room_id,
+                    sensor_type=sensor_type,
+                    position_x=0.5,  # Center of room
+                    position_y=0.5,
+                    name=f"{sensor_type.capitalize()} {room_id}",
+                    current_value=float(value),
+                    status="ok"
+                )
+                db.add(placed_sensor)
+                # Sessions don't autoflush: later readings of the batch must find it
+                db.flush()
+                logger.info(f"Created PlacedSensor for 3D: {sensor_type} in {room_id}")
+    else:
+        # Update sensor - ALWAYS update location if room is provided in payload
+        sensor.is_active = True
+        if room_id != "unknown":
+            sensor.location = room_id
+            sensor.name = f"{sensor_type.capitalize()} {room_id}"
+
+            # Also update or create PlacedSensor
+            placed_sensor = db.query(PlacedSensor).filter(
+                PlacedSensor.room_id == room_id,
+                PlacedSensor.sensor_type == sensor_type
+            ).first()
+
+            if placed_sensor:
+                if not (reading_time and placed_sensor.last_update and reading_time < placed_sensor.last_update):
+                    placed_sensor.current_value = float(value)
+                    placed_sensor.last_update = reading_time or datetime.utcnow()
+                placed_sensor.status = "ok"
+            else:
+                placed_sensor = PlacedSensor(
+                    room_id=room_id,
+                    sensor_type=sensor_type,
+                    position_x=0.5,
+                    position_y=0.5,
+                    name=f"{sensor_type.capitalize()} {room_id}",
+                    current_value=float(value),
+                    status="ok"
+                )
+                db.add(placed_sensor)
+                # Sessions don't autoflush: later readings of the batch must find it
+                db.flush()
+                logger.info(f"Created PlacedSensor for 3D: {sensor_type} in {room_id}")
+    return sensor
+
+
+def _evaluate_rules(db, rules, sensor: Sensor, sensor_type: str, value: float, room_id: str, reading_at: datetime):
+    """Raise the alerts of the rules triggered by one stored reading"""
+    now = datetime.utcnow()
+
+    for rule in rules:
+        if rule.sensor_id and rule.sensor_id != sensor.id:
+            continue
+        if rule.sensor_type and rule.sensor_type != sensor.type:
+            continue
+        if rule.room_id and rule.room_id != room_id:
+            continue
+        # Schedules (active days/hours) apply to when the reading was taken
+        if not _is_rule_active(rule, reading_at):
+            continue
+
+        # Cooldown check
+        if rule.cooldown_minutes is not None:
+            last_alert = db.query(Alert).filter(
+                Alert.rule_id == rule.id,
+                Alert.sensor_id == sensor.id
+            ).order_by(desc(Alert.created_at)).first()
+            if last_alert and last_alert.created_at:
+                last_time = last_alert.created_at.replace(tzinfo=None)
+                if (now - last_time).total_seconds() < (rule.cooldown_minutes * 60):
+                    continue
+
+        # Condition evaluation
+        triggered = False
+        if rule.condition == '>' and value > rule.threshold:
+            triggered = True
+        elif rule.condition == '<' and value < rule.threshold:
+            triggered = True
+        elif rule.condition == '>=' and value >= rule.threshold:
+            triggered = True
+        elif rule.condition == '<=' and value <= rule.threshold:
+            triggered = True
+        elif rule.condition == '==' and value == rule.threshold:
+            triggered = True
+        elif rule.condition == '!=' and value != rule.threshold:
+            triggered = True
+
+        if triggered:
+            # Same rule/room/type within the window: counted on the open alert
+            alert = alert_grouper.raise_alert(
+                db,
+                room_id,
+                sensor_id=sensor.id,
+                rule_id=rule.id,
+                type=f"{sensor_type}_threshold",
+                message=rule.message or f"{sensor.name} seuil dépassé en {room_id}",
+                severity=rule.severity,
+                escalation_level=0
+            )
+            if alert is None:
                 continue
+            active_alerts.add(alert.id)
+            logger.info(f"Alert triggered: {alert.message}")
 
-            # Cooldown check
-            if rule.cooldown_minutes is not None:
-                last_alert = db.query(Alert).filter(
-                    Alert.rule_id == rule.id,
-                    Alert.sensor_id == sensor.id
-                ).order_by(desc(Alert.created_at)).first()
-                if last_alert and last_alert.created_at:
-                    last_time = last_alert.created_at.replace(tzinfo=None)
-                    if (now - last_time).total_seconds() < (rule.cooldown_minutes * 60):
-                        continue
-
-            # Condition evaluation
-            triggered = False
-            if rule.condition == '>' and float(value) > rule.threshold:
-                triggered = True
-            elif rule.condition == '<' and float(value) < rule.threshold:
-                triggered = True
-            elif rule.condition == '>=' and float(value) >= rule.threshold:
-                triggered = True
-            elif rule.condition == '<=' and float(value) <= rule.threshold:
-                triggered = True
-            elif rule.condition == '==' and float(value) == rule.threshold:
-                triggered = True
-            elif rule.condition == '!=' and float(value) != rule.threshold:
-                triggered = True
-
-            if triggered:
-                alert = Alert(
-                    sensor_id=sensor.id,
-                    rule_id=rule.id,
-                    type=f"{sensor_type}_threshold",
-                    message=rule.message or f"{sensor.name} seuil dépassé en {room_id}",
-                    severity=rule.severity,
-                    escalation_level=0
-                )
-                db.add(alert)
-                db.commit()
-                logger.info(f"Alert triggered: {alert.message}")
+            # Escalation fires from the scheduler, not from later readings
+            if alert.rule_id and rule.escalation_minutes and rule.escalation_severity:
+                alert_escalator.track(alert.id, alert.created_at, rule.escalation_minutes)
 
-                dispatch_webhooks(db, "alert.triggered", {
+            dispatch_webhooks(db, "alert.triggered", {
+                "id": alert.id,
+                "sensor_id": alert.sensor_id,
+                "room_id": room_id,
+                "type": alert.type,
+                "message": alert.message,
+                "severity": alert.severity,
+                "created_at": alert.created_at.isoformat() if alert.created_at else None
+            })
+
+            # Broadcast alert via WebSocket (async-safe)
+            try:
+                loop = asyncio.get_running_loop()
+                loop.create_task(ws_manager.broadcast_alert({
+                    "id": alert.id,
+                    "sensor_id": alert.sensor_id,
+                    "room_id": room_id,
+                    "type": alert.type,
+                    "message": alert.message,
+                    "severity": alert.severity,
+                    "created_at": alert.created_at.isoformat(),
+                    "rule_id": alert.rule_id
+                }))
+            except RuntimeError:
+                asyncio.run(ws_manager.broadcast_alert({
                     "id": alert.id,
-                    "sensor_id": sensor.id,
+                    "sensor_id": alert.sensor_id,
                     "room_id": room_id,
                     "type": alert.type,
                     "message": alert.message,
                     "severity": alert.severity,
-                    "created_at": alert.created_at.isoformat() if alert.created_at else None
-                })
+                    "created_at": alert.created_at.isoformat(),
+                    "rule_id": alert.rule_id
+                }))
 
-                # Broadcast alert via WebSocket (async-safe)
-                try:
-                    loop = asyncio.get_running_loop()
-                    loop.create_task(ws_manager.broadcast_alert({
-                        "id": alert.id,
-                        "sensor_id": sensor.id,
-                        "room_id": room_id,
-                        "type": alert.type,
-                        "message": alert.message,
-                        "severity": alert.severity,
-                        "created_at": alert.created_at.isoformat(),
-                        "rule_id": alert.rule_id
-                    }))
-                except RuntimeError:
-                    asyncio.run(ws_manager.broadcast_alert({
-                        "id": alert.id,
-                        "sensor_id": sensor.id,
-                        "room_id": room_id,
-                        "type": alert.type,
-                        "message": alert.message,
-                        "severity": alert.severity,
-                        "created_at": alert.created_at.isoformat(),
-                        "rule_id": alert.rule_id
-                    }))
-
-            # Escalation check (if unacknowledged and overdue)
-            if rule.escalation_minutes and rule.escalation_severity:
-                open_alerts = db.query(Alert).filter(
-                    Alert.rule_id == rule.id,
-                    Alert.sensor_id == sensor.id,
-                    Alert.is_acknowledged == False
-                ).order_by(desc(Alert.created_at)).all()
-
-                for open_alert in open_alerts:
-                    if open_alert.escalation_level and open_alert.escalation_level >= 1:
-                        continue
-                    if not open_alert.created_at:
-                        continue
-
-                    age = now - open_alert.created_at.replace(tzinfo=None)
-                    if age >= timedelta(minutes=rule.escalation_minutes):
-                        open_alert.escalation_level = 1
-                        db.commit()
-
-                        escalated = Alert(
-                            sensor_id=sensor.id,
-                            rule_id=rule.id,
-                            type=f"{sensor_type}_escalation",
-                            message=f"Escalade: {open_alert.message}",
-                            severity=rule.escalation_severity,
-                            escalation_level=1,
-                            escalated_from_alert_id=open_alert.id
-                        )
-                        db.add(escalated)
-                        db.commit()
-
-                        dispatch_webhooks(db, "alert.escalated", {
-                            "id": escalated.id,
-                            "sensor_id": sensor.id,
-                            "room_id": room_id,
-                            "type": escalated.type,
-                            "message": escalated.message,
-                            "severity": escalated.severity,
-                            "created_at": escalated.created_at.isoformat() if escalated.created_at else None,
-                            "escalated_from_alert_id": escalated.escalated_from_alert_id
-                        })
 
-                        try:
-                            loop = asyncio.get_running_loop()
-                            loop.create_task(ws_manager.broadcast_alert({
-                                "id": escalated.id,
-                                "sensor_id": sensor.id,
-                                "room_id": room_id,
-                                "type": escalated.type,
-                                "message": escalated.message,
-                                "severity": escalated.severity,
-                                "created_at": escalated.created_at.isoformat(),
-                                "rule_id": escalated.rule_id,
-                                "escalated_from_alert_id": escalated.escalated_from_alert_id
-                            }))
-                        except RuntimeError:
-                            asyncio.run(ws_manager.broadcast_alert({
-                                "id": escalated.id,
-                                "sensor_id": sensor.id,
-                                "room_id": room_id,
-                                "type": escalated.type,
-                                "message": escalated.message,
-                                "severity": escalated.severity,
-                                "created_at": escalated.created_at.isoformat(),
-                                "rule_id": escalated.rule_id,
-                                "escalated_from_alert_id": escalated.escalated_from_alert_id
-                            }))
-
-        # Anomaly detection
+def _inserted_rows(sensors: List[Sensor], accepted: List[tuple], returned: List[Any]) -> List[Tuple[int, Any]]:
+    """(reading index, RETURNING row) of the readings actually inserted, in reading order"""
+    remaining = list(returned)
+    inserted = []
+    for index, (sensor, (_, _, _, reading_time)) in enumerate(zip(sensors, accepted)):
+        for position, row in enumerate(remaining):
+            if row.sensor_id == sensor.id and (reading_time is None or row.time == reading_time):
+                inserted.append((index, remaining.pop(position)))
+                break
+    return inserted
+
+
+def _unstored_retained(db, sensors: List[Sensor], accepted: List[tuple]) -> List[int]:
+    """Indexes of the retained readings not stored yet
+
+    A reading with a device timestamp is checked by the insert itself (same
+    (sensor_id, time) is skipped); without one, a retained value equal to the
+    sensor's latest stored reading is the one already stored.
+    """
+    unstored = []
+    for index, (sensor, (_, value, _, reading_time)) in enumerate(zip(sensors, accepted)):
+        if reading_time is None:
+            latest = db.query(SensorData.value).filter(
+                SensorData.sensor_id == sensor.id
+            ).order_by(desc(SensorData.time)).limit(1).scalar()
+            if latest is not None and latest == value:
+                continue
+        unstored.append(index)
+    return unstored
+
+
+def handle_mqtt_readings(topic: str, readings: List[Tuple[str, Any, str, Optional[datetime]]], retained: bool = False):
+    """Store the readings of one MQTT message and run rules/anomalies on them
+
+    readings are (sensor_type, value, room_id, reading_time) tuples: one for a
+    plain message, several for a gateway batch. Sensors, 3D placements and
+    data points of the whole message are written in a single transaction.
+    The room_id comes directly from the topic or payload {"room": "X101", "value": 23.5}
+    and auto-assigns the sensor to the room specified by the Arduino/transmitter.
+    reading_time is the device timestamp when the payload carries one (server
+    time otherwise); a reading older than the sensor's latest one is stored but
+    does not change the current state (3D value, presence, anomalies, live view).
+    retained: replayed retained message; only the readings not stored yet
+    (published while the backend was down) are kept.
+    """
+    accepted = []
+    for sensor_type, value, room_id, reading_time in readings:
         try:
-            _detect_anomalies(db, sensor, float(value), room_id)
-        except Exception as e:
-            logger.error(f"Anomaly detection failed: {e}")
-        
-        db.close()
-        
+            accepted.append((sensor_type, float(value), room_id, reading_time))
+        except (TypeError, ValueError):
+            logger.warning(f"[HANDLER] Non-numeric {sensor_type} value ignored: {value!r}")
+    if not accepted:
+        return
+
+    db = SessionLocal()
+    try:
+        logger.info(f"[HANDLER] Processing {len(accepted)} reading(s) from {topic}")
+
+        with ingest_stage("sensor_resolve"):
+            sensors = [
+                _resolve_sensor(db, sensor_type, room_id, value, reading_time)
+                for sensor_type, value, room_id, reading_time in accepted
+            ]
+
+            if retained:
+                unstored = _unstored_retained(db, sensors, accepted)
+                if len(unstored) < len(accepted):
+                    MQTT_MESSAGES.inc(len(accepted) - len(unstored), status="retained")
+                if not unstored:
+                    return
+                sensors = [sensors[index] for index in unstored]
+                accepted = [accepted[index] for index in unstored]
+
+        if len(accepted) > 1:
+            # One transaction shares one now(): readings of the same sensor need distinct times
+            accepted = [
+                (sensor_type, value, room_id, reading_time or datetime.now(timezone.utc))
+                for sensor_type, value, room_id, reading_time in accepted
+            ]
+
+        # Store data points. (time, sensor_id) is the primary key: a reading
+        # already stored (QoS 1 redelivery, backlog replayed after a restart)
+        # is skipped instead of failing the whole batch
+        with ingest_stage("insert"):
+            returned = db.execute(
+                insert(SensorData).values([
+                    {
+                        "sensor_id": sensor.id,
+                        "value": value,
+                        "time": reading_time if reading_time is not None else func.now()
+                    }
+                    for sensor, (sensor_type, value, room_id, reading_time) in zip(sensors, accepted)
+                ]).on_conflict_do_nothing(
+                    index_elements=["sensor_id", "time"]
+                ).returning(SensorData.sensor_id, SensorData.time, SensorData.value)
+            ).all()
+            db.commit()
+
+            inserted = _inserted_rows(sensors, accepted, returned)
+            if len(inserted) < len(accepted):
+                MQTT_MESSAGES.inc(len(accepted) - len(inserted), status="duplicate")
+                logger.info(f"[HANDLER] {len(accepted) - len(inserted)} reading(s) from {topic} already stored")
+            if not inserted:
+                return
+            sensors = [sensors[index] for index, _ in inserted]
+            accepted = [accepted[index] for index, _ in inserted]
+            stored = [(row.sensor_id, row.time, row.value) for _, row in inserted]
+
+            in_order = []
+            for sensor_id, reading_time, reading_value in stored:
+                in_order.append(latest_readings.observe(db, sensor_id, reading_time))
+                if not in_order[-1]:
+                    INGEST_LATE_READINGS.inc()
+
+                # Integrity proof: one leaf hash per reading, anchored per batch
+                try:
+                    reading_anchor.add_reading(sensor_id, reading_time, reading_value)
+                except Exception as e:
+                    logger.error(f"Merkle anchoring failed: {e}")
+
+        # Presence readings drive the room energy state (eco mode scheduling)
+        with ingest_stage("presence"):
+            for (sensor_type, value, room_id, _), current in zip(accepted, in_order):
+                if room_id != "unknown" and current:
+                    try:
+                        energy_manager.handle_sensor_reading(room_id, sensor_type, value)
+                    except Exception as e:
+                        logger.error(f"Presence update failed: {e}")
+
+        # Check alert rules (sensor_id or sensor_type/room_id)
+        with ingest_stage("rule_eval"):
+            rules = db.query(AlertRule).filter(
+                AlertRule.is_active == True
+            ).filter(
+                or_(AlertRule.sensor_id.in_([sensor.id for sensor in sensors]), AlertRule.sensor_id.is_(None))
+            ).all()
+
+            for sensor, (sensor_type, value, room_id, _), (_, reading_time, _) in zip(sensors, accepted, stored):
+                reading_at = reading_time.astimezone(timezone.utc).replace(tzinfo=None)
+                _evaluate_rules(db, rules, sensor, sensor_type, value, room_id, reading_at)
+
+        # Anomaly detection (windows are the sensor's latest points: a late
+        # reading is not the value to compare against them)
+        with ingest_stage("anomaly"):
+            params = _anomaly_settings(db) if any(in_order) else None
+            for sensor, (sensor_type, value, room_id, _), current in zip(sensors, accepted, in_order):
+                try:
+                    if current:
+                        _detect_anomalies(db, sensor, value, room_id, params)
+                except Exception as e:
+                    logger.error(f"Anomaly detection failed: {e}")
+
         # Broadcast sensor data via WebSocket (async-safe)
-        try:
-            loop = asyncio.get_running_loop()
-            loop.create_task(ws_manager.broadcast_sensor_data(
-                sensor_type, value, datetime.utcnow().isoformat(), room_id
-            ))
-        except RuntimeError:
-            # No running loop - skip broadcast (will be picked up on next poll)
-            pass
-        
-        logger.info(f"[HANDLER] Stored and broadcast: {sensor_type}={value} for {room_id}")
-        
+        with ingest_stage("broadcast"):
+            try:
+                loop = asyncio.get_running_loop()
+                for (sensor_type, value, room_id, _), (_, reading_time, _), current in zip(accepted, stored, in_order):
+                    if current:
+                        loop.create_task(ws_manager.broadcast_sensor_data(
+                            sensor_type, value, reading_time.astimezone(timezone.utc).replace(tzinfo=None).isoformat(), room_id
+                        ))
+            except RuntimeError:
+                # No running loop - skip broadcast (will be picked up on next poll)
+                pass
+
+        logger.info(f"[HANDLER] Stored and broadcast {len(accepted)} reading(s) from {topic}")
+
     except Exception as e:
         logger.error(f"Error handling MQTT message: {e}")
+    finally:
+        db.close()
 
 
 @asynccontextmanager
@@ -517,18 +634,72 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Campus IoT API...")
     
-    # Connect to MQTT broker
-    mqtt_service.set_message_callback(handle_mqtt_message)
+    # Connect to MQTT broker (messages handled here, or by the ingest workers)
+    if settings.ingest_workers > 0:
+        ingest_workers.start(settings.ingest_workers, asyncio.get_running_loop())
+        mqtt_service.set_message_callback(ingest_workers.submit, traced=False)
+    else:
+        mqtt_service.set_message_callback(handle_mqtt_readings)
     mqtt_service.connect()
     
+    # Presence-timeout transitions to eco mode
+    try:
+        energy_manager.start_scheduler()
+    except Exception as e:
+        logger.error(f"Eco scheduler failed to start: {e}")
+
+    # Unacknowledged rule alerts escalate exactly when due
+    try:
+        alert_escalator.start(asyncio.get_running_loop())
+    except Exception as e:
+        logger.error(f"Alert escalation scheduler failed to start: {e}")
+    
     backup_task = None
     export_task = None
+    anchor_task = None
+    if settings.blockchain_anchoring_enabled and settings.blockchain_batch_seconds > 0:
+        async def anchor_loop():
+            while True:
+                await asyncio.sleep(settings.blockchain_batch_seconds)
+                try:
+                    with timed_job("merkle_anchor"):
+                        await asyncio.to_thread(reading_anchor.flush)
+                except Exception as e:
+                    logger.error(f"Merkle anchoring failed: {e}")
+
+        anchor_task = asyncio.create_task(anchor_loop())
+
+    security_alert_task = None
+    if settings.security_alert_flush_seconds > 0:
+        async def security_alert_loop():
+            while True:
+                await asyncio.sleep(settings.security_alert_flush_seconds)
+                try:
+                    def _flush_alerts():
+                        db = SessionLocal()
+                        try:
+                            return security_alerts.flush(db)
+                        finally:
+                            db.close()
+
+                    with timed_job("security_alert_flush"):
+                        created_alerts = await asyncio.to_thread(_flush_alerts)
+                    for alert in created_alerts:
+                        await ws_manager.broadcast_security_alert(
+                            alert["alert_type"], alert["severity"], alert["description"], alert["raw_data"]
+                        )
+                except Exception as e:
+                    logger.error(f"Security alert flush failed: {e}")
+
+        security_alert_task = asyncio.create_task(security_alert_loop())
+
     if settings.backups_enabled and settings.backup_interval_minutes > 0:
         async def backup_loop():
             await asyncio.sleep(10)
             while True:
                 try:
-                    await asyncio.to_thread(run_backup)
+                    with timed_job("backup"):
+                        await asyncio.to_thread(run_backup)
                     if settings.backup_retention_days > 0:
                         await asyncio.to_thread(cleanup_old_backups, settings.backup_retention_days)
                     logger.info("Automatic backup completed")
@@ -550,7 +721,8 @@ async def lifespan(app: FastAPI):
                         finally:
                             db.close()
 
-                    await asyncio.to_thread(_run_exports)
+                    with timed_job("export"):
+                        await asyncio.to_thread(_run_exports)
                     logger.info("Export check completed")
                 except Exception as e:
                     logger.error(f"Export check failed: {e}")
@@ -566,6 +738,19 @@ async def lifespan(app: FastAPI):
         backup_task.cancel()
     if export_task:
         export_task.cancel()
+    if anchor_task:
+        anchor_task.cancel()
+    if security_alert_task:
+        security_alert_task.cancel()
+    # Workers drain their queue first: their readings are anchored below
+    if ingest_workers.size:
+        await asyncio.to_thread(ingest_workers.stop)
+    try:
+        reading_anchor.flush()
+    except Exception as e:
+        logger.error(f"Final Merkle anchoring failed: {e}")
+    energy_manager.stop_scheduler()
+    alert_escalator.stop()
     mqtt_service.disconnect()
 
 
@@ -584,8 +769,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "X-DB-Queries"],
 )
 
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """HTTP latency (and SQL query count) per route template, not per raw path, to bound label values"""
+    start = time.perf_counter()
+    status = 500
+    with query_scope("http", f"{request.method} {request.url.path}") as queries:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            if queries is not None:
+                response.headers["X-DB-Queries"] = str(queries.count)
+            return response
+        finally:
+            route = request.scope.get("route")
+            route_path = route.path if route else "unmatched"
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=request.method,
+                route=route_path,
+                status=status
+            )
+            if queries is not None:
+                queries.name = f"{request.method} {route_path}"
+
 # Include routers
 app.include_router(sensors_router, prefix="/api")
 app.include_router(alerts_router, prefix="/api")
@@ -613,6 +824,22 @@ def root():
     }
 
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition of the in-process metrics"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/traces/slow")
+def get_slow_traces(current_user=Depends(get_current_admin)):
+    """Span trees of the last traced MQTT messages over the latency budget (SQL included)"""
+    return {
+        "slow_ms": settings.tracing_slow_ms,
+        "sample_rate": settings.tracing_sample_rate,
+        "traces": slow_traces.list()
+    }
+
+
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
@@ -6,3 +6,5 @@ from .audit import AuditLog
 from .settings import PlacedSensor, SystemSetting, UserPreference, SensorEnergySetting
 from .anomaly import Anomaly
 from .integration import WebhookEndpoint, ExportConfig
+from .report import IssueReport
+from .energy import RoomEnergy, HeatingState
@@ -1,7 +1,7 @@
 """
 Alert models
 """
-from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Text, Index
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -20,12 +20,24 @@ class Alert(Base):
     is_acknowledged = Column(Boolean, default=False)
     escalation_level = Column(Integer, default=0)
     escalated_from_alert_id = Column(Integer, ForeignKey("alerts.id"), nullable=True)
+    occurrences = Column(Integer, default=1)  # triggers folded into this alert (storm grouping)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_seen = Column(DateTime(timezone=True), server_default=func.now())
     acknowledged_at = Column(DateTime(timezone=True))
     
     # Relationships
     sensor = relationship("Sensor", back_populates="alerts")
     rule = relationship("AlertRule", back_populates="alerts")
+    
+    __table_args__ = (
+        # Active (unacknowledged) alerts, newest first: small partial index
+        Index(
+            "idx_alerts_active_created", created_at.desc(), id.desc(),
+            postgresql_where=(is_acknowledged == False)
+        ),
+        # Rule cooldown lookups: last alert of a rule for a sensor
+        Index("idx_alerts_rule_sensor_created", rule_id, sensor_id, created_at.desc()),
+    )
 
 
 class AlertRule(Base):
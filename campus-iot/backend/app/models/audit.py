@@ -1,7 +1,7 @@
 """
 Audit log model - Tracks who changed what and when
 """
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import JSONB
 from db.database import Base
@@ -9,6 +9,13 @@ from db.database import Base
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    __table_args__ = (
+        # Keyset pagination on (created_at, id) for each filter of /audit/logs
+        Index("idx_audit_logs_created_id", "created_at", "id"),
+        Index("idx_audit_logs_entity_created", "entity_type", "entity_id", "created_at", "id"),
+        Index("idx_audit_logs_user_created", "user_id", "created_at", "id"),
+        Index("idx_audit_logs_action_created", "action", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=True)
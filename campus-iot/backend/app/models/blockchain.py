@@ -2,7 +2,7 @@
 Blockchain Model - Stores integrity proofs for sensor data
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Index
 from sqlalchemy.sql import func
 from db.database import Base
 
@@ -27,6 +27,7 @@ class Block(Base):
     previous_hash = Column(String(64), nullable=False)
     hash = Column(String(64), nullable=False, unique=True)
     nonce = Column(Integer, default=0)
+    hash_version = Column(Integer, default=1)  # 1 = JSON header, 2 = binary header
     
     # Security metadata
     signature_valid = Column(Boolean, default=True)
@@ -43,10 +44,52 @@ class Block(Base):
             "previous_hash": self.previous_hash,
             "hash": self.hash,
             "nonce": self.nonce,
+            "hash_version": self.hash_version,
             "signature_valid": self.signature_valid
         }
 
 
+class MerkleLeaf(Base):
+    """
+    One sensor reading anchored in a Merkle batch block
+    The block's data_hash is the Merkle root of its leaves (ordered by position)
+    """
+    __tablename__ = "blockchain_leaves"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    block_index = Column(Integer, nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    sensor_id = Column(Integer, nullable=False)
+    reading_time = Column(DateTime(timezone=True), nullable=False)
+    leaf_hash = Column(String(64), nullable=False)
+    
+    __table_args__ = (
+        Index("idx_blockchain_leaves_reading", "sensor_id", "reading_time"),
+    )
+
+
+class ChainCheckpoint(Base):
+    """
+    Last block known to verify correctly (single row, id = 1)
+    Verification only re-checks blocks appended after it
+    """
+    __tablename__ = "blockchain_checkpoints"
+    
+    id = Column(Integer, primary_key=True)
+    block_index = Column(Integer, nullable=False)
+    block_hash = Column(String(64), nullable=False)
+    blocks_verified = Column(Integer, default=0)
+    verified_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def to_dict(self):
+        return {
+            "block_index": self.block_index,
+            "block_hash": self.block_hash,
+            "blocks_verified": self.blocks_verified,
+            "verified_at": self.verified_at.isoformat() if self.verified_at else None
+        }
+
+
 class SecurityAlert(Base):
     """
     Security alerts for tampering attempts or invalid signatures
@@ -63,10 +106,20 @@ class SecurityAlert(Base):
     raw_data = Column(Text)  # Original data that triggered alert
     source_ip = Column(String(45))
     
+    # Aggregation: one row per (source, alert_type) and time window
+    source = Column(String(100))  # device id or client IP
+    occurrences = Column(Integer, default=1)
+    first_seen = Column(DateTime(timezone=True), server_default=func.now())
+    last_seen = Column(DateTime(timezone=True), server_default=func.now())
+    
     resolved = Column(Boolean, default=False)
     resolved_at = Column(DateTime(timezone=True))
     resolved_by = Column(String(100))
     
+    __table_args__ = (
+        Index("idx_security_alerts_source_type", "source", "alert_type", "last_seen"),
+    )
+    
     def to_dict(self):
         return {
             "id": self.id,
@@ -76,6 +129,10 @@ class SecurityAlert(Base):
             "description": self.description,
             "raw_data": self.raw_data[:100] if self.raw_data else None,  # Truncate for display
             "source_ip": self.source_ip,
+            "source": self.source,
+            "occurrences": self.occurrences,
+            "first_seen": self.first_seen.isoformat() if self.first_seen else None,
+            "last_seen": self.last_seen.isoformat() if self.last_seen else None,
             "resolved": self.resolved,
             "resolved_at": self.resolved_at.isoformat() if self.resolved_at else None
         }
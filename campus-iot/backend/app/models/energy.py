@@ -0,0 +1,35 @@
+"""
+Energy management models - Room heating configuration and state shared by all API workers
+"""
+from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime
+from sqlalchemy.sql import func
+from db.database import Base
+
+
+class RoomEnergy(Base):
+    """Per-room heating configuration and current (possibly auto-switched) state"""
+    __tablename__ = "room_energy_states"
+
+    id = Column(Integer, primary_key=True, index=True)
+    room_id = Column(String(50), unique=True, nullable=False, index=True)
+    # Configuration
+    mode = Column(String(20), default="manual")  # manual, auto, eco
+    setpoint = Column(Float, default=21.0)
+    eco_setpoint = Column(Float, default=19.0)
+    presence_timeout_minutes = Column(Integer, default=15)
+    # State
+    current_mode = Column(String(20), default="manual")
+    has_presence = Column(Boolean, default=True)
+    last_presence_time = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class HeatingState(Base):
+    """Last global heating command (legacy /actuators/heating endpoints), single row"""
+    __tablename__ = "heating_state"
+
+    id = Column(Integer, primary_key=True)
+    mode = Column(String(20), default="manual")
+    setpoint = Column(Float, default=21.0)
+    room = Column(String(50), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
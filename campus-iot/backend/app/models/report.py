@@ -0,0 +1,23 @@
+"""
+Issue report model - Problems reported in rooms via QR code scanning
+"""
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text
+from sqlalchemy.sql import func
+from db.database import Base
+
+
+class IssueReport(Base):
+    __tablename__ = "issue_reports"
+
+    id = Column(Integer, primary_key=True, index=True)
+    ticket_id = Column(String(32), unique=True, nullable=False, index=True)
+    room_id = Column(String(50), nullable=False, index=True)
+    room_name = Column(String(100), nullable=True)
+    issue_type = Column(String(50), nullable=False)
+    urgency = Column(String(20), default="medium", index=True)  # low, medium, high
+    description = Column(Text, nullable=True)
+    has_photo = Column(Boolean, default=False)
+    status = Column(String(20), default="open", index=True)  # open, in_progress, resolved
+    assigned_to = Column(String(100), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    updated_at = Column(DateTime(timezone=True), nullable=True)
@@ -1,7 +1,7 @@
 """
 User model for authentication - Connected to Supabase
 """
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Index
 from sqlalchemy.sql import func
 from db.database import Base
 
@@ -24,6 +24,12 @@ class User(Base):
 
 class ActivityLog(Base):
     __tablename__ = "activity_logs"
+    __table_args__ = (
+        # Keyset pagination on (created_at, id) for each filter of /activity/logs
+        Index("idx_activity_logs_created_id", "created_at", "id"),
+        Index("idx_activity_logs_user_created", "user_id", "created_at", "id"),
+        Index("idx_activity_logs_action_created", "action", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=True)
@@ -23,7 +23,9 @@ class AlertResponse(AlertBase):
     rule_id: Optional[int] = None
     escalation_level: Optional[int] = 0
     escalated_from_alert_id: Optional[int] = None
+    occurrences: Optional[int] = 1
     created_at: datetime
+    last_seen: Optional[datetime] = None
     acknowledged_at: Optional[datetime] = None
     
     class Config:
@@ -0,0 +1,76 @@
+"""
+Active alerts - Count of unacknowledged alerts for the dashboard badge
+
+Only a counter is kept: alerts created by this process increment it, and any
+other change (acknowledgement, alert created by another worker or replica,
+announced on the "active_alerts" invalidation topic) marks it stale. A stale
+counter is reloaded on the next count with a count(*) on the partial index of
+active alerts, so X-Total-Count and the badge agree whichever process answers
+and a burst of alerts costs nothing until somebody asks. The counter is also
+reloaded periodically to absorb writes made outside the API (SQL console,
+restores...) or missed invalidations (broker down).
+"""
+import threading
+import time
+from typing import Iterable, Optional
+
+from sqlalchemy import func
+
+from models.alert import Alert
+from services.mqtt_client import mqtt_service
+
+INVALIDATION_NAMESPACE = "active_alerts"
+
+
+class ActiveAlertIndex:
+    def __init__(self, resync_seconds: int = 300):
+        self.resync_seconds = resync_seconds
+        self._count: Optional[int] = None
+        self._loaded_at: Optional[float] = None
+        # Bumped on every change: a load overlapping one is not trusted
+        self._version = 0
+        self._lock = threading.Lock()
+        mqtt_service.register_invalidation_handler(INVALIDATION_NAMESPACE, self._on_remote_change)
+
+    def add(self, alert_id: int):
+        """A new (unacknowledged) alert was committed by this process"""
+        with self._lock:
+            if self._count is not None and self._loaded_at is not None:
+                self._count += 1
+            self._version += 1
+        mqtt_service.publish_invalidation(INVALIDATION_NAMESPACE, str(alert_id))
+
+    def discard(self, alert_ids: Iterable[int]):
+        """Alerts acknowledged (some may have been already): reload on next count"""
+        alert_ids = list(alert_ids)
+        if not alert_ids:
+            return
+        self.invalidate()
+        mqtt_service.publish_invalidation(INVALIDATION_NAMESPACE)
+
+    def _on_remote_change(self, key: Optional[str]):
+        """Another worker created or acknowledged alerts: reload on next count"""
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+            self._version += 1
+
+    def count(self, db) -> int:
+        """Number of unacknowledged alerts (count(*) only when stale)"""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.resync_seconds:
+            return self._load(db)
+        return self._count
+
+    def _load(self, db) -> int:
+        version = self._version
+        count = db.query(func.count(Alert.id)).filter(Alert.is_acknowledged == False).scalar()
+        with self._lock:
+            self._count = count
+            self._loaded_at = time.monotonic() if self._version == version else None
+        return count
+
+
+# Singleton instance
+active_alerts = ActiveAlertIndex()
@@ -0,0 +1,118 @@
+"""
+Alert grouping - Collapses rule alerts during alert storms
+
+Alerts of the same (rule, room, type) raised within ALERT_GROUP_WINDOW_SECONDS
+of the first one are folded into it (occurrences + 1, last_seen) instead of
+creating new rows, webhooks and broadcasts. New groups are additionally
+limited by a global token bucket (split between ingest workers); past it, triggers are folded into a single
+"alert_storm" alert per window. When a gateway replays retained messages,
+the number of rows, webhook calls and broadcasts stays bounded.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from config import settings
+from models.alert import Alert
+from services.metrics import ALERT_TRIGGERS
+from services.security_service import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+STORM_ALERT_TYPE = "alert_storm"
+
+
+class AlertGrouper:
+    def __init__(self, max_groups: int = 10000):
+        self.max_groups = max_groups
+        # (rule_id, room_id, type) -> (alert_id, opened_at)
+        self._groups: "OrderedDict[Tuple[Any, ...], Tuple[int, float]]" = OrderedDict()
+        self._storm: Optional[Tuple[int, float]] = None
+        self._bucket: Optional[TokenBucket] = None
+        self._lock = threading.Lock()
+
+    def _take_token(self) -> bool:
+        if self._bucket is None:
+            # With ingest workers, each process limits its own shard of the
+            # sensors: split the global rate between them
+            workers = max(settings.ingest_workers, 1)
+            self._bucket = TokenBucket(
+                max(settings.alert_storm_burst / workers, 1), settings.alert_storm_rate_per_minute / 60 / workers
+            )
+        return self._bucket.take()
+
+    def _open_group(self, key: Tuple[Any, ...]) -> Optional[int]:
+        with self._lock:
+            group = self._groups.get(key)
+            if group and time.monotonic() - group[1] < settings.alert_group_window_seconds:
+                return group[0]
+            self._groups.pop(key, None)
+            return None
+
+    def _remember(self, key: Tuple[Any, ...], alert_id: int):
+        with self._lock:
+            self._groups[key] = (alert_id, time.monotonic())
+            self._groups.move_to_end(key)
+            while len(self._groups) > self.max_groups:
+                self._groups.popitem(last=False)
+
+    @staticmethod
+    def _fold(db: Session, alert_id: int) -> bool:
+        """Count one more occurrence on an alert that is still unacknowledged"""
+        result = db.execute(
+            update(Alert).where(
+                Alert.id == alert_id,
+                Alert.is_acknowledged == False
+            ).values(
+                occurrences=func.coalesce(Alert.occurrences, 1) + 1,
+                last_seen=func.now()
+            ).execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount == 1
+
+    def raise_alert(self, db: Session, room_id: Optional[str], **fields) -> Optional[Alert]:
+        """Create the alert, or fold it into its group / the storm alert
+
+        Returns the new Alert (to dispatch and broadcast) or None when it was folded.
+        """
+        key = (fields.get("rule_id"), room_id, fields.get("type"))
+        alert_id = self._open_group(key)
+        if alert_id is not None and self._fold(db, alert_id):
+            ALERT_TRIGGERS.inc(outcome="grouped")
+            return None
+
+        if self._take_token():
+            alert = Alert(**fields)
+            db.add(alert)
+            db.commit()
+            self._remember(key, alert.id)
+            ALERT_TRIGGERS.inc(outcome="created")
+            return alert
+
+        # Storm: one alert per window counts every trigger past the rate limit
+        ALERT_TRIGGERS.inc(outcome="storm")
+        storm = self._storm
+        if storm and time.monotonic() - storm[1] < settings.alert_group_window_seconds and self._fold(db, storm[0]):
+            return None
+
+        alert = Alert(
+            type=STORM_ALERT_TYPE,
+            message="Tempête d'alertes : création limitée, les déclenchements suivants sont regroupés",
+            severity="critical",
+            escalation_level=0
+        )
+        db.add(alert)
+        db.commit()
+        self._storm = (alert.id, time.monotonic())
+        logger.warning(f"Alert storm: rate limit reached, folding new alerts into alert {alert.id}")
+        return alert
+
+
+# Singleton instance
+alert_grouper = AlertGrouper()
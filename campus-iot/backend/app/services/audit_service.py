@@ -1,13 +1,17 @@
 """
 Audit logging service
 """
-from typing import Any, Optional
+from typing import Any, Iterable, Optional, Tuple
 from fastapi.encoders import jsonable_encoder
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 from models.audit import AuditLog
 
 
+_JSON_SCALARS = (str, int, float, bool, type(None))
+
+
 def _normalize_payload(payload: Any) -> Optional[dict]:
     if payload is None:
         return None
@@ -44,3 +48,50 @@ def log_audit(
     except Exception:
         db.rollback()
         return None
+
+
+def log_audit_bulk(
+    db: Session,
+    user_id: Optional[int],
+    user_email: Optional[str],
+    action: str,
+    entity_type: str,
+    entries: Iterable[Tuple[Any, Any, Any]],
+    ip_address: Optional[str] = None
+) -> int:
+    """Create one audit log entry per (entity_id, before, after) in a single INSERT"""
+    # Flat payloads of JSON scalars are stored as is; payloads shared by
+    # several entries (typically `after`) are encoded once
+    normalized = {}
+
+    def normalize(payload: Any) -> Optional[dict]:
+        if isinstance(payload, dict) and all(isinstance(v, _JSON_SCALARS) for v in payload.values()):
+            return payload
+        key = id(payload)
+        if key not in normalized:
+            normalized[key] = (payload, _normalize_payload(payload))
+        return normalized[key][1]
+
+    rows = [
+        {
+            "user_id": user_id,
+            "user_email": user_email,
+            "action": action,
+            "entity_type": entity_type,
+            "entity_id": str(entity_id) if entity_id is not None else None,
+            "before_data": normalize(before),
+            "after_data": normalize(after),
+            "ip_address": ip_address
+        }
+        for entity_id, before, after in entries
+    ]
+    if not rows:
+        return 0
+    try:
+        # Core insert: no ORM bookkeeping per row
+        db.execute(insert(AuditLog.__table__), rows)
+        db.commit()
+        return len(rows)
+    except Exception:
+        db.rollback()
+        return 0
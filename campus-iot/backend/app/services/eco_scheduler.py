@@ -0,0 +1,104 @@
+"""
+Eco-mode scheduler - Fires each room's presence-timeout transition exactly when due
+
+A single thread sleeps on a min-heap of deadlines (one live deadline per key).
+Rescheduling a key just pushes a new entry; stale entries are skipped when
+popped, so updates are O(log n) and nothing is polled. DeadlineScheduler is
+also used for alert escalations.
+"""
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineScheduler:
+    """Calls callback(key) in a dedicated thread when the key's deadline is due"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._deadlines: Dict[Hashable, Tuple[float, int]] = {}
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._callback: Optional[Callable[[Hashable], None]] = None
+
+    def schedule(self, key: Hashable, due_at: datetime):
+        """(Re)schedule a key at a UTC datetime (naive or timezone-aware)"""
+        now = datetime.now(timezone.utc) if due_at.tzinfo else datetime.utcnow()
+        delay = (due_at - now).total_seconds()
+        deadline = time.monotonic() + max(delay, 0)
+        with self._cond:
+            self._seq += 1
+            self._deadlines[key] = (deadline, self._seq)
+            heapq.heappush(self._heap, (deadline, self._seq, key))
+            self._cond.notify()
+
+    def cancel(self, key: Hashable):
+        with self._cond:
+            self._deadlines.pop(key, None)
+
+    def pending(self) -> Dict[Hashable, float]:
+        """Seconds remaining before each scheduled deadline"""
+        now = time.monotonic()
+        with self._cond:
+            return {key: max(d - now, 0) for key, (d, _) in self._deadlines.items()}
+
+    def start(self, callback: Callable[[Hashable], None]):
+        if self._running:
+            return
+        self._callback = callback
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due_key = None
+                while self._running and due_key is None:
+                    # Drop entries superseded by a later schedule() or cancel()
+                    while self._heap and self._deadlines.get(self._heap[0][2], (None, None))[1] != self._heap[0][1]:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    deadline, _, key = self._heap[0]
+                    remaining = deadline - time.monotonic()
+                    if remaining > 0:
+                        self._cond.wait(timeout=remaining)
+                        continue
+                    heapq.heappop(self._heap)
+                    self._deadlines.pop(key, None)
+                    due_key = key
+                if not self._running:
+                    return
+            try:
+                self._callback(due_key)
+            except Exception as e:
+                logger.error(f"{self.name} callback failed for {due_key}: {e}")
+
+
+class EcoScheduler(DeadlineScheduler):
+    """One presence-timeout deadline per room"""
+
+    def __init__(self):
+        super().__init__("eco-scheduler")
+
+
+# Singleton instance
+eco_scheduler = EcoScheduler()
@@ -1,24 +1,144 @@
 """
 Energy Management Service - Manages room-based heating economy modes
+
+Room configuration and state live in the database (room_energy_states) so that
+every API worker sees the same modes and restarts keep them. Each worker keeps
+a short-lived read cache, invalidated by the other workers over MQTT on writes.
+
+Presence comes from the ingest stream (handle_sensor_reading) and the switch to
+eco mode after the presence timeout is fired by the eco scheduler, not polled.
+Before switching, the latest presence reading stored by any worker is checked
+under the room's row lock (presence writes are throttled).
 """
 import logging
-from datetime import datetime, timedelta
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Optional
-from models.sensor import Sensor
+from sqlalchemy import and_, func, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, object_session
+from config import settings
+from models.energy import RoomEnergy, HeatingState
+from models.sensor import Sensor, SensorData
 from db.database import SessionLocal
+from services.mqtt_client import mqtt_service
+from services.eco_scheduler import eco_scheduler
 
 logger = logging.getLogger(__name__)
 
+HEATING_KEY = "__heating__"
+
+# Sensor types feeding presence detection
+PRESENCE_SENSOR_TYPES = {"presence", "pir", "movement"}
+DISTANCE_SENSOR_TYPES = {"ultrasonic", "distance"}
+# Continuous presence only refreshes last_presence_time in DB at this rate
+PRESENCE_REFRESH_INTERVAL = timedelta(seconds=60)
+
+
+def _room_to_dict(row: RoomEnergy) -> dict:
+    return {
+        "mode": row.mode,
+        "setpoint": row.setpoint,
+        "eco_setpoint": row.eco_setpoint,
+        "presence_timeout_minutes": row.presence_timeout_minutes,
+        "current_mode": row.current_mode,
+        "has_presence": row.has_presence,
+        "last_presence_time": row.last_presence_time.astimezone(timezone.utc) if row.last_presence_time else None
+    }
+
 
 class EnergyManager:
     """Manages energy efficiency per room with auto eco-mode based on presence detection"""
     
-    def __init__(self):
-        # Room configs: room_id -> {mode, setpoint, eco_setpoint, presence_timeout}
-        self.room_configs: Dict[str, dict] = {}
-        # Room states: room_id -> {current_mode, has_presence, last_presence_time}
-        self.room_states: Dict[str, dict] = {}
+    def __init__(self, cache_ttl_seconds: int = settings.state_cache_ttl_seconds):
+        # Read cache: room_id -> (room dict, expiry)
+        self._cache: Dict[str, tuple] = {}
+        self._cache_lock = threading.Lock()
+        self.cache_ttl_seconds = cache_ttl_seconds
+        mqtt_service.register_invalidation_handler("energy", self._on_remote_change)
+    
+    # ------------------------------------------------------------------
+    # Cache & persistence
+    # ------------------------------------------------------------------
+    def invalidate(self, room: Optional[str] = None):
+        """Drop a cached room (or everything when room is None)"""
+        with self._cache_lock:
+            if room is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(room, None)
+    
+    def _on_remote_change(self, key: Optional[str]):
+        """Another worker changed a room: drop it and follow its new timeout"""
+        self.invalidate(key)
+        if key and key != HEATING_KEY:
+            data = self._load(key)
+            if data:
+                self._reschedule(key, data)
     
+    def _cache_get(self, room: str) -> Optional[dict]:
+        with self._cache_lock:
+            entry = self._cache.get(room)
+            if entry and entry[1] > time.monotonic():
+                return dict(entry[0])
+        return None
+    
+    def _cache_put(self, room: str, data: dict):
+        with self._cache_lock:
+            self._cache[room] = (dict(data), time.monotonic() + self.cache_ttl_seconds)
+    
+    def _load(self, room: str) -> Optional[dict]:
+        cached = self._cache_get(room)
+        if cached is not None:
+            return cached
+        db = SessionLocal()
+        try:
+            row = db.query(RoomEnergy).filter(RoomEnergy.room_id == room).first()
+            if not row:
+                return None
+            data = _room_to_dict(row)
+        finally:
+            db.close()
+        self._cache_put(room, data)
+        return dict(data)
+    
+    @contextmanager
+    def _locked_room(self, room: str, **defaults):
+        """Row-locked read-modify-write of a room, created with defaults if missing"""
+        db = SessionLocal()
+        try:
+            values = {
+                "mode": "manual",
+                "setpoint": 21.0,
+                "presence_timeout_minutes": 15,
+                "has_presence": True,
+                "last_presence_time": datetime.now(timezone.utc)
+            }
+            values.update(defaults)
+            values.setdefault("eco_setpoint", values["setpoint"] - 2)
+            values.setdefault("current_mode", values["mode"])
+            db.execute(
+                insert(RoomEnergy).values(room_id=room, **values)
+                .on_conflict_do_nothing(index_elements=["room_id"])
+            )
+            row = db.query(RoomEnergy).filter(RoomEnergy.room_id == room).with_for_update().one()
+            yield row
+            db.commit()
+            data = _room_to_dict(row)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        self._cache_put(room, data)
+        self._reschedule(room, data)
+        mqtt_service.publish_invalidation("energy", room)
+    
+    # ------------------------------------------------------------------
+    # Room energy management
+    # ------------------------------------------------------------------
     def initialize_room(self, room: str, mode: str = "manual", 
                        setpoint: float = 21.0, eco_setpoint: Optional[float] = None,
                        presence_timeout_minutes: int = 15):
@@ -26,154 +146,243 @@ class EnergyManager:
         if eco_setpoint is None:
             eco_setpoint = setpoint - 2  # Default eco mode is -2°C
         
-        self.room_configs[room] = {
+        config = {
             "mode": mode,
             "setpoint": setpoint,
             "eco_setpoint": eco_setpoint,
             "presence_timeout_minutes": presence_timeout_minutes
         }
-        
-        if room not in self.room_states:
-            self.room_states[room] = {
-                "current_mode": mode,
-                "has_presence": True,
-                "last_presence_time": datetime.utcnow()
-            }
+        # The state (current mode, presence) is only set when the room is created
+        with self._locked_room(room, **config) as row:
+            for key, value in config.items():
+                setattr(row, key, value)
         
         logger.info(f"Room {room} initialized: mode={mode}, setpoint={setpoint}°C, eco_setpoint={eco_setpoint}°C")
     
     def update_presence(self, room: str, has_presence: bool):
         """Update presence detection for a room"""
-        if room not in self.room_configs:
-            self.initialize_room(room)
-        
-        config = self.room_configs[room]
-        
-        if has_presence:
-            self.room_states[room]["has_presence"] = True
-            self.room_states[room]["last_presence_time"] = datetime.utcnow()
-            
-            # Si présence détectée ET mode configuré est ECO → passer en AUTO automatiquement
-            if config["mode"] == "eco" and self.room_states[room]["current_mode"] == "eco":
-                self.room_states[room]["current_mode"] = "auto"
-                logger.info(f"Room {room}: Présence détectée (OUI), passage automatique de ECO → AUTO")
-            # Sinon restaurer le mode configuré si on était en eco temporaire
-            elif config["mode"] != "manual" and self.room_states[room]["current_mode"] == "eco":
-                self.room_states[room]["current_mode"] = config["mode"]
-                logger.info(f"Room {room}: Présence détectée, restauration du mode {config['mode']}")
-        else:
-            self.room_states[room]["has_presence"] = False
-            logger.info(f"Room {room}: Pas de présence détectée")
+        with self._locked_room(room) as row:
+            if has_presence:
+                row.has_presence = True
+                row.last_presence_time = datetime.now(timezone.utc)
+                
+                # Si présence détectée ET mode configuré est ECO → passer en AUTO automatiquement
+                if row.mode == "eco" and row.current_mode == "eco":
+                    row.current_mode = "auto"
+                    logger.info(f"Room {room}: Présence détectée (OUI), passage automatique de ECO → AUTO")
+                # Sinon restaurer le mode configuré si on était en eco temporaire
+                elif row.mode != "manual" and row.current_mode == "eco":
+                    row.current_mode = row.mode
+                    logger.info(f"Room {room}: Présence détectée, restauration du mode {row.mode}")
+            else:
+                row.has_presence = False
+                logger.info(f"Room {room}: Pas de présence détectée")
+    
+    @staticmethod
+    def _eco_due(data: dict) -> bool:
+        """True if the room should auto-switch to eco mode (presence timeout exceeded)"""
+        # Only auto-switch if configured mode is not "manual"
+        if data["mode"] == "manual" or data["current_mode"] == "eco":
+            return False
+        if not data["last_presence_time"]:
+            return False
+        time_since_presence = datetime.now(timezone.utc) - data["last_presence_time"]
+        return time_since_presence > timedelta(minutes=data["presence_timeout_minutes"])
+    
+    @staticmethod
+    def _latest_presence_reading(db: Session, room: str, since: Optional[datetime]) -> Optional[datetime]:
+        """Time of the room's latest stored reading showing presence, if after `since`"""
+        present = or_(
+            and_(Sensor.type.in_(PRESENCE_SENSOR_TYPES), SensorData.value >= 0.5),
+            and_(
+                Sensor.type.in_(DISTANCE_SENSOR_TYPES),
+                SensorData.value > 0,
+                SensorData.value < settings.presence_distance_threshold_cm
+            )
+        )
+        query = db.query(func.max(SensorData.time)).join(Sensor, SensorData.sensor_id == Sensor.id).filter(
+            Sensor.location == room, present
+        )
+        if since is not None:
+            query = query.filter(SensorData.time > since)
+        return query.scalar()
+    
+    def _reschedule(self, room: str, data: dict):
+        """Arm (or cancel) the presence-timeout transition of a room"""
+        if data["mode"] == "manual" or data["current_mode"] == "eco" or not data["last_presence_time"]:
+            eco_scheduler.cancel(room)
+            return
+        due_at = data["last_presence_time"] + timedelta(minutes=data["presence_timeout_minutes"])
+        eco_scheduler.schedule(room, due_at)
     
     def check_auto_eco_mode(self, room: str) -> bool:
-        """Check if room should auto-switch to eco mode based on presence timeout"""
-        if room not in self.room_configs or room not in self.room_states:
+        """Switch a room to eco mode if its presence timeout is exceeded (fired by the eco scheduler)"""
+        # Always decide on fresh data: another worker may have seen presence
+        self.invalidate(room)
+        data = self._load(room)
+        if not data:
             return False
-        
-        config = self.room_configs[room]
-        state = self.room_states[room]
-        
-        # Only auto-switch if configured mode is not "manual"
-        if config["mode"] == "manual":
+        if not self._eco_due(data):
+            self._reschedule(room, data)
             return False
         
-        # Check if presence timeout exceeded
-        if state["last_presence_time"]:
-            timeout = config["presence_timeout_minutes"]
-            time_since_presence = datetime.utcnow() - state["last_presence_time"]
-            
-            if time_since_presence > timedelta(minutes=timeout):
-                # Auto-switch to eco mode
-                if state["current_mode"] != "eco":
-                    self.room_states[room]["current_mode"] = "eco"
-                    logger.info(f"Room {room}: No presence for {timeout}min, auto-switching to eco mode")
-                    return True
+        switched = False
+        with self._locked_room(room) as row:
+            # Presence writes are throttled (PRESENCE_REFRESH_INTERVAL): a
+            # presence reading stored since then, by any worker, still counts
+            seen = self._latest_presence_reading(object_session(row), room, row.last_presence_time)
+            if seen:
+                row.last_presence_time = seen
+            # Re-check under the row lock: another worker may have switched already
+            if self._eco_due(_room_to_dict(row)):
+                row.current_mode = "eco"
+                eco_setpoint = row.eco_setpoint
+                switched = True
+                logger.info(f"Room {room}: No presence for {row.presence_timeout_minutes}min, auto-switching to eco mode")
         
-        return False
+        if switched:
+            mqtt_service.publish(f"rooms/{room}/heating/mode", "eco", retain=True)
+            mqtt_service.publish(f"rooms/{room}/heating/setpoint", str(eco_setpoint), retain=True)
+        return switched
     
-    def get_room_state(self, room: str) -> dict:
-        """Get complete state for a room"""
-        if room not in self.room_configs:
-            self.initialize_room(room)
-        
-        # Check if auto eco-mode should be triggered
-        self.check_auto_eco_mode(room)
+    def handle_sensor_reading(self, room: str, sensor_type: str, value):
+        """Update presence from an ingested presence/ultrasonic reading"""
+        try:
+            if sensor_type in PRESENCE_SENSOR_TYPES:
+                present = float(value) >= 0.5
+            elif sensor_type in DISTANCE_SENSOR_TYPES:
+                present = 0 < float(value) < settings.presence_distance_threshold_cm
+            else:
+                return
+        except (TypeError, ValueError):
+            return
         
-        config = self.room_configs[room]
-        state = self.room_states[room]
+        # Only rooms under energy management
+        data = self._load(room)
+        if data is None:
+            return
         
+        now = datetime.now(timezone.utc)
+        if present:
+            fresh = data["last_presence_time"] and now - data["last_presence_time"] < PRESENCE_REFRESH_INTERVAL
+            if data["has_presence"] and data["current_mode"] != "eco" and fresh:
+                return
+            self.update_presence(room, True)
+        elif data["has_presence"]:
+            self.update_presence(room, False)
+    
+    def start_scheduler(self):
+        """Start the eco scheduler and arm every configured room"""
+        eco_scheduler.start(self.check_auto_eco_mode)
+        for room, data in self._load_all().items():
+            self._reschedule(room, data)
+    
+    def stop_scheduler(self):
+        eco_scheduler.stop()
+    
+    def _state_response(self, room: str, data: dict) -> dict:
         # Get effective setpoint based on current mode
-        effective_setpoint = config["setpoint"]
-        if state["current_mode"] == "eco":
-            effective_setpoint = config["eco_setpoint"]
+        effective_setpoint = data["setpoint"]
+        if data["current_mode"] == "eco":
+            effective_setpoint = data["eco_setpoint"]
         
         return {
             "room": room,
-            "mode": config["mode"],  # configured mode
-            "setpoint": config["setpoint"],
-            "eco_setpoint": config["eco_setpoint"],
-            "current_mode": state["current_mode"],  # actual current mode
-            "has_presence": state["has_presence"],
-            "last_presence_time": state["last_presence_time"],
-            "presence_timeout_minutes": config["presence_timeout_minutes"],
+            "mode": data["mode"],  # configured mode
+            "setpoint": data["setpoint"],
+            "eco_setpoint": data["eco_setpoint"],
+            "current_mode": data["current_mode"],  # actual current mode
+            "has_presence": data["has_presence"],
+            "last_presence_time": data["last_presence_time"],
+            "presence_timeout_minutes": data["presence_timeout_minutes"],
             "effective_setpoint": effective_setpoint
         }
     
+    def get_room_state(self, room: str) -> dict:
+        """Get complete state for a room"""
+        data = self._load(room)
+        if data is None:
+            self.initialize_room(room)
+            data = self._load(room)
+        
+        return self._state_response(room, data)
+    
     def set_room_mode(self, room: str, mode: str, setpoint: Optional[float] = None):
         """Set room heating mode"""
         if mode not in ["manual", "auto", "eco"]:
             raise ValueError(f"Invalid mode: {mode}. Must be 'manual', 'auto', or 'eco'")
         
-        if room not in self.room_configs:
-            self.initialize_room(room, mode=mode, setpoint=setpoint or 21.0)
-        
-        self.room_configs[room]["mode"] = mode
-        if setpoint is not None:
-            self.room_configs[room]["setpoint"] = setpoint
-        
-        # Reset current mode to configured mode when manually setting
-        self.room_states[room]["current_mode"] = mode
-        
-        logger.info(f"Room {room}: Mode set to {mode}, setpoint={self.room_configs[room]['setpoint']}°C")
+        with self._locked_room(room, mode=mode, setpoint=setpoint or 21.0) as row:
+            row.mode = mode
+            if setpoint is not None:
+                row.setpoint = setpoint
+            # Reset current mode to configured mode when manually setting
+            row.current_mode = mode
+            logger.info(f"Room {room}: Mode set to {mode}, setpoint={row.setpoint}°C")
     
     def set_eco_setpoint(self, room: str, eco_setpoint: float):
         """Set eco mode temperature"""
-        if room not in self.room_configs:
-            self.initialize_room(room)
-        
-        self.room_configs[room]["eco_setpoint"] = eco_setpoint
+        with self._locked_room(room) as row:
+            row.eco_setpoint = eco_setpoint
         logger.info(f"Room {room}: Eco setpoint set to {eco_setpoint}°C")
     
-    def detect_presence_from_sensors(self, db_session=None):
-        """Detect presence from movement sensors (ultrasonic/PIR)"""
+    # ------------------------------------------------------------------
+    # Legacy global heating state (/actuators/heating/*)
+    # ------------------------------------------------------------------
+    def get_heating_state(self) -> dict:
+        """Last global heating command: mode, setpoint, room"""
+        cached = self._cache_get(HEATING_KEY)
+        if cached is not None:
+            return cached
+        db = SessionLocal()
         try:
-            if not db_session:
-                db_session = SessionLocal()
-            
-            # Get all rooms currently configured
-            for room in list(self.room_configs.keys()):
-                # Check for recent sensor data from this room
-                # Look for ultrasonic or PIR sensors with recent readings
-                recent_threshold = datetime.utcnow() - timedelta(minutes=5)
-                
-                has_recent_data = db_session.query(Sensor).filter(
-                    Sensor.type.in_(["ultrasonic", "pir", "movement"]),
-                    Sensor.room_id == room,
-                    Sensor.last_reading_time >= recent_threshold
-                ).first()
-                
-                if has_recent_data:
-                    self.update_presence(room, True)
-                else:
-                    self.update_presence(room, False)
-                    
-        except Exception as e:
-            logger.error(f"Error detecting presence from sensors: {e}")
+            row = db.query(HeatingState).filter(HeatingState.id == 1).first()
+            data = {
+                "mode": row.mode if row else "manual",
+                "setpoint": row.setpoint if row else 21.0,
+                "room": row.room if row else None
+            }
+        finally:
+            db.close()
+        self._cache_put(HEATING_KEY, data)
+        return dict(data)
+    
+    def update_heating_state(self, **changes) -> dict:
+        """Persist changes (mode, setpoint, room) to the global heating state"""
+        db = SessionLocal()
+        try:
+            db.execute(
+                insert(HeatingState).values(id=1, mode="manual", setpoint=21.0)
+                .on_conflict_do_nothing(index_elements=["id"])
+            )
+            row = db.query(HeatingState).filter(HeatingState.id == 1).with_for_update().one()
+            for key, value in changes.items():
+                setattr(row, key, value)
+            db.commit()
+            data = {"mode": row.mode, "setpoint": row.setpoint, "room": row.room}
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        self._cache_put(HEATING_KEY, data)
+        mqtt_service.publish_invalidation("energy", HEATING_KEY)
+        return dict(data)
+    
+    def _load_all(self) -> Dict[str, dict]:
+        db = SessionLocal()
+        try:
+            rows = db.query(RoomEnergy).all()
+            rooms = {row.room_id: _room_to_dict(row) for row in rows}
+        finally:
+            db.close()
+        for room, data in rooms.items():
+            self._cache_put(room, data)
+        return rooms
     
     def get_all_rooms_state(self) -> dict:
-        """Get state for all configured rooms"""
-        return {room: self.get_room_state(room) for room in self.room_configs.keys()}
-
+        """Get state for all configured rooms (one query, refreshes the cache)"""
+        return {room: self._state_response(room, data) for room, data in self._load_all().items()}
 
 # Global instance
 energy_manager = EnergyManager()
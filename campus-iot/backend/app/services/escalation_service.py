@@ -0,0 +1,147 @@
+"""
+Alert escalation - Escalates unacknowledged rule alerts exactly when due
+
+Each open alert whose rule defines escalation_minutes/escalation_severity has
+one deadline in a DeadlineScheduler (min-heap): loaded from the database at
+startup, added when the alert is created, cancelled when it is acknowledged.
+Escalation no longer depends on new readings from the same sensor. Each
+process schedules every open alert; the alert row lock taken when escalating
+makes the escalation (new alert, webhook, broadcast) happen once.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import or_
+
+from db.database import SessionLocal
+from models.alert import Alert, AlertRule
+from services.active_alerts import active_alerts
+from services.eco_scheduler import DeadlineScheduler
+from services.webhook_service import dispatch_webhooks
+from services.websocket_manager import ws_manager
+
+logger = logging.getLogger(__name__)
+
+LOCKED_RETRY_SECONDS = 30
+
+
+def _naive_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=None) if value.tzinfo else value
+
+
+class AlertEscalator:
+    def __init__(self):
+        self._scheduler = DeadlineScheduler("alert-escalation")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Start the scheduler and arm every open escalatable alert"""
+        self._loop = loop
+        self._scheduler.start(self._escalate)
+        self.load_open_alerts()
+
+    def stop(self):
+        self._scheduler.stop()
+
+    def track(self, alert_id: int, created_at: Optional[datetime], escalation_minutes: Optional[int]):
+        """Schedule the escalation of a newly created rule alert"""
+        if not escalation_minutes:
+            return
+        created_at = _naive_utc(created_at) if created_at else datetime.utcnow()
+        self._scheduler.schedule(alert_id, created_at + timedelta(minutes=escalation_minutes))
+
+    def cancel(self, alert_id: int):
+        """Alert acknowledged (or deleted): it will not escalate"""
+        self._scheduler.cancel(alert_id)
+
+    def pending(self):
+        return self._scheduler.pending()
+
+    def load_open_alerts(self, rule_id: Optional[int] = None) -> int:
+        """(Re)arm open alerts from the database, optionally for one rule only"""
+        db = SessionLocal()
+        try:
+            query = db.query(Alert.id, Alert.created_at, AlertRule.escalation_minutes).join(
+                AlertRule, Alert.rule_id == AlertRule.id
+            ).filter(
+                Alert.is_acknowledged == False,
+                or_(Alert.escalation_level.is_(None), Alert.escalation_level < 1),
+                AlertRule.is_active == True,
+                AlertRule.escalation_minutes.isnot(None),
+                AlertRule.escalation_severity.isnot(None)
+            )
+            if rule_id is not None:
+                query = query.filter(Alert.rule_id == rule_id)
+            rows = query.all()
+        finally:
+            db.close()
+
+        for alert_id, created_at, escalation_minutes in rows:
+            self.track(alert_id, created_at, escalation_minutes)
+        return len(rows)
+
+    def _escalate(self, alert_id: int):
+        db = SessionLocal()
+        try:
+            # Every worker/replica schedules the open alerts: the row lock makes
+            # the check-and-escalate below run once. A locked row is being
+            # escalated (or acknowledged) elsewhere: look again shortly, in
+            # case that transaction rolls back.
+            alert = db.query(Alert).filter(Alert.id == alert_id).with_for_update(skip_locked=True).first()
+            if alert is None:
+                if db.query(Alert.id).filter(Alert.id == alert_id).first():
+                    self._scheduler.schedule(alert_id, datetime.utcnow() + timedelta(seconds=LOCKED_RETRY_SECONDS))
+                return
+            if alert.is_acknowledged or (alert.escalation_level or 0) >= 1:
+                return
+            rule = alert.rule
+            if not rule or not rule.is_active or not rule.escalation_minutes or not rule.escalation_severity:
+                return
+
+            # The rule may have been edited since the alert was scheduled
+            due_at = _naive_utc(alert.created_at) + timedelta(minutes=rule.escalation_minutes)
+            if due_at > datetime.utcnow():
+                self._scheduler.schedule(alert_id, due_at)
+                return
+
+            room_id = alert.sensor.location if alert.sensor else None
+            sensor_type = alert.sensor.type if alert.sensor else alert.type.rsplit("_", 1)[0]
+
+            alert.escalation_level = 1
+            escalated = Alert(
+                sensor_id=alert.sensor_id,
+                rule_id=rule.id,
+                type=f"{sensor_type}_escalation",
+                message=f"Escalade: {alert.message}",
+                severity=rule.escalation_severity,
+                escalation_level=1,
+                escalated_from_alert_id=alert.id
+            )
+            db.add(escalated)
+            db.commit()
+            active_alerts.add(escalated.id)
+            logger.info(f"Alert {alert.id} escalated to {escalated.severity} (alert {escalated.id})")
+
+            payload = {
+                "id": escalated.id,
+                "sensor_id": escalated.sensor_id,
+                "room_id": room_id,
+                "type": escalated.type,
+                "message": escalated.message,
+                "severity": escalated.severity,
+                "created_at": escalated.created_at.isoformat() if escalated.created_at else None,
+                "rule_id": escalated.rule_id,
+                "escalated_from_alert_id": escalated.escalated_from_alert_id
+            }
+            dispatch_webhooks(db, "alert.escalated", {k: v for k, v in payload.items() if k != "rule_id"})
+
+            if self._loop is not None and self._loop.is_running():
+                asyncio.run_coroutine_threadsafe(ws_manager.broadcast_alert(payload), self._loop)
+        finally:
+            db.close()
+
+
+# Singleton instance
+alert_escalator = AlertEscalator()
@@ -0,0 +1,71 @@
+"""
+Ingest deduplication - Drops MQTT redeliveries before they are stored
+
+- Retained messages replayed by the broker on (re)subscribe carry the last
+  value already stored before the reconnect.
+- QoS 1 duplicates are recognised by (device, sensor type, device timestamp,
+  value) in a bounded LRU; signed payloads by their exact bytes, so that a
+  redelivery is not reported as a replay attack.
+- Optional deadband: a reading within INGEST_DEADBAND[type] of the last
+  stored value of the same room/type is skipped, unless nothing was stored
+  for INGEST_DEADBAND_HEARTBEAT_SECONDS (sensors must keep looking online).
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from config import settings
+
+
+class IngestDeduplicator:
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[Hashable, None]" = OrderedDict()
+        # (room, sensor_type) -> (last stored value, monotonic time)
+        self._last_stored: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def seen(self, key: Hashable) -> bool:
+        """True if key was already seen recently (the key is recorded otherwise)"""
+        with self._lock:
+            if key in self._seen:
+                self._seen.move_to_end(key)
+                return True
+            self._seen[key] = None
+            if len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+            return False
+
+    def within_deadband(self, room_id: str, sensor_type: str, value: Any) -> bool:
+        """True if the reading can be skipped; records it as stored otherwise"""
+        band = settings.ingest_deadband.get(sensor_type)
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False
+        key = (room_id, sensor_type)
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_stored.get(key)
+            if (
+                band is not None and last is not None
+                and abs(value - last[0]) <= band
+                and now - last[1] < settings.ingest_deadband_heartbeat_seconds
+            ):
+                return True
+            self._last_stored[key] = (value, now)
+            return False
+
+    def duplicate_reason(self, device: str, sensor_type: str, room_id: str, value: Any,
+                         device_ts: Optional[int]) -> Optional[str]:
+        """"duplicate", "deadband" or None when the reading must be stored"""
+        if device_ts is not None and self.seen((device, sensor_type, device_ts, value)):
+            return "duplicate"
+        if settings.ingest_deadband and self.within_deadband(room_id, sensor_type, value):
+            return "deadband"
+        return None
+
+
+# Singleton instance
+ingest_dedup = IngestDeduplicator()
@@ -0,0 +1,232 @@
+"""
+Ingest workers - Sensor messages handled by N processes (INGEST_WORKERS > 0)
+
+The MQTT thread of the API process only parses/verifies messages and hands
+them to a worker process chosen by crc32(room, sensor_type), so every reading
+of a sensor goes to the same worker: its in-process state (latest reading
+time, alert groups) stays local and the readings are processed in order.
+Rule evaluation, anomaly detection and the database writes run in the
+workers, in parallel, without sharing the GIL.
+
+State that belongs to the API process (WebSocket clients, escalation
+scheduler, active alert index, Merkle batch, presence/eco scheduling) is
+relayed back through an event queue and applied there, as are the workers'
+counters, histograms and slow traces (every METRICS_RELAY_SECONDS) so
+/metrics and /traces/slow cover them. Messages are traced in the workers.
+The alert storm token bucket stays per worker; each one gets its share of
+ALERT_STORM_RATE_PER_MINUTE / ALERT_STORM_BURST (see alert_grouping).
+"""
+import asyncio
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from services.metrics import MQTT_MESSAGES, registry
+from services.tracing import slow_traces
+
+logger = logging.getLogger(__name__)
+
+METRICS_RELAY_SECONDS = 5
+LIVENESS_CHECK_SECONDS = 1
+
+
+def _relayed_calls() -> Dict[str, Tuple[Any, str]]:
+    """Calls made by handle_mqtt_readings that must run in the API process"""
+    from services.active_alerts import active_alerts
+    from services.energy_manager import energy_manager
+    from services.escalation_service import alert_escalator
+    from services.merkle_service import reading_anchor
+    from services.websocket_manager import ws_manager
+
+    return {
+        "broadcast": (ws_manager, "broadcast"),
+        "active_alert": (active_alerts, "add"),
+        "escalation": (alert_escalator, "track"),
+        "anchor": (reading_anchor, "add_reading"),
+        "presence": (energy_manager, "handle_sensor_reading"),
+    }
+
+
+def _relay_to_parent(events) -> None:
+    """In a worker: replace the relayed calls by messages to the API process"""
+    for name, (target, attr) in _relayed_calls().items():
+        if asyncio.iscoroutinefunction(getattr(target, attr)):
+            async def relay(*args, _name=name):
+                events.put((_name, args))
+        else:
+            def relay(*args, _name=name):
+                events.put((_name, args))
+        setattr(target, attr, relay)
+
+
+def _relay_metrics(events) -> None:
+    drained = registry.drain()
+    if drained:
+        events.put(("metrics", (drained,)))
+    traces = slow_traces.drain()
+    if traces:
+        events.put(("traces", (traces,)))
+
+
+def _worker_main(index: int, inbox, events) -> None:
+    """Worker process entry point: handle messages until None is received"""
+    import main as app_main
+    from services.mqtt_client import handle_traced
+
+    _relay_to_parent(events)
+    logger.info(f"Ingest worker {index} started")
+    relayed_at = time.monotonic()
+    while True:
+        try:
+            item = inbox.get(timeout=METRICS_RELAY_SECONDS)
+        except queue.Empty:
+            item = ()
+        if item is None:
+            break
+        if item:
+            handle_traced(app_main.handle_mqtt_readings, *item)
+        if time.monotonic() - relayed_at >= METRICS_RELAY_SECONDS:
+            _relay_metrics(events)
+            relayed_at = time.monotonic()
+    _relay_metrics(events)
+    logger.info(f"Ingest worker {index} stopped")
+
+
+class IngestWorkerPool:
+    def __init__(self):
+        self._context = multiprocessing.get_context("spawn")
+        self._inboxes: List[Any] = []
+        self._processes: List[Any] = []
+        self._events = None
+        self._handlers: Dict[str, Callable] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._relay_thread: Optional[threading.Thread] = None
+        self._running = False
+
+    @property
+    def size(self) -> int:
+        return len(self._processes)
+
+    def alive(self) -> int:
+        return sum(1 for process in self._processes if process.is_alive())
+
+    def start(self, workers: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self._loop = loop
+        self._events = self._context.Queue()
+        self._handlers = {
+            name: getattr(target, attr) for name, (target, attr) in _relayed_calls().items()
+        }
+        self._handlers["metrics"] = registry.merge
+        self._handlers["traces"] = slow_traces.merge
+        self._inboxes = [self._context.Queue(settings.ingest_worker_queue_size) for _ in range(workers)]
+        self._processes = [self._spawn(index) for index in range(workers)]
+        self._running = True
+        self._relay_thread = threading.Thread(target=self._relay_loop, name="ingest-relay", daemon=True)
+        self._relay_thread.start()
+        logger.info(f"Started {workers} ingest worker processes")
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, self._inboxes[index], self._events),
+            name=f"ingest-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        return process
+
+    @staticmethod
+    def shard(room_id: str, sensor_type: str, workers: int) -> int:
+        """Stable across processes and restarts (unlike hash())"""
+        return zlib.crc32(f"{room_id}|{sensor_type}".encode("utf-8")) % workers
+
+    def submit(self, topic: str, readings: List[tuple], retained: bool = False):
+        """MQTT message callback: queue the readings on their sensor's worker
+
+        A batch spanning several shards is split, one part per worker.
+        Blocks when a worker's queue is full, which slows down the MQTT
+        thread (and the broker) instead of buffering without limit; a part
+        still not queued after INGEST_WORKER_PUT_TIMEOUT_SECONDS (worker
+        stuck or restarting) is dropped and counted.
+        """
+        shards: Dict[int, List[tuple]] = {}
+        for reading in readings:
+            sensor_type, _, room_id, _ = reading
+            shards.setdefault(self.shard(room_id, sensor_type, len(self._inboxes)), []).append(reading)
+        for index, shard_readings in shards.items():
+            try:
+                self._inboxes[index].put(
+                    (topic, shard_readings, retained), timeout=settings.ingest_worker_put_timeout_seconds
+                )
+            except queue.Full:
+                MQTT_MESSAGES.inc(status="dropped")
+                logger.warning(f"Ingest worker {index} queue full, dropped {len(shard_readings)} readings from {topic}")
+
+    def _relay_loop(self):
+        checked_at = time.monotonic()
+        while self._running:
+            # Checked on a timer: under load the event queue is never empty
+            if time.monotonic() - checked_at >= LIVENESS_CHECK_SECONDS:
+                self._respawn_dead()
+                checked_at = time.monotonic()
+            try:
+                name, args = self._events.get(timeout=LIVENESS_CHECK_SECONDS)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            try:
+                self._apply(name, args)
+            except Exception as e:
+                logger.error(f"Ingest worker event {name} failed: {e}")
+
+    def _apply(self, name: str, args: tuple):
+        handler = self._handlers[name]
+        if name != "broadcast":
+            handler(*args)
+        elif self._loop is not None and self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(handler(*args), self._loop)
+
+    def _respawn_dead(self):
+        for index, process in enumerate(self._processes):
+            if self._running and not process.is_alive():
+                # New inbox: a killed worker may have died holding the old
+                # queue's lock; what it still held is lost
+                lost = self._inboxes[index].qsize()
+                logger.error(f"Ingest worker {index} exited ({process.exitcode}), restarting (~{lost} queued messages lost)")
+                self._inboxes[index] = self._context.Queue(settings.ingest_worker_queue_size)
+                self._processes[index] = self._spawn(index)
+
+    def stop(self, timeout: float = 30):
+        """Let the workers drain their queue (terminated after `timeout`)"""
+        self._running = False
+        for inbox in self._inboxes:
+            try:
+                inbox.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+        for index, process in enumerate(self._processes):
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Ingest worker {index} terminated with ~{self._inboxes[index].qsize()} queued messages")
+                process.terminate()
+        if self._relay_thread is not None:
+            self._relay_thread.join(timeout)
+        # Apply the events sent by the workers while they drained their queue
+        while True:
+            try:
+                self._apply(*self._events.get_nowait())
+            except queue.Empty:
+                break
+            except Exception as e:
+                logger.error(f"Ingest worker event failed: {e}")
+        logger.info("Ingest worker processes stopped")
+
+
+# Singleton instance
+ingest_workers = IngestWorkerPool()
@@ -0,0 +1,47 @@
+"""
+Latest readings - Newest stored reading time per sensor
+
+Readings carry the device timestamp when the payload has one, so a queued or
+replayed backlog can arrive after newer points. Only in-order readings update
+the "current" state (3D plan value, presence, live broadcast, anomaly window);
+late ones are stored and anchored at their own time. Each sensor is loaded
+from the database once, then tracked in memory.
+"""
+import threading
+from datetime import datetime
+from typing import Dict
+
+from sqlalchemy import func
+
+from models.sensor import SensorData
+
+
+class LatestReadingIndex:
+    def __init__(self):
+        self._latest: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, db, sensor_id: int, reading_time: datetime) -> bool:
+        """Record a stored reading; False if the sensor already has a newer one"""
+        with self._lock:
+            known = sensor_id in self._latest
+        if not known:
+            newest = db.query(func.max(SensorData.time)).filter(
+                SensorData.sensor_id == sensor_id
+            ).scalar()
+            with self._lock:
+                self._latest.setdefault(sensor_id, newest or reading_time)
+        with self._lock:
+            latest = self._latest[sensor_id]
+            if reading_time < latest:
+                return False
+            self._latest[sensor_id] = reading_time
+            return True
+
+    def forget(self, sensor_id: int):
+        with self._lock:
+            self._latest.pop(sensor_id, None)
+
+
+# Singleton instance
+latest_readings = LatestReadingIndex()
@@ -0,0 +1,211 @@
+"""
+Merkle anchoring - Sensor readings are batched per time window and anchored
+in one block whose data_hash is the Merkle root of the batch
+
+Per reading the ingest path only computes one leaf hash; the block itself is
+written once per window (no proof of work). Any anchored reading can then be
+proven with log2(n) sibling hashes.
+"""
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import desc, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from db.database import SessionLocal
+from models.blockchain import Block, MerkleLeaf
+from models.sensor import SensorData
+from services.security_service import SimpleBlockchain, ensure_genesis_block, HASH_VERSION_BINARY
+
+logger = logging.getLogger(__name__)
+
+# Domain separation between leaves and inner nodes (second-preimage protection)
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+BATCH_SENSOR_TYPE = "merkle_batch"
+
+
+def reading_leaf_hash(sensor_id: int, reading_time: datetime, value: float) -> str:
+    """Leaf hash of one sensor reading (time normalized to UTC)"""
+    if reading_time.tzinfo is None:
+        reading_time = reading_time.replace(tzinfo=timezone.utc)
+    canonical = f"{sensor_id}|{reading_time.astimezone(timezone.utc).isoformat()}|{float(value)!r}"
+    return hashlib.sha256(LEAF_PREFIX + canonical.encode()).hexdigest()
+
+
+def _hash_pair(left: str, right: str) -> str:
+    return hashlib.sha256(NODE_PREFIX + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def _next_level(level: List[str]) -> List[str]:
+    if len(level) % 2:
+        level = level + [level[-1]]
+    return [_hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+
+
+def merkle_root(leaves: List[str]) -> str:
+    if not leaves:
+        return "0" * 64
+    level = list(leaves)
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0]
+
+
+def merkle_proof(leaves: List[str], position: int) -> List[Dict[str, str]]:
+    """Sibling hashes from the leaf up to the root"""
+    proof = []
+    level = list(leaves)
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        sibling = position ^ 1
+        proof.append({"hash": level[sibling], "side": "left" if sibling < position else "right"})
+        level = _next_level(level)
+        position //= 2
+    return proof
+
+
+def verify_merkle_proof(leaf_hash: str, proof: List[Dict[str, str]], root: str) -> bool:
+    current = leaf_hash
+    for step in proof:
+        if step["side"] == "left":
+            current = _hash_pair(step["hash"], current)
+        else:
+            current = _hash_pair(current, step["hash"])
+    return current == root
+
+
+class ReadingAnchor:
+    """Collects reading leaves and anchors them as one block per batch"""
+
+    def __init__(self):
+        self._pending: List[Dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def add_reading(self, sensor_id: int, reading_time: datetime, value: float):
+        if not settings.blockchain_anchoring_enabled:
+            return
+        leaf = {
+            "sensor_id": sensor_id,
+            "reading_time": reading_time,
+            "leaf_hash": reading_leaf_hash(sensor_id, reading_time, value)
+        }
+        with self._lock:
+            self._pending.append(leaf)
+            full = len(self._pending) >= settings.blockchain_batch_max_readings
+        if full:
+            self.flush()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> Optional[Dict]:
+        """Anchor the pending readings in a new block; returns the block or None"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return None
+
+            db = SessionLocal()
+            try:
+                # Another worker may append a block concurrently (unique index)
+                for _ in range(3):
+                    try:
+                        return self._append_block(db, batch)
+                    except IntegrityError:
+                        db.rollback()
+                raise RuntimeError("could not obtain a block index")
+            except Exception as e:
+                logger.error(f"Merkle anchoring failed, batch kept for next flush: {e}")
+                with self._lock:
+                    self._pending[:0] = batch
+                return None
+            finally:
+                db.close()
+
+    def _append_block(self, db: Session, batch: List[Dict]) -> Dict:
+        last_block = db.query(Block).order_by(desc(Block.index)).first()
+        if last_block is None:
+            last_block = ensure_genesis_block(db)
+
+        root = merkle_root([leaf["leaf_hash"] for leaf in batch])
+        timestamp = datetime.now(timezone.utc)
+        header = {
+            "index": last_block.index + 1,
+            "timestamp": timestamp.isoformat(),
+            "data_hash": root,
+            "previous_hash": last_block.hash,
+            "nonce": 0
+        }
+        block = Block(
+            index=header["index"],
+            timestamp=timestamp,
+            sensor_type=BATCH_SENSOR_TYPE,
+            sensor_value=str(len(batch)),
+            data_hash=root,
+            previous_hash=last_block.hash,
+            hash=SimpleBlockchain.compute_hash(header, HASH_VERSION_BINARY),
+            nonce=0,
+            hash_version=HASH_VERSION_BINARY,
+            signature_valid=True
+        )
+        db.add(block)
+        db.flush()
+        db.execute(insert(MerkleLeaf), [
+            {**leaf, "block_index": block.index, "position": position}
+            for position, leaf in enumerate(batch)
+        ])
+        db.commit()
+        logger.info(f"Anchored {len(batch)} readings in block {block.index}")
+        return block.to_dict()
+
+
+def get_reading_proof(db: Session, sensor_id: int, reading_time: datetime) -> Optional[Dict]:
+    """Inclusion proof of a reading, or None if it has not been anchored"""
+    leaf = db.query(MerkleLeaf).filter(
+        MerkleLeaf.sensor_id == sensor_id,
+        MerkleLeaf.reading_time == reading_time
+    ).first()
+    if not leaf:
+        return None
+
+    block = db.query(Block).filter(Block.index == leaf.block_index).first()
+    leaves = [row.leaf_hash for row in db.query(MerkleLeaf.leaf_hash).filter(
+        MerkleLeaf.block_index == leaf.block_index
+    ).order_by(MerkleLeaf.position).all()]
+    proof = merkle_proof(leaves, leaf.position)
+
+    # The stored reading must still hash to the anchored leaf
+    reading = db.query(SensorData).filter(
+        SensorData.sensor_id == sensor_id,
+        SensorData.time == leaf.reading_time
+    ).first()
+    reading_matches = bool(reading) and reading_leaf_hash(sensor_id, reading.time, reading.value) == leaf.leaf_hash
+
+    return {
+        "sensor_id": sensor_id,
+        "reading_time": leaf.reading_time.isoformat(),
+        "value": reading.value if reading else None,
+        "reading_matches": reading_matches,
+        "leaf_hash": leaf.leaf_hash,
+        "position": leaf.position,
+        "block_index": leaf.block_index,
+        "block_hash": block.hash if block else None,
+        "merkle_root": block.data_hash if block else None,
+        "proof": proof,
+        "included": bool(block) and verify_merkle_proof(leaf.leaf_hash, proof, block.data_hash)
+    }
+
+
+# Singleton instance
+reading_anchor = ReadingAnchor()
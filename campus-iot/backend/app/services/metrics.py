@@ -0,0 +1,285 @@
+"""
+Metrics - In-process counters, gauges and histograms exposed on /metrics
+in the Prometheus text format (no client library needed)
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from services.tracing import span
+
+# Seconds; covers sub-millisecond stages up to slow exports
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def drain(self) -> Dict[Tuple[str, ...], float]:
+        """Values counted since the last drain (and reset them)"""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: Dict[Tuple[str, ...], float]):
+        with self._lock:
+            for key, amount in values.items():
+                self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    """Gauge set explicitly, or read from a callback at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                return [f"{self.name} {_format_value(self.callback())}"]
+            except Exception:
+                return []
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = ([0] * (len(self.buckets) + 1), [0.0])
+                self._values[key] = entry
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def drain(self) -> Dict[Tuple[str, ...], Tuple[List[int], List[float]]]:
+        """Observations since the last drain (and reset them)"""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]]):
+        with self._lock:
+            for key, (counts, total) in values.items():
+                entry = self._values.get(key)
+                if entry is None:
+                    entry = ([0] * (len(self.buckets) + 1), [0.0])
+                    self._values[key] = entry
+                for index, count in enumerate(counts):
+                    entry[0][index] += count
+                entry[1][0] += total[0]
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = (), callback: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames, callback))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def drain(self) -> Dict[str, Dict]:
+        """Counter and histogram values since the last drain, by metric name
+
+        Ingest worker processes send these to the API process, which merges
+        them into its own registry (gauges are not relayed).
+        """
+        drained = {}
+        for name, metric in list(self._metrics.items()):
+            if isinstance(metric, (Counter, Histogram)):
+                values = metric.drain()
+                if values:
+                    drained[name] = values
+        return drained
+
+    def merge(self, drained: Dict[str, Dict]):
+        for name, values in drained.items():
+            metric = self._metrics.get(name)
+            if isinstance(metric, (Counter, Histogram)):
+                metric.merge(values)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Singleton registry and the pipeline metrics
+registry = MetricsRegistry()
+
+MQTT_MESSAGES = registry.counter(
+    "campus_mqtt_messages_total", "MQTT messages by processing status", ["status"]
+)
+INGEST_MESSAGE_SECONDS = registry.histogram(
+    "campus_ingest_message_seconds", "Total time spent handling one sensor message"
+)
+INGEST_LATE_READINGS = registry.counter(
+    "campus_ingest_late_readings_total", "Readings stored with a device time older than the sensor's latest reading"
+)
+INGEST_STAGE_SECONDS = registry.histogram(
+    "campus_ingest_stage_seconds", "Time spent per ingest stage", ["stage"]
+)
+WS_SEND_SECONDS = registry.histogram(
+    "campus_websocket_send_seconds", "Time to send one WebSocket message to one client"
+)
+WS_SEND_ERRORS = registry.counter(
+    "campus_websocket_send_errors_total", "WebSocket sends that failed"
+)
+WEBHOOK_DELIVERIES = registry.counter(
+    "campus_webhook_deliveries_total", "Webhook delivery attempts", ["event", "status"]
+)
+WEBHOOK_SECONDS = registry.histogram(
+    "campus_webhook_delivery_seconds", "Webhook delivery latency"
+)
+JOB_SECONDS = registry.histogram(
+    "campus_background_job_seconds", "Duration of background jobs", ["job"]
+)
+JOB_FAILURES = registry.counter(
+    "campus_background_job_failures_total", "Background jobs that raised", ["job"]
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "campus_http_request_seconds", "HTTP request latency per route", ["method", "route", "status"]
+)
+ALERT_TRIGGERS = registry.counter(
+    "campus_alert_triggers_total", "Rule alert triggers by outcome (created, grouped, storm)", ["outcome"]
+)
+DB_QUERIES_PER_OPERATION = registry.histogram(
+    "campus_db_queries_per_operation", "SQL statements per HTTP request or MQTT message", ["kind", "name"],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233, 377)
+)
+DB_SECONDS_PER_OPERATION = registry.histogram(
+    "campus_db_seconds_per_operation", "Time spent in SQL per HTTP request or MQTT message", ["kind", "name"]
+)
+DB_SLOW_QUERIES = registry.counter(
+    "campus_db_slow_queries_total", "SQL statements slower than DB_SLOW_QUERY_MS"
+)
+
+
+@contextmanager
+def ingest_stage(stage: str):
+    """Time one stage of the MQTT ingest pipeline (and trace it when sampled)"""
+    with span(stage), INGEST_STAGE_SECONDS.time(stage=stage):
+        yield
+
+
+@contextmanager
+def timed_job(job: str):
+    """Time a background job (backup, export, anchoring...) and count failures"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        JOB_FAILURES.inc(job=job)
+        raise
+    finally:
+        JOB_SECONDS.observe(time.perf_counter() - start, job=job)
@@ -3,31 +3,95 @@ MQTT Client service for receiving sensor data
 """
 import json
 import logging
-from typing import Callable, Optional
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
 import paho.mqtt.client as mqtt
 from config import settings
+from services.metrics import MQTT_MESSAGES, INGEST_MESSAGE_SECONDS
+from services.security_service import ingest_verifier, EPOCH_MS_THRESHOLD
+from services.ingest_dedup import ingest_dedup
+from services.payload_parser import payload_parsers, topic_router
+from services.tracing import start_trace
+from services.query_stats import query_scope
 
 logger = logging.getLogger(__name__)
 
+# Internal topic used by API workers to invalidate each other's caches
+INVALIDATION_TOPIC = "backend/invalidate"
+
+
+def device_time(ts) -> Optional[datetime]:
+    """Reading time from a device/gateway epoch-ms timestamp
+    
+    None (server time is used) for uptime counters, invalid values and
+    timestamps further in the future than the allowed clock skew.
+    """
+    try:
+        ts = int(float(ts))
+    except (TypeError, ValueError):
+        return None
+    if ts < EPOCH_MS_THRESHOLD:
+        return None
+    if ts - time.time() * 1000 > settings.ingest_max_clock_skew_seconds * 1000:
+        return None
+    return datetime.fromtimestamp(ts / 1000, tz=timezone.utc)
+
+
+def handle_traced(callback: Callable, topic: str, readings: List[tuple], retained: bool = False):
+    """Run an ingest callback under the message's root trace, query scope and timer"""
+    sensor_type = readings[0][0] if len(readings) == 1 else "batch"
+    with start_trace("mqtt.message", topic=topic, sensor_type=sensor_type, readings=len(readings)), \
+            query_scope("mqtt", sensor_type), INGEST_MESSAGE_SECONDS.time():
+        callback(topic, readings, retained)
+
+
+def mqtt_client_id() -> str:
+    """MQTT client id of this instance (unique per replica and worker)"""
+    return settings.mqtt_client_id or f"campus-backend-{socket.gethostname()}-{os.getpid()}"
+
+
+def sensor_subscriptions() -> List[str]:
+    """Sensor topic filters, shared between replicas when a consumer group is set"""
+    topics = topic_router.subscriptions()
+    if settings.mqtt_shared_group:
+        return [f"$share/{settings.mqtt_shared_group}/{topic}" for topic in topics]
+    return topics
+
 
 class MQTTService:
     def __init__(self):
-        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.client_id = mqtt_client_id()
+        self.client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            client_id=self.client_id,
+            # Shared subscriptions are an MQTT v5 feature
+            protocol=mqtt.MQTTv5 if settings.mqtt_shared_group else mqtt.MQTTv311
+        )
         self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
         self.client.on_disconnect = self._on_disconnect
         self.message_callback: Optional[Callable] = None
+        self.trace_callback = True
         self.connected = False
+        # Cross-worker cache invalidation: namespace -> handler(key)
+        self.instance_id = uuid.uuid4().hex[:12]
+        self.invalidation_handlers: Dict[str, Callable[[str], None]] = {}
     
     def _on_connect(self, client, userdata, flags, reason_code, properties):
         if reason_code == 0:
             logger.info(f"Connected to MQTT broker at {settings.mqtt_broker}:{settings.mqtt_port}")
             self.connected = True
             # Subscribe to all sensor topics
-            # Format: campus/orion/sensors/#
-            topic = f"{settings.mqtt_topic_prefix}/sensors/#"
-            client.subscribe(topic)
-            logger.info(f"Subscribed to {topic}")
+            # Format: campus/orion/sensors/#, campus/orion/+/sensors/# ($share/<group>/...)
+            for topic in sensor_subscriptions():
+                client.subscribe(topic)
+                logger.info(f"Subscribed to {topic} as {self.client_id}")
+            # Cache invalidations must reach every instance: never shared
+            client.subscribe(f"{settings.mqtt_topic_prefix}/{INVALIDATION_TOPIC}/#", qos=1)
         else:
             logger.error(f"Failed to connect to MQTT broker: {reason_code}")
     
@@ -39,48 +103,96 @@ class MQTTService:
         try:
             topic = msg.topic
             payload = msg.payload.decode('utf-8')
+            if topic.startswith(f"{settings.mqtt_topic_prefix}/{INVALIDATION_TOPIC}/"):
+                self._handle_invalidation(topic, payload)
+                return
+            MQTT_MESSAGES.inc(status="received")
             logger.info(f"[MQTT] Received: {topic} = {payload}")
             
-            # Extract sensor type from topic
-            # Format: campus/orion/sensors/{TYPE}
-            parts = topic.split('/')
-            sensor_type = parts[-1] if len(parts) > 0 else "unknown"
+            # Retained value replayed on (re)subscribe: stored only if it was
+            # not before (published while the backend was down), see the callback
+            retained = bool(getattr(msg, "retain", False)) and settings.ingest_skip_retained
             
-            # Default values
-            room_id = "unknown"
-            value = 0
+            # Room/type from the topic layout (campus/orion/sensors/{TYPE},
+            # campus/orion/{ROOM}/sensors/{TYPE}), overridden by the payload
+            route = topic_router.route(topic)
             
-            # Parse the payload
-            try:
-                # Try to parse as JSON first (expected format: {"room": "X101", "value": 23.5})
-                data = json.loads(payload)
-                if isinstance(data, dict):
-                    # Extract room from JSON
-                    room_id = data.get('room', data.get('room_id', 'unknown'))
-                    # Extract value from JSON
-                    value = data.get('value', data.get('temperature', data.get('humidity', data.get('distance', 0))))
-                else:
-                    # JSON but not a dict (e.g., just a number)
-                    value = float(data)
-            except json.JSONDecodeError:
-                # Not JSON, try as plain number
-                try:
-                    value = float(payload)
-                except ValueError:
-                    value = payload
+            # QoS 1 redelivery of a signed payload (same bytes): not a replay attack
+            if "|sig:" in payload and ingest_dedup.seen((topic, payload)):
+                MQTT_MESSAGES.inc(status="duplicate")
+                return
+            
+            # Signed payloads (TYPE:VALUE|ts:...|sig:...) are verified before anything else
+            device = topic[len(settings.mqtt_topic_prefix) + 1:]
+            signed, status = ingest_verifier.verify(payload, device)
+            if status != "valid" and status != "unsigned":
+                MQTT_MESSAGES.inc(status="rejected")
+                logger.debug(f"[MQTT] Rejected {topic}: {status}")
+                return
+            
+            payload_format, readings = payload_parsers.parse(payload, route, signed)
             
-            logger.info(f"[MQTT] Room: {room_id}, Type: {sensor_type}, Value: {value}")
+            # Gateway batches (several readings) are handled as one unit
+            accepted = []
+            for reading in readings:
+                logger.info(f"[MQTT] Room: {reading.room_id}, Type: {reading.sensor_type}, Value: {reading.value} ({payload_format})")
+                duplicate = ingest_dedup.duplicate_reason(
+                    device, reading.sensor_type, reading.room_id, reading.value, reading.device_ts
+                )
+                if duplicate:
+                    MQTT_MESSAGES.inc(status=duplicate)
+                    logger.debug(f"[MQTT] Skipped {topic}: {duplicate}")
+                    continue
+                MQTT_MESSAGES.inc(status="parsed")
+                reading_time = device_time(reading.device_ts) if reading.device_ts is not None else None
+                accepted.append((reading.sensor_type, reading.value, reading.room_id, reading_time))
             
             # Call the callback if set
-            if self.message_callback:
-                self.message_callback(sensor_type, value, topic, room_id)
+            if accepted and self.message_callback:
+                if self.trace_callback:
+                    handle_traced(self.message_callback, topic, accepted, retained)
+                else:
+                    self.message_callback(topic, accepted, retained)
                 
         except Exception as e:
+            MQTT_MESSAGES.inc(status="failed")
             logger.error(f"Error processing MQTT message: {e}")
     
-    def set_message_callback(self, callback: Callable):
-        """Set callback function for incoming messages"""
+    def _handle_invalidation(self, topic: str, payload: str):
+        namespace = topic.rsplit('/', 1)[-1]
+        handler = self.invalidation_handlers.get(namespace)
+        if not handler:
+            return
+        try:
+            data = json.loads(payload)
+        except json.JSONDecodeError:
+            return
+        if data.get("origin") == self.instance_id:
+            return
+        handler(data.get("key"))
+
+    def register_invalidation_handler(self, namespace: str, handler: Callable[[str], None]):
+        """Call handler(key) when another worker invalidates `namespace`"""
+        self.invalidation_handlers[namespace] = handler
+
+    def publish_invalidation(self, namespace: str, key: Optional[str] = None):
+        """Tell the other API workers that a cached entry changed"""
+        if not self.connected:
+            # Other workers fall back on their cache TTL
+            return None
+        payload = json.dumps({"origin": self.instance_id, "key": key})
+        return self.publish(f"{INVALIDATION_TOPIC}/{namespace}", payload, qos=1)
+
+    def set_message_callback(self, callback: Callable, traced: bool = True):
+        """Set callback(topic, readings, retained) for incoming sensor messages
+
+        readings: list of (sensor_type, value, room_id, reading_time) tuples;
+        retained: replayed retained message, to skip if already stored.
+        traced=False when the callback only hands the readings over (ingest
+        workers trace them where they are handled).
+        """
         self.message_callback = callback
+        self.trace_callback = traced
     
     def connect(self):
         """Connect to MQTT broker"""
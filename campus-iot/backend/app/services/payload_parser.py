@@ -0,0 +1,227 @@
+"""
+Payload parsing - Topic router and parser registry for sensor messages
+
+Topic layouts (precompiled, first match wins; more via MQTT_TOPIC_LAYOUTS):
+- {prefix}/sensors/{type}          room in the payload (JSON, signed line)
+- {prefix}/{room}/sensors/{type}   gateway bridge, plain value
+
+Payload formats, picked from the first characters without trying json.loads
+on everything:
+- signed line   temperature:21.5|room:X101|ts:...|sig:...  (verified upstream)
+- JSON          {"room": "X101", "value": 21.5, "ts": ...}, a list of those
+                (each may carry its own "type"), or one room's measurements:
+                {"room": "X101", "ts": ..., "values": {"temperature": 21.5, "humidity": 40}}
+- plain number  21.5
+- CSV batch     temperature,21.5,1700000000000;humidity,40  (type,value[,ts[,room]])
+"""
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from config import settings
+
+NUMERIC_START = frozenset("+-.0123456789")
+BATCH_SEPARATORS = re.compile(r"[;\n]")
+
+
+class Route(NamedTuple):
+    room_id: str
+    sensor_type: str
+
+
+class Reading(NamedTuple):
+    room_id: str
+    sensor_type: str
+    value: Any
+    device_ts: Optional[Any] = None
+
+
+class TopicRouter:
+    DEFAULT_LAYOUTS = ("{prefix}/sensors/{type}", "{prefix}/{room}/sensors/{type}")
+
+    def __init__(self, max_cached: int = 4096):
+        self.max_cached = max_cached
+        self._layouts: List[str] = []
+        self._patterns: List[re.Pattern] = []
+        self._cache: Dict[str, Route] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def compile(layout: str) -> re.Pattern:
+        """"{prefix}/{room}/sensors/{type}" -> regex, one group per {placeholder}"""
+        pattern = re.escape(layout.replace("{prefix}", settings.mqtt_topic_prefix))
+        pattern = re.sub(r"\\\{(\w+)\\\}", r"(?P<\1>[^/]+)", pattern)
+        return re.compile(f"^{pattern}$")
+
+    def register(self, layout: str):
+        """Add a topic layout (checked after the ones already registered)"""
+        with self._lock:
+            self._layouts.append(layout)
+            self._patterns.append(self.compile(layout))
+            self._cache.clear()
+
+    def _ensure_layouts(self):
+        if not self._patterns:
+            for layout in (*self.DEFAULT_LAYOUTS, *settings.mqtt_topic_layouts):
+                self.register(layout)
+
+    def subscriptions(self) -> List[str]:
+        """MQTT topic filters covering every layout"""
+        self._ensure_layouts()
+        filters = []
+        for layout in self._layouts:
+            topic_filter = layout.replace("{prefix}", settings.mqtt_topic_prefix)
+            topic_filter = re.sub(r"\{\w+\}", "+", topic_filter)
+            if topic_filter.endswith("/+"):
+                topic_filter = topic_filter[:-2] + "/#"
+            if topic_filter not in filters:
+                filters.append(topic_filter)
+        return filters
+
+    def route(self, topic: str) -> Route:
+        """Room and sensor type of a topic (type = last segment if no layout matches)"""
+        route = self._cache.get(topic)
+        if route is not None:
+            return route
+        self._ensure_layouts()
+        route = Route("unknown", topic.rsplit("/", 1)[-1])
+        for pattern in self._patterns:
+            match = pattern.match(topic)
+            if match:
+                groups = match.groupdict()
+                route = Route(groups.get("room") or "unknown", groups.get("type") or route.sensor_type)
+                break
+        with self._lock:
+            if len(self._cache) >= self.max_cached:
+                self._cache.clear()
+            self._cache[topic] = route
+        return route
+
+
+# =============================================================================
+# PAYLOAD PARSERS
+# =============================================================================
+
+def _reading_from_dict(data: Dict, route: Route) -> Reading:
+    # Fallback keys are only looked up when the usual one is missing
+    room = data['room'] if 'room' in data else data.get('room_id', route.room_id)
+    if 'value' in data:
+        value = data['value']
+    else:
+        value = data.get('temperature', data.get('humidity', data.get('distance', 0)))
+    ts = data['ts'] if 'ts' in data else data.get('timestamp')
+    return Reading(room, data['type'] if 'type' in data else route.sensor_type, value, ts)
+
+
+def _readings_from_dict(data: Dict, route: Route) -> List[Reading]:
+    values = data.get('values')
+    if not isinstance(values, dict):
+        return [_reading_from_dict(data, route)]
+    # Several measurements of one room sharing the same timestamp
+    room = data['room'] if 'room' in data else data.get('room_id', route.room_id)
+    ts = data['ts'] if 'ts' in data else data.get('timestamp')
+    return [Reading(room, sensor_type, value, ts) for sensor_type, value in values.items()]
+
+
+def parse_signed(payload: str, route: Route, verified: Optional[Dict]) -> List[Reading]:
+    # Signed type and room are authenticated, the topic is not
+    return [Reading(
+        verified.get('room', route.room_id),
+        verified.get('type', route.sensor_type),
+        verified.get('value', 0),
+        verified.get('timestamp')
+    )]
+
+
+def parse_json(payload: str, route: Route, verified: Optional[Dict]) -> List[Reading]:
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return parse_legacy(payload, route, verified)
+    if isinstance(data, dict):
+        return _readings_from_dict(data, route)
+    if isinstance(data, list):
+        return [reading for item in data if isinstance(item, dict) for reading in _readings_from_dict(item, route)]
+    return [Reading(route.room_id, route.sensor_type, float(data))]
+
+
+def parse_number(payload: str, route: Route, verified: Optional[Dict]) -> List[Reading]:
+    try:
+        return [Reading(route.room_id, route.sensor_type, float(payload))]
+    except ValueError:
+        return parse_legacy(payload, route, verified)
+
+
+def parse_csv(payload: str, route: Route, verified: Optional[Dict]) -> List[Reading]:
+    readings = []
+    for row in BATCH_SEPARATORS.split(payload):
+        fields = [field.strip() for field in row.split(",")]
+        if len(fields) < 2 or not fields[0]:
+            continue
+        try:
+            value = float(fields[1])
+        except ValueError:
+            value = fields[1]
+        readings.append(Reading(
+            fields[3] if len(fields) > 3 and fields[3] else route.room_id,
+            fields[0],
+            value,
+            fields[2] if len(fields) > 2 and fields[2] else None
+        ))
+    return readings
+
+
+def parse_legacy(payload: str, route: Route, verified: Optional[Dict]) -> List[Reading]:
+    """Anything else: JSON scalar (true/false...), else the raw string"""
+    try:
+        value = float(json.loads(payload))
+    except (ValueError, TypeError):
+        value = payload
+    return [Reading(route.room_id, route.sensor_type, value)]
+
+
+def _is_signed(payload: str, verified: Optional[Dict]) -> bool:
+    return verified is not None
+
+
+def _is_json(payload: str, verified: Optional[Dict]) -> bool:
+    return payload[:1] in ("{", "[")
+
+
+def _is_number(payload: str, verified: Optional[Dict]) -> bool:
+    return payload[:1] in NUMERIC_START and "," not in payload and ";" not in payload
+
+
+def _is_csv(payload: str, verified: Optional[Dict]) -> bool:
+    return "," in payload
+
+
+Parser = Callable[[str, Route, Optional[Dict]], List[Reading]]
+
+
+class PayloadParserRegistry:
+    def __init__(self):
+        self._parsers: List[Tuple[str, Callable[[str, Optional[Dict]], bool], Parser]] = []
+
+    def register(self, name: str, detect: Callable[[str, Optional[Dict]], bool], parser: Parser):
+        """Add a payload format (detect is tried in registration order)"""
+        self._parsers.append((name, detect, parser))
+
+    def parse(self, payload: str, route: Route, verified: Optional[Dict] = None) -> Tuple[str, List[Reading]]:
+        """(format name, readings); verified is the checked signed payload, if any"""
+        if payload[-1:].isspace() or payload[:1].isspace():
+            payload = payload.strip()
+        for name, detect, parser in self._parsers:
+            if detect(payload, verified):
+                return name, parser(payload, route, verified)
+        return "legacy", parse_legacy(payload, route, verified)
+
+
+# Singleton instances
+topic_router = TopicRouter()
+payload_parsers = PayloadParserRegistry()
+payload_parsers.register("signed", _is_signed, parse_signed)
+payload_parsers.register("json", _is_json, parse_json)
+payload_parsers.register("number", _is_number, parse_number)
+payload_parsers.register("csv", _is_csv, parse_csv)
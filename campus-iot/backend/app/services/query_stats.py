@@ -0,0 +1,115 @@
+"""
+Query stats - Opt-in SQL instrumentation (DB_QUERY_STATS_ENABLED)
+
+Every statement executed on the engine is attributed to the current
+operation (an HTTP request or an MQTT message): query count and SQL time
+feed per-operation histograms, operations issuing more than
+DB_QUERY_WARN_COUNT statements are logged (N+1 patterns), and statements
+slower than DB_SLOW_QUERY_MS are logged with their parameters redacted.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from sqlalchemy import event
+
+from config import settings
+from services.metrics import DB_QUERIES_PER_OPERATION, DB_SECONDS_PER_OPERATION, DB_SLOW_QUERIES
+
+logger = logging.getLogger(__name__)
+
+_current_scope: ContextVar[Optional["QueryScope"]] = ContextVar("query_scope", default=None)
+_installed = False
+
+
+class QueryScope:
+    """SQL statements issued by one operation"""
+    __slots__ = ("kind", "name", "count", "seconds")
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+        self.count = 0
+        self.seconds = 0.0
+
+    def close(self):
+        DB_QUERIES_PER_OPERATION.observe(self.count, kind=self.kind, name=self.name)
+        DB_SECONDS_PER_OPERATION.observe(self.seconds, kind=self.kind, name=self.name)
+        if self.count > settings.db_query_warn_count:
+            logger.warning(
+                f"[DB] {self.kind} {self.name} issued {self.count} queries "
+                f"({self.seconds * 1000:.1f} ms in SQL)"
+            )
+
+
+@contextmanager
+def query_scope(kind: str, name: str = ""):
+    """Attribute the SQL executed inside the block to one operation
+
+    The scope name can be set once known (e.g. the route after routing).
+    Yields None when the instrumentation is not installed.
+    """
+    if not _installed:
+        yield None
+        return
+
+    scope = QueryScope(kind, name)
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+        scope.close()
+
+
+def redact_parameters(parameters: Any, executemany: bool = False) -> str:
+    """Parameter shape without the values (they may hold personal data)"""
+    if executemany and isinstance(parameters, (list, tuple)):
+        return f"<{len(parameters)} rows>"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: ?" for key in parameters) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join("?" for _ in parameters) + ")"
+    return "?" if parameters else ""
+
+
+def instrument_queries(engine, max_statement_length: int = 500):
+    """Hook the engine's cursor events; call once at startup"""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_stats_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_stats_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+
+        scope = _current_scope.get()
+        if scope is not None:
+            scope.count += 1
+            scope.seconds += elapsed
+
+        if elapsed * 1000 >= settings.db_slow_query_ms:
+            DB_SLOW_QUERIES.inc()
+            origin = f" [{scope.kind} {scope.name}]" if scope is not None else ""
+            logger.warning(
+                f"[DB] Slow query{origin} ({elapsed * 1000:.1f} ms): "
+                f"{' '.join(statement.split())[:max_statement_length]} "
+                f"params={redact_parameters(parameters, executemany)}"
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        conn = exception_context.connection
+        starts = conn.info.get("query_stats_start") if conn is not None else None
+        if starts:
+            starts.pop()
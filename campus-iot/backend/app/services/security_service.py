@@ -8,9 +8,20 @@ import hashlib
 import time
 import json
 import logging
-from datetime import datetime, timezone
-from typing import Optional, Tuple, List, Dict, Any
+import multiprocessing
+import os
+import struct
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple, List, Dict, Any, Callable, Iterable, Iterator
+from sqlalchemy import desc, func
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+
+from config import settings
+from models.blockchain import Block, ChainCheckpoint, SecurityAlert
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +31,40 @@ HMAC_SECRET_KEY = "campus-orion-iot-secret-2024"
 # Tolerance for timestamp validation (seconds)
 TIMESTAMP_TOLERANCE = 300  # 5 minutes
 
+# Blocks fetched per query when streaming the chain
+BLOCK_CHUNK_SIZE = 1000
+
+# Block hash schemes: 1 = sorted JSON of the header (blocks written before the
+# binary encoding, still verified as such), 2 = fixed-layout binary header
+HASH_VERSION_JSON = 1
+HASH_VERSION_BINARY = 2
+BLOCK_HASH_DOMAIN = b"campus-orion-block-v2"
+MAX_NONCE = 100000
+
+# index, timestamp (us since epoch), data_hash, previous_hash | nonce
+_HEADER_LAYOUT = struct.Struct(">qq32s32s")
+_NONCE_LAYOUT = struct.Struct(">Q")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _timestamp_micros(timestamp: str) -> int:
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - _EPOCH) // timedelta(microseconds=1)
+
+
+def _binary_prefix_hasher(block_data: Dict):
+    """sha256 state after the nonce-independent part of a v2 header"""
+    hasher = hashlib.sha256(BLOCK_HASH_DOMAIN)
+    hasher.update(_HEADER_LAYOUT.pack(
+        block_data["index"],
+        _timestamp_micros(block_data["timestamp"]),
+        bytes.fromhex(block_data["data_hash"]),
+        bytes.fromhex(block_data["previous_hash"])
+    ))
+    return hasher
+
 
 class HMACVerifier:
     """
@@ -128,72 +173,115 @@ class SimpleBlockchain:
         self.db = db
         self.difficulty = 2  # Number of leading zeros required
     
-    def compute_hash(self, block_data: Dict) -> str:
+    @staticmethod
+    def compute_hash(block_data: Dict, version: int = HASH_VERSION_JSON) -> str:
         """Compute SHA256 hash of block data"""
+        if version == HASH_VERSION_BINARY:
+            hasher = _binary_prefix_hasher(block_data)
+            hasher.update(_NONCE_LAYOUT.pack(block_data["nonce"]))
+            return hasher.hexdigest()
         block_string = json.dumps(block_data, sort_keys=True)
         return hashlib.sha256(block_string.encode()).hexdigest()
     
+    @classmethod
+    def block_hash(cls, block: Dict) -> Optional[str]:
+        """Recompute a stored block's hash with the scheme it was written with"""
+        try:
+            return cls.compute_hash(cls.block_header(block), block.get("hash_version") or HASH_VERSION_JSON)
+        except (ValueError, struct.error, TypeError):
+            # Fields that cannot be encoded (e.g. non-hex hash) never match
+            return None
+    
     def create_genesis_block(self) -> Dict:
         """Create the first block in the chain"""
         timestamp = datetime.now(timezone.utc).isoformat()
-        return {
+        header = {
             "index": 0,
             "timestamp": timestamp,
             "data_hash": "0" * 64,
+            "previous_hash": "0" * 64,
+            "nonce": 0
+        }
+        return {
+            **header,
             "sensor_type": "genesis",
             "sensor_value": "0",
-            "previous_hash": "0" * 64,
-            "nonce": 0,
-            "hash": self.compute_hash({
-                "index": 0,
-                "timestamp": timestamp,
-                "data_hash": "0" * 64,
-                "previous_hash": "0" * 64,
-                "nonce": 0
-            })
+            "hash_version": HASH_VERSION_BINARY,
+            "hash": self.compute_hash(header, HASH_VERSION_BINARY)
         }
     
     def mine_block(self, data: Dict, previous_hash: str, index: int) -> Dict:
         """
         Mine a new block with proof of work
+        The header prefix is hashed once; each attempt only copies the
+        hasher state and feeds the 8-byte nonce
         """
         # Hash the sensor data
         data_hash = hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
         
-        nonce = 0
         timestamp = datetime.now(timezone.utc).isoformat()
+        block_data = {
+            "index": index,
+            "timestamp": timestamp,
+            "data_hash": data_hash,
+            "previous_hash": previous_hash,
+            "nonce": 0
+        }
+        prefix = _binary_prefix_hasher(block_data)
+        target = "0" * self.difficulty
+        pack_nonce = _NONCE_LAYOUT.pack
         
-        while True:
-            block_data = {
-                "index": index,
-                "timestamp": timestamp,
-                "data_hash": data_hash,
-                "previous_hash": previous_hash,
-                "nonce": nonce
-            }
-            
-            block_hash = self.compute_hash(block_data)
+        # Safety limit: accept without full PoW for IoT efficiency
+        for nonce in range(MAX_NONCE + 1):
+            hasher = prefix.copy()
+            hasher.update(pack_nonce(nonce))
+            block_hash = hasher.hexdigest()
             
             # Check if hash meets difficulty requirement
-            if block_hash[:self.difficulty] == "0" * self.difficulty:
-                return {
-                    **block_data,
-                    "sensor_type": data.get("type", "unknown"),
-                    "sensor_value": str(data.get("value", "")),
-                    "hash": block_hash
-                }
-            
-            nonce += 1
+            if block_hash.startswith(target):
+                break
+        
+        return {
+            **block_data,
+            "nonce": nonce,
+            "sensor_type": data.get("type", "unknown"),
+            "sensor_value": str(data.get("value", "")),
+            "hash_version": HASH_VERSION_BINARY,
+            "hash": block_hash
+        }
+    
+    @staticmethod
+    def block_header(block: Dict) -> Dict:
+        """Fields covered by the block hash"""
+        return {
+            "index": block["index"],
+            "timestamp": block["timestamp"],
+            "data_hash": block["data_hash"],
+            "previous_hash": block["previous_hash"],
+            "nonce": block["nonce"]
+        }
+    
+    def verify_blocks(self, blocks: Iterable[Dict], previous: Optional[Dict] = None) -> Tuple[bool, str, int, Optional[Dict]]:
+        """
+        Verify blocks in index order, `previous` being the last block already trusted
+        Works on any iterable so the chain can be streamed from the database
+        Returns: (is_valid, message, blocks_verified, last_valid_block)
+        """
+        count = 0
+        for current in blocks:
+            if previous is not None:
+                # Verify previous hash link
+                if current["previous_hash"] != previous["hash"]:
+                    return False, f"Chain broken at block {current['index']}: previous_hash mismatch", count, previous
+                
+                # Verify block hash
+                if self.block_hash(current) != current["hash"]:
+                    return False, f"Chain corrupted at block {current['index']}: hash mismatch", count, previous
             
-            # Safety limit
-            if nonce > 100000:
-                # Accept without full PoW for IoT efficiency
-                return {
-                    **block_data,
-                    "sensor_type": data.get("type", "unknown"),
-                    "sensor_value": str(data.get("value", "")),
-                    "hash": block_hash
-                }
+            previous = current
+            count += 1
+        
+        return True, "Chain valid", count, previous
     
     def verify_chain(self, chain: List[Dict]) -> Tuple[bool, str]:
         """
@@ -203,28 +291,8 @@ class SimpleBlockchain:
         if not chain:
             return True, "Empty chain"
         
-        for i in range(1, len(chain)):
-            current = chain[i]
-            previous = chain[i - 1]
-            
-            # Verify previous hash link
-            if current["previous_hash"] != previous["hash"]:
-                return False, f"Chain broken at block {i}: previous_hash mismatch"
-            
-            # Verify block hash
-            block_data = {
-                "index": current["index"],
-                "timestamp": current["timestamp"],
-                "data_hash": current["data_hash"],
-                "previous_hash": current["previous_hash"],
-                "nonce": current["nonce"]
-            }
-            
-            computed_hash = self.compute_hash(block_data)
-            if computed_hash != current["hash"]:
-                return False, f"Chain corrupted at block {i}: hash mismatch"
-        
-        return True, "Chain valid"
+        is_valid, message, _, _ = self.verify_blocks(chain)
+        return is_valid, message
     
     def detect_tampering(self, chain: List[Dict], block_index: int, original_data: Dict) -> bool:
         """
@@ -241,8 +309,656 @@ class SimpleBlockchain:
         return block["data_hash"] != expected_hash
 
 
+# =============================================================================
+# CHAIN VERIFICATION (streamed, checkpointed)
+# =============================================================================
+
+def _block_row_to_dict(row) -> Dict:
+    return {
+        "index": row.index,
+        "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+        "data_hash": row.data_hash,
+        "previous_hash": row.previous_hash,
+        "nonce": row.nonce,
+        "hash_version": row.hash_version,
+        "hash": row.hash
+    }
+
+
+def _block_columns(db: Session):
+    return db.query(Block.index, Block.timestamp, Block.data_hash, Block.previous_hash, Block.nonce, Block.hash_version, Block.hash)
+
+
+def iter_block_chunks(db: Session, after_index: int = -1, chunk_size: int = BLOCK_CHUNK_SIZE) -> Iterator[List[Dict]]:
+    """Stream blocks with index > after_index in order, one chunk per query (keyset on index)"""
+    last_index = after_index
+    while True:
+        rows = _block_columns(db).filter(Block.index > last_index).order_by(Block.index).limit(chunk_size).all()
+        if rows:
+            yield [_block_row_to_dict(row) for row in rows]
+        if len(rows) < chunk_size:
+            return
+        last_index = rows[-1].index
+
+
+def iter_blocks(db: Session, after_index: int = -1, chunk_size: int = BLOCK_CHUNK_SIZE) -> Iterator[Dict]:
+    for chunk in iter_block_chunks(db, after_index, chunk_size):
+        yield from chunk
+
+
+def _save_checkpoint(db: Session, block: Dict, blocks_verified: int):
+    values = {"block_index": block["index"], "block_hash": block["hash"], "blocks_verified": blocks_verified}
+    db.execute(
+        insert(ChainCheckpoint).values(id=1, **values)
+        .on_conflict_do_update(index_elements=["id"], set_={**values, "verified_at": func.now()})
+    )
+    db.commit()
+
+
+def verify_chain_incremental(db: Session) -> Dict:
+    """
+    Verify only the blocks appended since the last checkpoint
+    The checkpoint block itself is re-hashed to detect it being rewritten;
+    older blocks are covered by audit_chain.
+    """
+    blockchain = SimpleBlockchain(db)
+    checkpoint = db.query(ChainCheckpoint).filter(ChainCheckpoint.id == 1).first()
+    previous = None
+    after_index = -1
+    already_verified = 0
+    
+    if checkpoint:
+        anchor = _block_columns(db).filter(Block.index == checkpoint.block_index).first()
+        if not anchor:
+            return {
+                "valid": False,
+                "message": f"Checkpoint block {checkpoint.block_index} is missing",
+                "blocks_verified": 0,
+                "last_block_index": checkpoint.block_index,
+                "checkpoint": checkpoint.to_dict()
+            }
+        previous = _block_row_to_dict(anchor)
+        anchor_rewritten = previous["hash"] != checkpoint.block_hash
+        if checkpoint.block_index > 0 and not anchor_rewritten:
+            anchor_rewritten = blockchain.block_hash(previous) != previous["hash"]
+        if anchor_rewritten:
+            return {
+                "valid": False,
+                "message": f"Chain corrupted at block {checkpoint.block_index}: checkpoint mismatch",
+                "blocks_verified": 0,
+                "last_block_index": checkpoint.block_index,
+                "checkpoint": checkpoint.to_dict()
+            }
+        after_index = checkpoint.block_index
+        already_verified = checkpoint.blocks_verified or 0
+    
+    is_valid, message, count, last = blockchain.verify_blocks(iter_blocks(db, after_index), previous)
+    
+    if last is None:
+        return {"valid": True, "message": "Blockchain is empty", "blocks_verified": 0, "last_block_index": None, "checkpoint": None}
+    
+    # Advance the checkpoint up to the last block that verified
+    if count:
+        _save_checkpoint(db, last, already_verified + count)
+        checkpoint = db.query(ChainCheckpoint).filter(ChainCheckpoint.id == 1).first()
+    
+    return {
+        "valid": is_valid,
+        "message": message,
+        "blocks_verified": count,
+        "total_verified": already_verified + count,
+        "last_block_index": last["index"],
+        "checkpoint": checkpoint.to_dict() if checkpoint else None
+    }
+
+
+def _verify_range(blocks: List[Dict], previous_hash: Optional[str]) -> Tuple[Optional[int], str, int]:
+    """
+    Verify one range of blocks (runs in a pool worker)
+    previous_hash is the hash of the block just before the range, None at genesis
+    Returns: (first_broken_index or None, message, blocks_verified)
+    """
+    for count, block in enumerate(blocks):
+        if previous_hash is not None:
+            if block["previous_hash"] != previous_hash:
+                return block["index"], f"Chain broken at block {block['index']}: previous_hash mismatch", count
+            if SimpleBlockchain.block_hash(block) != block["hash"]:
+                return block["index"], f"Chain corrupted at block {block['index']}: hash mismatch", count
+        previous_hash = block["hash"]
+    return None, "Chain valid", len(blocks)
+
+
+def audit_chain(
+    db: Session,
+    chunk_size: int = BLOCK_CHUNK_SIZE,
+    workers: int = 1,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> Dict:
+    """
+    Full audit from genesis: ranges of chunk_size blocks are streamed from the
+    database and hashed in parallel on a process pool. Each range carries the
+    hash of the block before it so links across range boundaries are checked too.
+    At most 2 ranges per worker are in memory at once. Results are consumed in
+    order, so the first failure seen is the first broken block of the chain.
+    The checkpoint is moved to the last block that verified.
+    """
+    total = db.query(func.count(Block.id)).scalar() or 0
+    verified = 0
+    last_good: Optional[Dict] = None
+    broken_index: Optional[int] = None
+    message = "Chain valid"
+    
+    def consume(range_blocks: List[Dict], result: Tuple[Optional[int], str, int]) -> bool:
+        nonlocal verified, last_good, broken_index, message
+        broken_index, range_message, count = result
+        verified += count
+        if count:
+            last_good = range_blocks[count - 1]
+        if progress:
+            progress(verified, total)
+        if broken_index is not None:
+            message = range_message
+            return False
+        return True
+    
+    chunks = iter_block_chunks(db, chunk_size=chunk_size)
+    previous_hash = None
+    
+    if workers <= 1:
+        for chunk in chunks:
+            if not consume(chunk, _verify_range(chunk, previous_hash)):
+                break
+            previous_hash = chunk[-1]["hash"]
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        in_flight = deque()
+        try:
+            for chunk in chunks:
+                in_flight.append((chunk, pool.submit(_verify_range, chunk, previous_hash)))
+                previous_hash = chunk[-1]["hash"]
+                if len(in_flight) >= workers * 2:
+                    chunk_done, future = in_flight.popleft()
+                    if not consume(chunk_done, future.result()):
+                        break
+            else:
+                while in_flight:
+                    chunk_done, future = in_flight.popleft()
+                    if not consume(chunk_done, future.result()):
+                        break
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+    
+    if last_good is None and broken_index is None:
+        db.query(ChainCheckpoint).delete()
+        db.commit()
+        return {"valid": True, "message": "Blockchain is empty", "blocks_verified": 0, "total_blocks": 0,
+                "first_broken_index": None, "last_block_index": None}
+    
+    if last_good is not None:
+        _save_checkpoint(db, last_good, verified)
+    return {
+        "valid": broken_index is None,
+        "message": message,
+        "blocks_verified": verified,
+        "total_blocks": total,
+        "first_broken_index": broken_index,
+        "last_block_index": last_good["index"] if last_good else None
+    }
+
+
+class ChainAuditor:
+    """
+    Runs audit_chain in a background thread with its own DB session
+    and keeps its progress so the API can poll it
+    
+    One audit at a time across API workers and replicas: the audit holds a
+    PostgreSQL advisory lock on a dedicated connection while it runs.
+    """
+    
+    LOCK_KEY = 0x61756469  # "audi"
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._status: Dict[str, Any] = {"state": "idle"}
+    
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._status)
+    
+    def _acquire_lock(self):
+        """Connection holding the audit lock, or None if another audit runs"""
+        from db.database import engine
+        
+        connection = engine.connect()
+        try:
+            acquired = connection.exec_driver_sql(f"SELECT pg_try_advisory_lock({self.LOCK_KEY})").scalar()
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return None
+        return connection
+    
+    def _release_lock(self, connection):
+        try:
+            connection.exec_driver_sql(f"SELECT pg_advisory_unlock({self.LOCK_KEY})")
+            connection.commit()
+        except Exception as e:
+            logger.error(f"Blockchain audit lock release failed: {e}")
+        finally:
+            connection.close()
+    
+    def start(self, chunk_size: int = BLOCK_CHUNK_SIZE, workers: int = 0) -> bool:
+        """Start a full audit; returns False if one is already running (any process)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return False
+            lock_connection = self._acquire_lock()
+            if lock_connection is None:
+                return False
+            # Never more processes than cores, whatever was asked
+            cpus = os.cpu_count() or 1
+            workers = min(workers or cpus, cpus)
+            self._status = {
+                "state": "running",
+                "started_at": datetime.utcnow().isoformat(),
+                "workers": workers,
+                "chunk_size": chunk_size,
+                "blocks_verified": 0,
+                "total_blocks": None
+            }
+            self._thread = threading.Thread(
+                target=self._run, args=(chunk_size, workers, lock_connection), name="chain-audit", daemon=True
+            )
+            self._thread.start()
+            return True
+    
+    def _progress(self, verified: int, total: int):
+        with self._lock:
+            self._status["blocks_verified"] = verified
+            self._status["total_blocks"] = total
+    
+    def _run(self, chunk_size: int, workers: int, lock_connection):
+        from db.database import SessionLocal
+        
+        db = SessionLocal()
+        try:
+            result = audit_chain(db, chunk_size=chunk_size, workers=workers, progress=self._progress)
+            update = {"state": "completed", "result": result}
+        except Exception as e:
+            logger.error(f"Blockchain audit failed: {e}")
+            update = {"state": "failed", "error": str(e)}
+        finally:
+            db.close()
+            self._release_lock(lock_connection)
+        with self._lock:
+            self._status.update(update, finished_at=datetime.utcnow().isoformat())
+
+
+# =============================================================================
+# INGEST VERIFICATION (signed MQTT payloads)
+# =============================================================================
+
+# Device timestamps above this are epoch milliseconds, below it device uptime (millis())
+EPOCH_MS_THRESHOLD = 10 ** 12
+
+# Rejection reason -> SecurityAlert type
+REJECTION_ALERT_TYPES = {
+    "invalid_signature": "invalid_signature",
+    "replay": "replay_attack",
+    "expired": "replay_attack",
+    "malformed": "malformed_payload",
+    "unsigned": "unsigned_payload",
+}
+
+
+class DeviceKeyCache:
+    """
+    Per-device HMAC keys (settings.hmac_device_keys, shared key otherwise)
+    The keyed hmac state is built once per device and copied per message
+    """
+    
+    def __init__(self, max_devices: int = 4096):
+        self.max_devices = max_devices
+        self._templates: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _template(self, device: str):
+        with self._lock:
+            template = self._templates.get(device)
+            if template is not None:
+                self._templates.move_to_end(device)
+                return template
+        key = settings.hmac_device_keys.get(device, HMAC_SECRET_KEY)
+        template = hmac.new(key.encode("utf-8"), digestmod=hashlib.sha256)
+        with self._lock:
+            self._templates[device] = template
+            while len(self._templates) > self.max_devices:
+                self._templates.popitem(last=False)
+        return template
+    
+    def verify(self, device: str, message: str, signature: str) -> bool:
+        mac = self._template(device).copy()
+        mac.update(message.encode("utf-8"))
+        return hmac.compare_digest(mac.hexdigest(), signature.strip().lower())
+    
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+class ReplayWindow:
+    """
+    Bounded per-device cache of recently accepted (type, timestamp) pairs
+    A message is a replay if it was already seen, or if it is older than
+    the newest timestamp of its device minus the window.
+    """
+    
+    def __init__(self, window_ms: int = TIMESTAMP_TOLERANCE * 1000, per_device: int = 256, max_devices: int = 4096):
+        self.window_ms = window_ms
+        self.per_device = per_device
+        self.max_devices = max_devices
+        self._devices: "OrderedDict[str, Tuple[int, deque, set]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def check_and_record(self, device: str, sensor_type: str, ts: int) -> Optional[str]:
+        """Returns the rejection reason, or None if the message is fresh"""
+        if ts >= EPOCH_MS_THRESHOLD and abs(time.time() * 1000 - ts) > self.window_ms:
+            return "expired"
+        
+        key = (sensor_type, ts)
+        with self._lock:
+            state = self._devices.get(device)
+            if state is None:
+                state = [ts, deque(), set()]
+                self._devices[device] = state
+                while len(self._devices) > self.max_devices:
+                    self._devices.popitem(last=False)
+            else:
+                self._devices.move_to_end(device)
+            
+            newest, order, seen = state
+            if key in seen:
+                return "replay"
+            if ts < newest - self.window_ms:
+                # Uptime counters restart from 0 when the device reboots
+                if ts >= EPOCH_MS_THRESHOLD or ts > self.window_ms:
+                    return "replay"
+                order.clear()
+                seen.clear()
+                newest = ts
+            
+            state[0] = max(newest, ts)
+            order.append(key)
+            seen.add(key)
+            if len(order) > self.per_device:
+                seen.discard(order.popleft())
+        return None
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, rate_per_second: float):
+        self.capacity = capacity
+        self.rate = rate_per_second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class SecurityAlertAggregator:
+    """
+    Security alerts deduplicated by (source, alert_type) and written periodically
+    
+    Occurrences are only counted in memory between flushes. On flush, an
+    unresolved alert of the same key seen within the window is updated
+    (occurrences, last_seen); otherwise a new row is created if the source's
+    token bucket allows it, else the occurrences are folded into its latest row.
+    A source without any alert yet takes from one global bucket instead: past
+    it, new sources are rolled into a single summary alert per type (source
+    "*"). New rows are the only ones broadcast, so rows and broadcasts stay
+    bounded whatever the rejected message rate and number of sources.
+    """
+    
+    OVERFLOW_SOURCE = "*"
+    
+    def __init__(self, max_pending: int = 10000, max_sources: int = 10000):
+        self.max_pending = max_pending
+        self.max_sources = max_sources
+        self._pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        # Shared by every source without an alert yet
+        self._new_sources: Optional[TokenBucket] = None
+        self._lock = threading.Lock()
+    
+    def record(self, source: str, alert_type: str, severity: str, description: str, raw_data: Optional[str] = None,
+               source_ip: Optional[str] = None):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            key = (source, alert_type)
+            if key not in self._pending and len(self._pending) >= self.max_pending:
+                key = (self.OVERFLOW_SOURCE, alert_type)
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = {
+                    "count": 1,
+                    "first_seen": now,
+                    "last_seen": now,
+                    "severity": severity,
+                    "description": description,
+                    "raw_data": raw_data[:500] if raw_data else None,
+                    "source_ip": source_ip
+                }
+            else:
+                entry["count"] += 1
+                entry["last_seen"] = now
+                if severity == "critical":
+                    entry["severity"] = severity
+    
+    def _take_token(self, source: str) -> bool:
+        bucket = self._buckets.get(source)
+        if bucket is None:
+            bucket = TokenBucket(settings.security_alert_burst, settings.security_alert_rate_per_minute / 60)
+            self._buckets[source] = bucket
+            while len(self._buckets) > self.max_sources:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(source)
+        return bucket.take()
+    
+    def _take_new_source_token(self) -> bool:
+        if self._new_sources is None:
+            self._new_sources = TokenBucket(settings.security_alert_burst, settings.security_alert_rate_per_minute / 60)
+        return self._new_sources.take()
+    
+    @staticmethod
+    def _latest(db: Session, source: str, alert_type: str) -> Optional[SecurityAlert]:
+        return db.query(SecurityAlert).filter(
+            SecurityAlert.source == source,
+            SecurityAlert.alert_type == alert_type,
+            SecurityAlert.resolved == False
+        ).order_by(desc(SecurityAlert.last_seen)).first()
+    
+    @staticmethod
+    def _create(db: Session, source: str, alert_type: str, entry: Dict[str, Any]) -> SecurityAlert:
+        alert = SecurityAlert(
+            alert_type=alert_type,
+            severity=entry["severity"],
+            description=entry["description"],
+            raw_data=entry["raw_data"],
+            source=source,
+            source_ip=entry["source_ip"],
+            occurrences=entry["count"],
+            first_seen=entry["first_seen"],
+            last_seen=entry["last_seen"]
+        )
+        db.add(alert)
+        return alert
+    
+    @staticmethod
+    def _fold(alert: SecurityAlert, entry: Dict[str, Any]):
+        alert.occurrences = (alert.occurrences or 1) + entry["count"]
+        alert.last_seen = entry["last_seen"]
+        if entry["severity"] == "critical":
+            alert.severity = "critical"
+    
+    @staticmethod
+    def _merge_overflow(overflow: Dict[str, Dict[str, Any]], alert_type: str, entry: Dict[str, Any], sources: int):
+        summary = overflow.get(alert_type)
+        if summary is None:
+            overflow[alert_type] = dict(entry, sources=sources)
+            return
+        summary["count"] += entry["count"]
+        summary["sources"] += sources
+        summary["first_seen"] = min(summary["first_seen"], entry["first_seen"])
+        summary["last_seen"] = max(summary["last_seen"], entry["last_seen"])
+        if entry["severity"] == "critical":
+            summary["severity"] = "critical"
+    
+    def flush(self, db: Session) -> List[Dict]:
+        """Write the pending occurrences; returns the alerts created (to broadcast)"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return []
+        
+        created = []
+        # Sources without an alert yet, past the global new-source bucket
+        overflow: Dict[str, Dict[str, Any]] = {}
+        window_start = datetime.now(timezone.utc) - timedelta(seconds=settings.security_alert_window_seconds)
+        for (source, alert_type), entry in pending.items():
+            if source == self.OVERFLOW_SOURCE:
+                self._merge_overflow(overflow, alert_type, entry, 0)
+                continue
+            latest = self._latest(db, source, alert_type)
+            if latest is None:
+                if self._take_new_source_token():
+                    created.append(self._create(db, source, alert_type, entry))
+                else:
+                    self._merge_overflow(overflow, alert_type, entry, 1)
+            elif (latest.last_seen and latest.last_seen >= window_start) or not self._take_token(source):
+                self._fold(latest, entry)
+            else:
+                created.append(self._create(db, source, alert_type, entry))
+        
+        # One summary alert per type for everything past the limits
+        for alert_type, entry in overflow.items():
+            latest = self._latest(db, self.OVERFLOW_SOURCE, alert_type)
+            in_window = latest is not None and latest.last_seen and latest.last_seen >= window_start
+            if latest is not None and (in_window or not self._take_token(self.OVERFLOW_SOURCE)):
+                self._fold(latest, entry)
+                continue
+            entry["description"] = (
+                f"{entry['count']} rejected MQTT messages ({alert_type}) from "
+                f"{entry['sources'] or 'many'} other sources (new-source alert limit reached)"
+            )
+            created.append(self._create(db, self.OVERFLOW_SOURCE, alert_type, entry))
+        db.commit()
+        return [alert.to_dict() for alert in created]
+
+
+class IngestVerifier:
+    """
+    Verifies signed sensor payloads (TYPE:VALUE|ts:TIMESTAMP[|dev:ID]|sig:SIGNATURE)
+    on the MQTT ingest path
+    """
+    
+    def __init__(self):
+        self.keys = DeviceKeyCache()
+        self.replay = ReplayWindow()
+        self.rejected: Dict[str, int] = {}
+        self.accepted_signed = 0
+        self.accepted_unsigned = 0
+    
+    def verify(self, raw_data: str, device: str) -> Tuple[Optional[Dict], str]:
+        """
+        Returns (parsed_data, status); status is "valid", "unsigned" (parsed_data
+        None, caller parses the legacy payload) or the rejection reason
+        """
+        if "|sig:" not in raw_data:
+            if settings.hmac_required:
+                return self._reject(device, "unsigned", raw_data)
+            self.accepted_unsigned += 1
+            return None, "unsigned"
+        
+        data_part, signature = raw_data.rsplit("|sig:", 1)
+        parsed = hmac_verifier._parse_data(data_part)
+        if not parsed or "timestamp" not in parsed:
+            return self._reject(device, "malformed", raw_data)
+        
+        # Rejections stay keyed by the topic: the dev field is not
+        # authenticated and must not let a sender create alert sources
+        signer = parsed.get("dev", device)
+        if not self.keys.verify(signer, data_part, signature):
+            return self._reject(device, "invalid_signature", raw_data, signer)
+        
+        reason = self.replay.check_and_record(signer, parsed.get("type", ""), parsed["timestamp"])
+        if reason:
+            return self._reject(device, reason, raw_data, signer)
+        
+        self.accepted_signed += 1
+        return parsed, "valid"
+    
+    def _reject(self, device: str, reason: str, raw_data: str, signer: Optional[str] = None) -> Tuple[None, str]:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        claimed = f" (dev {signer})" if signer and signer != device else ""
+        security_alerts.record(
+            device,
+            REJECTION_ALERT_TYPES.get(reason, reason),
+            "warning",
+            f"MQTT message from {device}{claimed} rejected ({reason})",
+            raw_data
+        )
+        return None, reason
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "accepted_signed": self.accepted_signed,
+            "accepted_unsigned": self.accepted_unsigned,
+            "rejected": dict(self.rejected)
+        }
+
+
 # Global instances
 hmac_verifier = HMACVerifier()
+chain_auditor = ChainAuditor()
+security_alerts = SecurityAlertAggregator()
+ingest_verifier = IngestVerifier()
+
+
+def ensure_genesis_block(db: Session) -> Block:
+    """Create genesis block if not exists"""
+    genesis = db.query(Block).filter(Block.index == 0).first()
+    if genesis:
+        return genesis
+    
+    genesis_data = SimpleBlockchain(db).create_genesis_block()
+    genesis = Block(
+        index=0,
+        timestamp=datetime.fromisoformat(genesis_data["timestamp"]),
+        sensor_type="genesis",
+        sensor_value="0",
+        data_hash=genesis_data["data_hash"],
+        previous_hash=genesis_data["previous_hash"],
+        hash=genesis_data["hash"],
+        nonce=0,
+        hash_version=genesis_data["hash_version"],
+        signature_valid=True
+    )
+    db.add(genesis)
+    db.commit()
+    db.refresh(genesis)
+    return genesis
 
 
 def verify_sensor_data(raw_data: str) -> Tuple[Optional[Dict], bool, str]:
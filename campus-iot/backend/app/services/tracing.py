@@ -0,0 +1,151 @@
+"""
+Tracing - In-process span recorder for the ingest pipeline
+
+A sampled MQTT message opens a root span; ingest stages and every SQL
+statement executed meanwhile become child spans. When the root exceeds the
+latency budget its whole span tree is logged and kept for /traces/slow.
+Unsampled messages only pay for a context variable lookup per span.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "attributes", "start", "end", "children")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.children: List["Span"] = []
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def to_dict(self, origin: Optional[float] = None) -> Dict[str, Any]:
+        origin = self.start if origin is None else origin
+        return {
+            "name": self.name,
+            "offset_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "children": [child.to_dict(origin) for child in self.children]
+        }
+
+
+class SlowTraceLog:
+    """Last slow traces, newest first"""
+
+    def __init__(self, max_traces: int = 50):
+        self._traces = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+
+    def add(self, trace: Dict[str, Any]):
+        with self._lock:
+            self._traces.appendleft(trace)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._traces)
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Traces recorded since the last drain, newest first (and forget them)"""
+        with self._lock:
+            traces = list(self._traces)
+            self._traces.clear()
+        return traces
+
+    def merge(self, traces: List[Dict[str, Any]]):
+        """Add traces drained from another process (ingest workers)"""
+        with self._lock:
+            self._traces.extendleft(reversed(traces))
+
+
+slow_traces = SlowTraceLog()
+
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    """Root span, sampled with settings.tracing_sample_rate"""
+    if (
+        not settings.tracing_enabled
+        or _current_span.get() is not None
+        or random.random() >= settings.tracing_sample_rate
+    ):
+        yield None
+        return
+
+    root = Span(name, attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    finally:
+        root.end = time.perf_counter()
+        _current_span.reset(token)
+        if root.duration_ms >= settings.tracing_slow_ms:
+            trace = {"recorded_at": time.time(), **root.to_dict()}
+            slow_traces.add(trace)
+            logger.warning(f"[TRACE] Slow {name} ({root.duration_ms:.1f} ms): {json.dumps(trace, default=str)}")
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child span of the current trace (no-op outside a sampled trace)"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name, attributes)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def instrument_engine(engine, max_statement_length: int = 200):
+    """Record every SQL statement executed inside a trace as a db.query span"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        parent = _current_span.get()
+        if parent is None:
+            return
+        child = Span("db.query", {"statement": statement[:max_statement_length]})
+        parent.children.append(child)
+        conn.info.setdefault("trace_spans", []).append(child)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans:
+            spans.pop().end = time.perf_counter()
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        conn = exception_context.connection
+        spans = conn.info.get("trace_spans") if conn is not None else None
+        if spans:
+            failed = spans.pop()
+            failed.end = time.perf_counter()
+            failed.attributes["error"] = type(exception_context.original_exception).__name__
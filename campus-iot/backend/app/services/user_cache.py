@@ -0,0 +1,75 @@
+"""
+User display-name cache
+
+Shared by the auth layer (which primes it with the authenticated user and
+invalidates it on profile/role changes) and the listing endpoints that need
+to resolve user ids to names in bulk.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable
+
+from models.user import User
+
+
+class UserNameCache:
+    def __init__(self, max_size: int = 1024, ttl_seconds: int = 300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def display_name(user: User) -> str:
+        return f"{user.first_name} {user.last_name}"
+
+    def remember(self, user: User):
+        """Store (or refresh) the display name of a loaded user"""
+        if user is None or user.id is None:
+            return
+        self._set(user.id, self.display_name(user))
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_names(self, db, user_ids: Iterable[int]) -> Dict[int, str]:
+        """Resolve user ids to display names with at most one query"""
+        wanted = {uid for uid in user_ids if uid is not None}
+        names: Dict[int, str] = {}
+        now = time.monotonic()
+
+        with self._lock:
+            for uid in wanted:
+                entry = self._entries.get(uid)
+                if entry and entry[1] > now:
+                    names[uid] = entry[0]
+                    self._entries.move_to_end(uid)
+
+        missing = wanted - names.keys()
+        if missing:
+            rows = db.query(User.id, User.first_name, User.last_name).filter(
+                User.id.in_(missing)
+            ).all()
+            for row in rows:
+                name = f"{row.first_name} {row.last_name}"
+                names[row.id] = name
+                self._set(row.id, name)
+
+        return names
+
+    def _set(self, user_id: int, name: str):
+        with self._lock:
+            self._entries[user_id] = (name, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+# Singleton instance
+user_name_cache = UserNameCache()
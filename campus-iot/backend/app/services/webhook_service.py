@@ -5,9 +5,12 @@ import hmac
 import hashlib
 import json
 import logging
+import time
 from typing import List, Dict
 import httpx
 
+from services.metrics import WEBHOOK_DELIVERIES, WEBHOOK_SECONDS
+
 from models.integration import WebhookEndpoint
 
 logger = logging.getLogger(__name__)
@@ -70,12 +73,14 @@ def send_webhook(endpoint: WebhookEndpoint, event_type: str, payload: Dict):
     if endpoint.secret:
         headers["X-Campus-Signature"] = _sign_payload(endpoint.secret, payload)
 
+    start = time.perf_counter()
     try:
         json_payload = payload
         if "discord.com/api/webhooks" in endpoint.url:
             json_payload = _discord_payload(event_type, payload)
         with httpx.Client(timeout=5.0) as client:
             response = client.post(endpoint.url, json=json_payload, headers=headers)
+            WEBHOOK_DELIVERIES.inc(event=event_type, status="failed" if response.status_code >= 400 else "delivered")
             if response.status_code >= 400:
                 logger.warning(
                     "Webhook delivery failed (%s) for %s: %s",
@@ -84,8 +89,11 @@ def send_webhook(endpoint: WebhookEndpoint, event_type: str, payload: Dict):
                     response.text
                 )
     except Exception as exc:
+        WEBHOOK_DELIVERIES.inc(event=event_type, status="error")
         logger.exception("Webhook delivery error for %s: %s", endpoint.url, exc)
         return
+    finally:
+        WEBHOOK_SECONDS.observe(time.perf_counter() - start)
 
 
 def dispatch_webhooks(db, event_type: str, payload: Dict):
@@ -3,9 +3,12 @@ WebSocket manager for real-time updates
 """
 import json
 import logging
+import time
 from typing import List, Dict, Any
 from fastapi import WebSocket
 
+from services.metrics import WS_SEND_SECONDS, WS_SEND_ERRORS
+
 logger = logging.getLogger(__name__)
 
 
@@ -37,9 +40,12 @@ class WebSocketManager:
         """Broadcast a message to all connected clients"""
         disconnected = []
         for connection in self.active_connections:
+            start = time.perf_counter()
             try:
                 await connection.send_json(message)
+                WS_SEND_SECONDS.observe(time.perf_counter() - start)
             except Exception as e:
+                WS_SEND_ERRORS.inc()
                 logger.error(f"Error broadcasting to client: {e}")
                 disconnected.append(connection)
         
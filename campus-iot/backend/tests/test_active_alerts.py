@@ -0,0 +1,43 @@
+from models import Sensor
+from models.alert import Alert
+
+
+def test_count_follows_alerts_created_by_another_worker(db, room_id, monkeypatch):
+    from services import active_alerts as active_alerts_module
+    from services.active_alerts import ActiveAlertIndex
+
+    handlers = []
+    monkeypatch.setattr(
+        active_alerts_module.mqtt_service, "register_invalidation_handler",
+        lambda namespace, handler: handlers.append(handler)
+    )
+    this_worker, other_worker = ActiveAlertIndex(), ActiveAlertIndex()
+    # Invalidations reach the other worker only (like the MQTT topic)
+    monkeypatch.setattr(
+        active_alerts_module.mqtt_service, "publish_invalidation",
+        lambda namespace, key=None: handlers[1](key)
+    )
+    before = this_worker.count(db)
+    assert other_worker.count(db) == before
+
+    sensor = Sensor(name=f"temperature-{room_id}", type="temperature", location=room_id)
+    db.add(sensor)
+    db.flush()
+    alert = Alert(sensor_id=sensor.id, type="temperature_high", message="Trop chaud")
+    db.add(alert)
+    db.commit()
+    try:
+        this_worker.add(alert.id)
+        # Counted locally, without a query
+        assert this_worker.count(None) == before + 1
+        assert other_worker.count(db) == before + 1
+
+        alert.is_acknowledged = True
+        db.commit()
+        this_worker.discard([alert.id])
+        assert this_worker.count(db) == before
+        assert other_worker.count(db) == before
+    finally:
+        db.delete(alert)
+        db.delete(sensor)
+        db.commit()
@@ -0,0 +1,14 @@
+from models.user import ActivityLog
+
+
+def test_create_log_returns_single_entry(client, db, user):
+    response = client.post("/api/activity/log", json={"action": "login", "details": "test"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert isinstance(body, dict)
+    assert body["action"] == "login"
+    assert body["user_id"] == user.id
+
+    db.query(ActivityLog).filter(ActivityLog.id == body["id"]).delete()
+    db.commit()
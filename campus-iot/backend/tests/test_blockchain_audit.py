@@ -0,0 +1,16 @@
+def test_audit_requires_an_admin():
+    from fastapi.testclient import TestClient
+    import main
+
+    assert TestClient(main.app).post("/api/security/blockchain/audit").status_code == 401
+
+
+def test_audit_running_in_another_process_is_rejected(db_engine):
+    from services.security_service import ChainAuditor
+
+    other_process = ChainAuditor()._acquire_lock()
+    assert other_process is not None
+    try:
+        assert ChainAuditor().start() is False
+    finally:
+        ChainAuditor()._release_lock(other_process)
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models import Sensor, SensorData
+from models.energy import RoomEnergy
+
+
+@pytest.fixture
+def energy_room(db, room_id):
+    from services.energy_manager import energy_manager
+
+    energy_manager.initialize_room(room_id, mode="auto", presence_timeout_minutes=15)
+    yield room_id
+    energy_manager.invalidate(room_id)
+    db.query(RoomEnergy).filter(RoomEnergy.room_id == room_id).delete(synchronize_session=False)
+    db.commit()
+
+
+def _set_last_presence(db, room_id, minutes_ago):
+    db.query(RoomEnergy).filter(RoomEnergy.room_id == room_id).update(
+        {"last_presence_time": datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)}
+    )
+    db.commit()
+
+
+def test_presence_times_are_timezone_aware(energy_room):
+    from services.energy_manager import energy_manager
+
+    energy_manager.update_presence(energy_room, True)
+    state = energy_manager.get_room_state(energy_room)
+
+    assert state["last_presence_time"].tzinfo is not None
+    assert datetime.now(timezone.utc) - state["last_presence_time"] < timedelta(minutes=1)
+
+
+def test_room_switches_to_eco_after_presence_timeout(db, energy_room):
+    from services.energy_manager import energy_manager
+
+    _set_last_presence(db, energy_room, minutes_ago=20)
+
+    assert energy_manager.check_auto_eco_mode(energy_room) is True
+    assert energy_manager.get_room_state(energy_room)["current_mode"] == "eco"
+
+
+def test_presence_stored_by_another_worker_prevents_eco(db, energy_room):
+    from services.energy_manager import energy_manager
+
+    _set_last_presence(db, energy_room, minutes_ago=20)
+    # Presence handled elsewhere, not yet written to the room (throttled)
+    sensor = Sensor(name=f"presence-{energy_room}", type="presence", location=energy_room)
+    db.add(sensor)
+    db.flush()
+    db.add(SensorData(sensor_id=sensor.id, value=1, time=datetime.now(timezone.utc) - timedelta(minutes=2)))
+    db.commit()
+    try:
+        assert energy_manager.check_auto_eco_mode(energy_room) is False
+        state = energy_manager.get_room_state(energy_room)
+        assert state["current_mode"] == "auto"
+        assert datetime.now(timezone.utc) - state["last_presence_time"] < timedelta(minutes=3)
+    finally:
+        db.query(SensorData).filter(SensorData.sensor_id == sensor.id).delete(synchronize_session=False)
+        db.delete(sensor)
+        db.commit()
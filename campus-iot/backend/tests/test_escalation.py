@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from db.database import SessionLocal
+from models import Sensor
+from models.alert import Alert, AlertRule
+
+
+@pytest.fixture
+def overdue_alert(db, room_id):
+    """Open rule alert whose escalation deadline has passed"""
+    sensor = Sensor(name=f"temperature-{room_id}", type="temperature", location=room_id)
+    db.add(sensor)
+    db.flush()
+    rule = AlertRule(
+        name="test escalation", sensor_id=sensor.id, condition=">", threshold=30,
+        is_active=True, escalation_minutes=1, escalation_severity="critical"
+    )
+    db.add(rule)
+    db.flush()
+    alert = Alert(
+        sensor_id=sensor.id, rule_id=rule.id, type="temperature_high", message="Trop chaud",
+        created_at=datetime.now(timezone.utc) - timedelta(minutes=5)
+    )
+    db.add(alert)
+    db.commit()
+    yield alert
+    db.rollback()
+    db.query(Alert).filter(Alert.sensor_id == sensor.id).delete(synchronize_session=False)
+    db.query(AlertRule).filter(AlertRule.id == rule.id).delete(synchronize_session=False)
+    db.query(Sensor).filter(Sensor.id == sensor.id).delete(synchronize_session=False)
+    db.commit()
+
+
+def _escalations(db, alert_id):
+    db.expire_all()
+    return db.query(Alert).filter(Alert.escalated_from_alert_id == alert_id).count()
+
+
+def test_locked_alert_is_escalated_once(db, overdue_alert, monkeypatch):
+    from services import escalation_service
+    from services.escalation_service import AlertEscalator
+
+    # No deliveries to the webhooks configured in the database
+    webhooks = []
+    monkeypatch.setattr(escalation_service, "dispatch_webhooks", lambda db, event, payload: webhooks.append(event))
+
+    escalator = AlertEscalator()
+    other_worker = SessionLocal()
+    try:
+        # Another process is escalating this alert: skip it
+        other_worker.query(Alert).filter(Alert.id == overdue_alert.id).with_for_update().one()
+        escalator._escalate(overdue_alert.id)
+        assert _escalations(db, overdue_alert.id) == 0
+        assert overdue_alert.id in escalator.pending()
+    finally:
+        other_worker.rollback()
+        other_worker.close()
+
+    # Lock released without escalating (rolled back): the retry escalates it
+    escalator._escalate(overdue_alert.id)
+    escalator._escalate(overdue_alert.id)
+    assert _escalations(db, overdue_alert.id) == 1
+    assert webhooks == ["alert.escalated"]
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models import Sensor, SensorData
+from models.settings import PlacedSensor
+
+
+class FakeMessage:
+    def __init__(self, topic: str, payload: str):
+        self.topic = topic
+        self.payload = payload.encode("utf-8")
+        self.retain = False
+
+
+@pytest.fixture
+def ingest(db_engine):
+    """Feed an MQTT message through parsing and handle_mqtt_readings"""
+    import main
+    from services import mqtt_service
+
+    previous = mqtt_service.message_callback
+    mqtt_service.set_message_callback(main.handle_mqtt_readings)
+    yield lambda topic, payload: mqtt_service._on_message(None, None, FakeMessage(topic, payload))
+    mqtt_service.set_message_callback(previous)
+
+
+@pytest.fixture
+def cleanup_room(db, room_id):
+    yield
+    sensor_ids = [s.id for s in db.query(Sensor.id).filter(Sensor.location == room_id)]
+    db.query(SensorData).filter(SensorData.sensor_id.in_(sensor_ids)).delete(synchronize_session=False)
+    db.query(PlacedSensor).filter(PlacedSensor.room_id == room_id).delete(synchronize_session=False)
+    db.query(Sensor).filter(Sensor.id.in_(sensor_ids)).delete(synchronize_session=False)
+    db.commit()
+
+
+def test_batch_in_new_room_creates_one_sensor_and_placement(ingest, db, room_id, cleanup_room):
+    ingest(f"campus/orion/{room_id}/sensors/batch", "temperature,21;temperature,22")
+
+    sensors = db.query(Sensor).filter(Sensor.location == room_id, Sensor.type == "temperature").all()
+    placed = db.query(PlacedSensor).filter(
+        PlacedSensor.room_id == room_id, PlacedSensor.sensor_type == "temperature"
+    ).all()
+    assert len(sensors) == 1
+    assert len(placed) == 1
+    values = sorted(p.value for p in db.query(SensorData).filter(SensorData.sensor_id == sensors[0].id))
+    assert values == [21.0, 22.0]
+
+
+def test_replayed_reading_does_not_lose_the_batch(db, room_id, cleanup_room):
+    import main
+
+    topic = f"campus/orion/{room_id}/sensors/batch"
+    first = datetime(2026, 1, 5, 8, 0, tzinfo=timezone.utc)
+    second = first + timedelta(minutes=1)
+    main.handle_mqtt_readings(topic, [("temperature", 21.0, room_id, first)])
+    # QoS 1 redelivery / replayed backlog: the first reading is already stored
+    main.handle_mqtt_readings(topic, [("temperature", 21.0, room_id, first), ("temperature", 22.0, room_id, second)])
+
+    sensor = db.query(Sensor).filter(Sensor.location == room_id, Sensor.type == "temperature").one()
+    rows = db.query(SensorData).filter(SensorData.sensor_id == sensor.id).order_by(SensorData.time).all()
+    assert [(row.time, row.value) for row in rows] == [(first, 21.0), (second, 22.0)]
+
+
+def test_retained_reading_is_stored_only_if_new(db, room_id, cleanup_room):
+    import main
+
+    topic = f"campus/orion/{room_id}/sensors/temperature"
+    # Published while the backend was down: never stored, so kept
+    main.handle_mqtt_readings(topic, [("temperature", 21.0, room_id, None)], retained=True)
+    # Replayed again on the next subscribe: same value as the latest reading
+    main.handle_mqtt_readings(topic, [("temperature", 21.0, room_id, None)], retained=True)
+    timed = datetime(2026, 1, 5, 8, 0, tzinfo=timezone.utc)
+    main.handle_mqtt_readings(topic, [("temperature", 23.0, room_id, timed)], retained=True)
+    main.handle_mqtt_readings(topic, [("temperature", 23.0, room_id, timed)], retained=True)
+
+    sensor = db.query(Sensor).filter(Sensor.location == room_id, Sensor.type == "temperature").one()
+    values = sorted(row.value for row in db.query(SensorData).filter(SensorData.sensor_id == sensor.id))
+    assert values == [21.0, 23.0]
@@ -0,0 +1,105 @@
+import queue
+import threading
+import time
+
+from services import ingest_workers as ingest_workers_module
+from services.ingest_workers import IngestWorkerPool
+from services.metrics import MQTT_MESSAGES, MetricsRegistry
+
+
+class FakeProcess:
+    def __init__(self, alive: bool):
+        self._alive = alive
+        self.exitcode = None if alive else -9
+
+    def is_alive(self) -> bool:
+        return self._alive
+
+
+def test_submit_drops_when_worker_queue_stays_full(monkeypatch):
+    monkeypatch.setattr(ingest_workers_module.settings, "ingest_worker_put_timeout_seconds", 0.01)
+    pool = IngestWorkerPool()
+    inbox = queue.Queue(1)
+    inbox.put("backlog")
+    pool._inboxes = [inbox]
+    dropped = MQTT_MESSAGES.value(status="dropped")
+
+    pool.submit("campus/orion/X101/sensors/temperature", [("temperature", 21.0, "X101", None)])
+
+    assert MQTT_MESSAGES.value(status="dropped") == dropped + 1
+
+
+def test_dead_worker_is_respawned_under_constant_traffic(monkeypatch):
+    pool = IngestWorkerPool()
+    pool._events = queue.Queue()
+    pool._handlers = {"noop": lambda: None}
+    pool._inboxes = [pool._context.Queue(1)]
+    pool._processes = [FakeProcess(alive=False)]
+    monkeypatch.setattr(pool, "_spawn", lambda index: FakeProcess(alive=True))
+    pool._running = True
+
+    def traffic():
+        while pool._running:
+            pool._events.put(("noop", ()))
+            time.sleep(0.001)
+
+    threads = [threading.Thread(target=traffic), threading.Thread(target=pool._relay_loop)]
+    for thread in threads:
+        thread.start()
+    time.sleep(ingest_workers_module.LIVENESS_CHECK_SECONDS * 2.5)
+    pool._running = False
+    for thread in threads:
+        thread.join(5)
+
+    assert pool.alive() == 1
+
+
+def test_worker_metrics_merge_into_api_registry():
+    worker, api = MetricsRegistry(), MetricsRegistry()
+    for registry in (worker, api):
+        registry.counter("test_total", "Test counter", ["status"])
+        registry.histogram("test_seconds", "Test histogram", buckets=(1, 5))
+    worker._metrics["test_total"].inc(3, status="parsed")
+    worker._metrics["test_seconds"].observe(2)
+
+    api.merge(worker.drain())
+    api.merge(worker.drain())
+
+    assert api._metrics["test_total"].value(status="parsed") == 3
+    assert 'test_seconds_bucket{le="5"} 1' in api.render()
+    assert worker._metrics["test_total"].value(status="parsed") == 0
+
+
+def test_worker_slow_traces_reach_the_api_process(monkeypatch):
+    from services.mqtt_client import handle_traced
+    from services.tracing import SlowTraceLog
+
+    worker_traces, api_traces = SlowTraceLog(), SlowTraceLog()
+    monkeypatch.setattr(ingest_workers_module, "slow_traces", worker_traces)
+    monkeypatch.setattr("services.tracing.slow_traces", worker_traces)
+    monkeypatch.setattr(ingest_workers_module.settings, "tracing_enabled", True)
+    monkeypatch.setattr(ingest_workers_module.settings, "tracing_sample_rate", 1.0)
+    monkeypatch.setattr(ingest_workers_module.settings, "tracing_slow_ms", 0)
+
+    # In the worker: the message is traced around its handling
+    handle_traced(lambda topic, readings, retained: None, "campus/orion/X101/sensors/temperature",
+                  [("temperature", 21.0, "X101", None)])
+    events = queue.Queue()
+    ingest_workers_module._relay_metrics(events)
+
+    # In the API process: relayed like metrics
+    pool = IngestWorkerPool()
+    pool._handlers = {"metrics": lambda drained: None, "traces": api_traces.merge}
+    while not events.empty():
+        pool._apply(*events.get())
+
+    traces = api_traces.list()
+    assert [trace["attributes"]["topic"] for trace in traces] == ["campus/orion/X101/sensors/temperature"]
+    assert worker_traces.list() == []
+
+
+def test_slow_traces_require_an_admin():
+    from fastapi.testclient import TestClient
+    import main
+
+    assert TestClient(main.app).get("/traces/slow").status_code == 401
@@ -0,0 +1,50 @@
+import uuid
+
+import pytest
+
+from models.blockchain import SecurityAlert
+
+
+@pytest.fixture
+def alert_type(db):
+    alert_type = f"test_{uuid.uuid4().hex[:8]}"
+    yield alert_type
+    db.query(SecurityAlert).filter(SecurityAlert.alert_type == alert_type).delete(synchronize_session=False)
+    db.commit()
+
+
+def test_new_sources_are_bounded_and_summarized(db, alert_type):
+    from config import settings
+    from services.security_service import SecurityAlertAggregator
+
+    aggregator = SecurityAlertAggregator()
+    for index in range(50):
+        aggregator.record(f"dev-{uuid.uuid4().hex}", alert_type, "warning", f"rejected {index}")
+
+    created = aggregator.flush(db)
+
+    rows = db.query(SecurityAlert).filter(SecurityAlert.alert_type == alert_type).all()
+    summary = [row for row in rows if row.source == SecurityAlertAggregator.OVERFLOW_SOURCE]
+    assert len(created) == len(rows) == settings.security_alert_burst + 1
+    assert len(summary) == 1
+    assert summary[0].occurrences == 50 - settings.security_alert_burst
+
+    # Next flush: still a single summary row, no new broadcast
+    for index in range(50):
+        aggregator.record(f"dev-{uuid.uuid4().hex}", alert_type, "warning", f"rejected {index}")
+    assert aggregator.flush(db) == []
+    db.expire_all()
+    assert db.query(SecurityAlert).filter(SecurityAlert.alert_type == alert_type).count() == len(rows)
+
+
+def test_rejection_is_keyed_by_topic_not_claimed_device(monkeypatch):
+    from services import security_service
+
+    recorded = []
+    monkeypatch.setattr(security_service.security_alerts, "record", lambda source, *args, **kwargs: recorded.append(source))
+    verifier = security_service.IngestVerifier()
+
+    _, status = verifier.verify(f"temperature:21|ts:1700000000000|dev:{uuid.uuid4().hex}|sig:00", "orion/X101/sensors/temperature")
+
+    assert status == "invalid_signature"
+    assert recorded == ["orion/X101/sensors/temperature"]
@@ -74,6 +74,10 @@ export function useWebSocket() {
         alertsStore.addAlert(message.data)
         break
 
+      case 'alerts_acknowledged':
+        alertsStore.markAcknowledged(message.data.ids, message.data.acknowledged_at)
+        break
+
       case 'alert_rules_changed':
         alertsStore.fetchRules()
         break
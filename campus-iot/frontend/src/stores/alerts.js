@@ -147,6 +147,14 @@ export const useAlertsStore = defineStore('alerts', () => {
     alerts.value.unshift(alert)
   }
 
+  // Bulk acknowledgement broadcast by the backend (one message for all ids)
+  function markAcknowledged(ids, acknowledgedAt) {
+    const acknowledged = new Set(ids)
+    alerts.value = alerts.value.map(a => acknowledged.has(a.id)
+      ? { ...a, is_acknowledged: true, acknowledged_at: acknowledgedAt }
+      : a)
+  }
+
   return {
     alerts,
     rules,
@@ -163,6 +171,7 @@ export const useAlertsStore = defineStore('alerts', () => {
     deleteRule,
     acknowledgeAlert,
     acknowledgeAll,
-    addAlert
+    addAlert,
+    markAcknowledged
   }
 })
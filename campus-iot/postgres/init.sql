@@ -58,6 +58,10 @@ CREATE TABLE IF NOT EXISTS alerts (
     acknowledged_at TIMESTAMPTZ
 );
 
+-- Storm grouping: triggers folded into an open alert
+ALTER TABLE alerts ADD COLUMN IF NOT EXISTS occurrences INTEGER DEFAULT 1;
+ALTER TABLE alerts ADD COLUMN IF NOT EXISTS last_seen TIMESTAMPTZ DEFAULT NOW();
+
 -- Actuators table
 CREATE TABLE IF NOT EXISTS actuators (
     id SERIAL PRIMARY KEY,
@@ -176,10 +180,33 @@ CREATE TABLE IF NOT EXISTS blockchain (
     previous_hash VARCHAR(64) NOT NULL,
     hash VARCHAR(64) UNIQUE NOT NULL,
     nonce INTEGER DEFAULT 0,
+    hash_version INTEGER DEFAULT 1,
     signature_valid BOOLEAN DEFAULT true,
     source_ip VARCHAR(45)
 );
 
+-- Blocks created before the binary header encoding keep the JSON hash scheme
+ALTER TABLE blockchain ADD COLUMN IF NOT EXISTS hash_version INTEGER DEFAULT 1;
+
+-- Readings anchored in Merkle batch blocks (blockchain.data_hash = Merkle root)
+CREATE TABLE IF NOT EXISTS blockchain_leaves (
+    id SERIAL PRIMARY KEY,
+    block_index INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    sensor_id INTEGER NOT NULL,
+    reading_time TIMESTAMPTZ NOT NULL,
+    leaf_hash VARCHAR(64) NOT NULL
+);
+
+-- Blockchain verification checkpoint (single row, last block verified)
+CREATE TABLE IF NOT EXISTS blockchain_checkpoints (
+    id INTEGER PRIMARY KEY,
+    block_index INTEGER NOT NULL,
+    block_hash VARCHAR(64) NOT NULL,
+    blocks_verified INTEGER DEFAULT 0,
+    verified_at TIMESTAMPTZ DEFAULT NOW()
+);
+
 -- Security alerts table
 CREATE TABLE IF NOT EXISTS security_alerts (
     id SERIAL PRIMARY KEY,
@@ -191,51 +218,77 @@ CREATE TABLE IF NOT EXISTS security_alerts (
     source_ip VARCHAR(45),
     resolved BOOLEAN DEFAULT false,
     resolved_at TIMESTAMPTZ,
-    resolved_by VARCHAR(100)
+    resolved_by VARCHAR(100),
+    source VARCHAR(100),
+    occurrences INTEGER DEFAULT 1,
+    first_seen TIMESTAMPTZ DEFAULT NOW(),
+    last_seen TIMESTAMPTZ DEFAULT NOW()
 );
 
--- Reports table (for QR code issue reporting)
-CREATE TABLE IF NOT EXISTS reports (
+-- Alerts created before aggregation
+ALTER TABLE security_alerts ADD COLUMN IF NOT EXISTS source VARCHAR(100);
+ALTER TABLE security_alerts ADD COLUMN IF NOT EXISTS occurrences INTEGER DEFAULT 1;
+ALTER TABLE security_alerts ADD COLUMN IF NOT EXISTS first_seen TIMESTAMPTZ;
+ALTER TABLE security_alerts ADD COLUMN IF NOT EXISTS last_seen TIMESTAMPTZ;
+UPDATE security_alerts SET first_seen = timestamp, last_seen = timestamp WHERE last_seen IS NULL;
+ALTER TABLE security_alerts ALTER COLUMN first_seen SET DEFAULT NOW();
+ALTER TABLE security_alerts ALTER COLUMN last_seen SET DEFAULT NOW();
+
+-- Issue reports (QR code issue reporting)
+CREATE TABLE IF NOT EXISTS issue_reports (
     id SERIAL PRIMARY KEY,
+    ticket_id VARCHAR(32) UNIQUE NOT NULL,
     room_id VARCHAR(50) NOT NULL,
-    report_type VARCHAR(50) NOT NULL,
-    severity VARCHAR(20) DEFAULT 'medium',
+    room_name VARCHAR(100),
+    issue_type VARCHAR(50) NOT NULL,
+    urgency VARCHAR(20) DEFAULT 'medium',
     description TEXT,
-    reported_by_user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
-    reported_by_email VARCHAR(255),
+    has_photo BOOLEAN DEFAULT false,
     status VARCHAR(20) DEFAULT 'open',
+    assigned_to VARCHAR(100),
     created_at TIMESTAMPTZ DEFAULT NOW(),
-    resolved_at TIMESTAMPTZ,
-    resolved_by_user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
-    resolved_by_email VARCHAR(255)
+    updated_at TIMESTAMPTZ
 );
 
 -- Create indexes for performance
 CREATE INDEX IF NOT EXISTS idx_sensor_data_time ON sensor_data (time DESC);
 CREATE INDEX IF NOT EXISTS idx_sensor_data_sensor ON sensor_data (sensor_id);
+-- One reading per sensor and instant: ingest skips replayed readings (ON CONFLICT DO NOTHING)
+DELETE FROM sensor_data a USING sensor_data b
+    WHERE a.sensor_id = b.sensor_id AND a.time = b.time AND a.id > b.id;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sensor_data_sensor_time ON sensor_data (sensor_id, time);
 CREATE INDEX IF NOT EXISTS idx_alerts_created ON alerts (created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_alerts_ack ON alerts (is_acknowledged);
 CREATE INDEX IF NOT EXISTS idx_alerts_rule ON alerts (rule_id);
+CREATE INDEX IF NOT EXISTS idx_alerts_active_created ON alerts (created_at DESC, id DESC) WHERE is_acknowledged = false;
+CREATE INDEX IF NOT EXISTS idx_alerts_rule_sensor_created ON alerts (rule_id, sensor_id, created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_alert_rules_sensor ON alert_rules (sensor_id);
 CREATE INDEX IF NOT EXISTS idx_alert_rules_room ON alert_rules (room_id);
 CREATE INDEX IF NOT EXISTS idx_alert_rules_type ON alert_rules (sensor_type);
 CREATE INDEX IF NOT EXISTS idx_blockchain_index ON blockchain (block_index);
 CREATE INDEX IF NOT EXISTS idx_blockchain_hash ON blockchain (hash);
+CREATE INDEX IF NOT EXISTS idx_blockchain_leaves_block ON blockchain_leaves (block_index);
+CREATE INDEX IF NOT EXISTS idx_blockchain_leaves_reading ON blockchain_leaves (sensor_id, reading_time);
 CREATE INDEX IF NOT EXISTS idx_security_alerts_timestamp ON security_alerts (timestamp DESC);
 CREATE INDEX IF NOT EXISTS idx_security_alerts_resolved ON security_alerts (resolved);
+CREATE INDEX IF NOT EXISTS idx_security_alerts_source_type ON security_alerts (source, alert_type, last_seen);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users (email);
-CREATE INDEX IF NOT EXISTS idx_activity_logs_user ON activity_logs (user_id);
-CREATE INDEX IF NOT EXISTS idx_activity_logs_created ON activity_logs (created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_activity_logs_created_id ON activity_logs (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_activity_logs_user_created ON activity_logs (user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_activity_logs_action_created ON activity_logs (action, created_at, id);
 CREATE INDEX IF NOT EXISTS idx_anomalies_sensor ON anomalies (sensor_id);
 CREATE INDEX IF NOT EXISTS idx_anomalies_type ON anomalies (anomaly_type);
 CREATE INDEX IF NOT EXISTS idx_anomalies_created ON anomalies (created_at DESC);
-CREATE INDEX IF NOT EXISTS idx_audit_logs_user ON audit_logs (user_id);
-CREATE INDEX IF NOT EXISTS idx_audit_logs_entity ON audit_logs (entity_type, entity_id);
-CREATE INDEX IF NOT EXISTS idx_audit_logs_created ON audit_logs (created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_created_id ON audit_logs (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_entity_created ON audit_logs (entity_type, entity_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_user_created ON audit_logs (user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_action_created ON audit_logs (action, created_at, id);
 CREATE INDEX IF NOT EXISTS idx_webhooks_active ON webhook_endpoints (is_active);
 CREATE INDEX IF NOT EXISTS idx_exports_active ON export_configs (is_active);
-CREATE INDEX IF NOT EXISTS idx_reports_room ON reports (room_id);
-CREATE INDEX IF NOT EXISTS idx_reports_status ON reports (status);
+CREATE INDEX IF NOT EXISTS idx_issue_reports_room ON issue_reports (room_id);
+CREATE INDEX IF NOT EXISTS idx_issue_reports_status ON issue_reports (status);
+CREATE INDEX IF NOT EXISTS idx_issue_reports_urgency ON issue_reports (urgency);
+CREATE INDEX IF NOT EXISTS idx_issue_reports_created ON issue_reports (created_at DESC);
 
 -- =============================================
 -- PLACED SENSORS (capteurs placés sur le plan)
@@ -280,6 +333,33 @@ CREATE TABLE IF NOT EXISTS sensor_energy_settings (
 
 CREATE INDEX IF NOT EXISTS idx_sensor_energy_settings_sensor ON sensor_energy_settings (placed_sensor_id);
 
+-- =============================================
+-- ROOM ENERGY STATES (chauffage par salle, partagé entre workers)
+-- =============================================
+CREATE TABLE IF NOT EXISTS room_energy_states (
+    id SERIAL PRIMARY KEY,
+    room_id VARCHAR(50) UNIQUE NOT NULL,
+    mode VARCHAR(20) DEFAULT 'manual',
+    setpoint DOUBLE PRECISION DEFAULT 21.0,
+    eco_setpoint DOUBLE PRECISION DEFAULT 19.0,
+    presence_timeout_minutes INTEGER DEFAULT 15,
+    current_mode VARCHAR(20) DEFAULT 'manual',
+    has_presence BOOLEAN DEFAULT true,
+    last_presence_time TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_room_energy_states_room ON room_energy_states (room_id);
+
+-- Dernière commande de chauffage globale (ligne unique id = 1)
+CREATE TABLE IF NOT EXISTS heating_state (
+    id INTEGER PRIMARY KEY,
+    mode VARCHAR(20) DEFAULT 'manual',
+    setpoint DOUBLE PRECISION DEFAULT 21.0,
+    room VARCHAR(50),
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
 -- =============================================
 -- SYSTEM SETTINGS (paramètres système globaux)
 -- =============================================